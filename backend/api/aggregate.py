@@ -0,0 +1,45 @@
+"""
+Cross-dataset aggregates built from stored partial statistics.
+
+Only the small per-dataset summary rows are read (counts, type
+distribution and the mergeable stats_state); the raw rows are never
+scanned, so the cost does not depend on dataset size.
+"""
+
+from collections import Counter
+
+from .stats import DatasetStats
+
+
+# Columns read for aggregation
+AGGREGATE_FIELDS = ['id', 'uploaded_at', 'total_count', 'type_distribution', 'stats_state']
+
+
+def aggregate_summaries(summaries):
+    """Combine DatasetSummary rows into one summary-shaped dict."""
+    total_count = 0
+    type_counts = Counter()
+    stats = DatasetStats()
+    dataset_ids = []
+
+    for summary in summaries:
+        dataset_ids.append(summary.id)
+        total_count += summary.total_count
+        type_counts.update(summary.get_type_distribution())
+        stats.merge(summary.get_stats_state())
+
+    # Averages come from the exact merged means, rounded like a summary
+    averages = {}
+    for col, column_stats in stats.overall.items():
+        averages[col] = round(column_stats.mean, 2) if column_stats.count else None
+
+    return {
+        'dataset_ids': dataset_ids,
+        'dataset_count': len(dataset_ids),
+        'total_count': total_count,
+        'avg_flowrate': averages['Flowrate'],
+        'avg_pressure': averages['Pressure'],
+        'avg_temperature': averages['Temperature'],
+        'type_distribution': dict(type_counts.most_common()),
+        'column_stats': stats.result(),
+    }
@@ -0,0 +1,196 @@
+"""
+Per-Type outlier detection over the stored rows of a dataset.
+
+Every Flowrate, Pressure and Temperature value is compared with the
+values of the same equipment Type through a robust z-score:
+
+    z = (value - median) / scale,   scale = IQR / 1.349
+
+For normal data IQR / 1.349 equals the standard deviation, but unlike the
+standard deviation it is not inflated by the outliers being looked for.
+The median and quartiles come from the per-Type quantile digests kept
+during ingestion (see stats.py), so finding them needs no sort and no
+extra pass; a median/MAD scale would need a second pass per Type. When
+a Type's IQR is 0 its sample standard deviation is used instead.
+
+The check itself is one vectorized pass over the memory-mapped columns,
+block by block, with each row's median and scale looked up by its Type
+code. Values with |z| > ANOMALY_DETECTION['Z_THRESHOLD'] are flagged;
+rows with no Type, missing values and Types with fewer than
+MIN_TYPE_ROWS values in a column never are.
+
+Results are kept next to the columns (see storage.py):
+- anomaly.rows  - int64 ids of the flagged rows, ascending
+- anomaly.flags - one uint8 per flagged row, bit i set if STATS_COLUMNS[i] is flagged
+- anomaly.json  - the threshold, and the median and scale per Type and column
+Datasets stored before detection existed are checked on first request.
+"""
+
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from .stats import STATS_COLUMNS
+from .storage import OFFSET_DTYPE, ColumnarReader
+
+
+ROWS_FILE = 'anomaly.rows'
+FLAGS_FILE = 'anomaly.flags'
+PARAMS_FILE = 'anomaly.json'
+
+ROW_DTYPE = OFFSET_DTYPE
+FLAGS_DTYPE = np.dtype('u1')
+
+# IQR of the standard normal distribution
+NORMAL_IQR = 1.349
+
+# Rows checked per step, so memory stays flat on large datasets
+BLOCK_SIZE = 1_000_000
+
+
+def _write_atomic(path, data):
+    """Write a file so that readers never see it half-written."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def type_params(stats, min_rows):
+    """{type: {column: {'median', 'scale'}}} for the Types and columns that are checked."""
+    params = {}
+    for type_name, columns in stats.by_type.items():
+        for col in STATS_COLUMNS:
+            column_stats = columns[col]
+            if column_stats.count < max(min_rows, 2):
+                continue
+            q1, median, q3 = (
+                column_stats.digest.quantile(q, column_stats.minimum, column_stats.maximum)
+                for q in (0.25, 0.5, 0.75)
+            )
+            scale = (q3 - q1) / NORMAL_IQR
+            if not scale > 0:
+                scale = math.sqrt(column_stats.m2 / (column_stats.count - 1))
+            if scale > 0:
+                params.setdefault(type_name, {})[col] = {'median': median, 'scale': scale}
+    return params
+
+
+def lookup_tables(params, type_values):
+    """
+    (medians, scales): arrays of shape (len(STATS_COLUMNS), len(type_values) + 1)
+    indexed by [column, Type code]. Unchecked entries are NaN, as is the
+    last one, which code -1 (no Type) selects.
+    """
+    shape = (len(STATS_COLUMNS), len(type_values) + 1)
+    medians = np.full(shape, np.nan)
+    scales = np.full(shape, np.nan)
+    for code, type_name in enumerate(type_values):
+        for i, col in enumerate(STATS_COLUMNS):
+            col_params = params.get(type_name, {}).get(col)
+            if col_params:
+                medians[i, code] = col_params['median']
+                scales[i, code] = col_params['scale']
+    return medians, scales
+
+
+def detect_anomalies(data_key, stats):
+    """
+    Flag the outliers of a stored dataset, given its DatasetStats, and
+    store them with it. Returns the size of the stored results in bytes.
+    """
+    reader = ColumnarReader(data_key)
+    config = settings.ANOMALY_DETECTION
+    threshold = config['Z_THRESHOLD']
+    params = type_params(stats, config['MIN_TYPE_ROWS'])
+    medians, scales = lookup_tables(params, reader.type_values)
+
+    codes = reader.type_codes()
+    columns = [reader.column(col) for col in STATS_COLUMNS]
+    rows = []
+    flags = []
+    if params:
+        for start in range(0, reader.row_count, BLOCK_SIZE):
+            block_codes = np.asarray(codes[start:start + BLOCK_SIZE])
+            block_flags = np.zeros(len(block_codes), dtype=FLAGS_DTYPE)
+            for i, values in enumerate(columns):
+                # NaN (missing value or unchecked Type) never compares greater
+                with np.errstate(invalid='ignore'):
+                    z = np.abs(values[start:start + BLOCK_SIZE] - medians[i][block_codes])
+                    z /= scales[i][block_codes]
+                    block_flags |= (z > threshold).astype(FLAGS_DTYPE) << i
+            flagged = np.flatnonzero(block_flags)
+            rows.append(flagged + start)
+            flags.append(block_flags[flagged])
+
+    rows = np.concatenate(rows).astype(ROW_DTYPE) if rows else np.zeros(0, dtype=ROW_DTYPE)
+    flags = np.concatenate(flags) if flags else np.zeros(0, dtype=FLAGS_DTYPE)
+    meta = json.dumps({'threshold': threshold, 'types': params}).encode()
+
+    # The parameters go last: their presence marks complete results
+    _write_atomic(reader.path / ROWS_FILE, rows.tobytes())
+    _write_atomic(reader.path / FLAGS_FILE, flags.tobytes())
+    _write_atomic(reader.path / PARAMS_FILE, meta)
+    return rows.nbytes + flags.nbytes + len(meta)
+
+
+class Anomalies:
+    """The stored outliers of a dataset."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        meta = json.loads((reader.path / PARAMS_FILE).read_text())
+        self.threshold = meta['threshold']
+        self.params = meta['types']
+        self.rows = np.fromfile(reader.path / ROWS_FILE, dtype=ROW_DTYPE)
+        self.flags = np.fromfile(reader.path / FLAGS_FILE, dtype=FLAGS_DTYPE)
+
+    def counts(self):
+        """Number of flagged values per column."""
+        return {
+            col: int(np.count_nonzero(self.flags & (1 << i)))
+            for i, col in enumerate(STATS_COLUMNS)
+        }
+
+    def page(self, offset, limit, columns=None, types=None):
+        """
+        Flagged rows [offset, offset + limit), in row order, keeping those
+        flagged in any of columns and of one of types (None keeps all).
+        Returns (rows, number of matching rows); each row is a dict of
+        its values plus 'anomalies': {column: z-score}.
+        """
+        keep = np.ones(len(self.rows), dtype=bool)
+        if columns is not None:
+            mask = sum(1 << STATS_COLUMNS.index(col) for col in columns)
+            keep &= (self.flags & mask) != 0
+        if types is not None:
+            codes = [code for code, value in enumerate(self.reader.type_values) if value in types]
+            keep &= np.isin(self.reader.type_codes()[self.rows], codes)
+        rows = self.rows[keep]
+        flags = self.flags[keep]
+
+        results = self.reader.take(rows[offset:offset + limit])
+        for result, row_flags in zip(results, flags[offset:offset + limit].tolist()):
+            params = self.params[result['Type']]
+            result['anomalies'] = {
+                col: (result[col] - params[col]['median']) / params[col]['scale']
+                for i, col in enumerate(STATS_COLUMNS)
+                if row_flags & (1 << i)
+            }
+        return results, len(rows)
+
+
+def open_anomalies(summary):
+    """Anomalies of a stored dataset, detected now if they never were."""
+    reader = summary.open_data()
+    if not (reader.path / PARAMS_FILE).exists():
+        detect_anomalies(summary.data_key, summary.get_stats_state())
+    return Anomalies(reader)
@@ -0,0 +1,219 @@
+"""
+Batch uploads: many CSV files, or ZIP / tar archives of them, at once.
+
+- Archive members are streamed from the uploaded archive and never
+  extracted to disk. Tar members can only be read in archive order, so
+  each one is buffered (in memory up to TAR_SPOOL_BYTES) while it waits
+  for a worker
+- Members may be compressed CSV files (.csv.gz etc., see ingest.py);
+  they are decompressed as they are parsed
+- Files are parsed concurrently on a thread pool of
+  settings.BATCH_UPLOAD_WORKERS threads, each into its own columnar
+  dataset, and hashed as they are read (see dedup.py)
+- A file identical to a retained dataset, or to an earlier file of the
+  batch, shares its stored rows instead of keeping its own (see dedup.py)
+- All resulting DatasetSummary rows are inserted with one bulk_create
+  in one transaction; retention then runs once for the whole batch
+- Results are reported per file: a file that fails does not stop the
+  others
+
+bulk_create() sends no post_save signals, so the summaries' response
+JSON is stored (see materialized.py) and the cached history invalidated
+(see httpcache.py) here.
+"""
+
+import io
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from .dedup import HashingReader, find_duplicate
+from .httpcache import bump_version
+from .ingest import (
+    CSV_SUFFIXES, InvalidRowsError, csv_suffix, ingest_error_message, open_csv, summarize_csv,
+)
+from .instrumentation import span
+from .materialized import render_summary
+from .models import DatasetSummary
+from .rows import schedule_index_build
+from .storage import delete_dataset
+
+
+# Tar members up to this size are buffered in memory, larger ones spill
+# to a temporary file
+TAR_SPOOL_BYTES = 64 * 1024 * 1024
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+class BatchTooLargeError(ValueError):
+    """Raised when a batch holds more than settings.MAX_BATCH_FILES CSV files."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        super().__init__(f'A batch may hold at most {limit} CSV files.')
+
+
+def is_csv(name):
+    base = name.rsplit('/', 1)[-1]
+    return csv_suffix(name) is not None and not base.startswith('.') and not name.startswith('__MACOSX/')
+
+
+def batch_members(uploaded_files):
+    """
+    Yield (name, open, error) for every CSV in the upload: open() returns
+    a binary file of it, or error says why it cannot be read.
+    """
+    for uploaded_file in uploaded_files:
+        name = uploaded_file.name
+        lower = name.lower()
+        if lower.endswith(ZIP_SUFFIXES):
+            try:
+                archive = zipfile.ZipFile(uploaded_file)
+                infos = archive.infolist()
+            except zipfile.BadZipFile:
+                yield name, None, 'Not a valid ZIP archive.'
+                continue
+            for info in infos:
+                if not info.is_dir() and is_csv(info.filename):
+                    # ZipFile reads members from several threads safely
+                    yield f'{name}/{info.filename}', partial(archive.open, info), None
+        elif lower.endswith(TAR_SUFFIXES):
+            try:
+                with tarfile.open(fileobj=uploaded_file, mode='r|*') as archive:
+                    for member in archive:
+                        if member.isfile() and is_csv(member.name):
+                            spooled = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_BYTES)
+                            source = archive.extractfile(member)
+                            while chunk := source.read(1024 * 1024):
+                                spooled.write(chunk)
+                            spooled.seek(0)
+                            yield f'{name}/{member.name}', (lambda spooled=spooled: spooled), None
+            except tarfile.TarError:
+                yield name, None, 'Not a valid tar archive.'
+        elif is_csv(name):
+            yield name, partial(uploaded_file.open, 'rb'), None
+        else:
+            yield name, None, 'File must be a CSV file or a ZIP / tar archive of CSV files.'
+
+
+def parse_member(name, open_member):
+    """Parse one CSV; returns (fields, None) or (None, exception)."""
+    try:
+        with open_member() as f:
+            reader = HashingReader(f)
+            compression = CSV_SUFFIXES[csv_suffix(name)]
+            fields = summarize_csv(open_csv(io.BufferedReader(reader), compression))
+            fields['content_hash'] = reader.hexdigest()
+        return fields, None
+    except Exception as e:
+        return None, e
+
+
+def save_batch(fields_list):
+    """
+    Insert the DatasetSummary rows of a batch in one transaction.
+    Their stored rows are removed if that fails.
+    """
+    try:
+        with transaction.atomic(), span('save'):
+            summaries = DatasetSummary.objects.bulk_create(
+                [DatasetSummary(**fields) for fields in fields_list]
+            )
+            # bulk_create() sends no post_save: store the response JSON and
+            # invalidate cached responses here
+            for summary in summaries:
+                summary.summary_json = render_summary(summary)
+            DatasetSummary.objects.bulk_update(summaries, ['summary_json'])
+            transaction.on_commit(bump_version)
+            for summary in summaries:
+                schedule_index_build(summary.data_key)
+    except BaseException:
+        for fields in fields_list:
+            delete_dataset(fields['data_key'])
+        raise
+    return summaries
+
+
+def ingest_batch(uploaded_files):
+    """
+    Parse every CSV of a batch concurrently and store the results.
+    Returns one dict per file, in upload order: {'file', 'summary'} or
+    {'file', 'error'} (plus 'invalid_rows' for bad numeric values).
+    """
+    limit = settings.MAX_BATCH_FILES
+    workers = settings.BATCH_UPLOAD_WORKERS
+    results = []
+    pending = []
+
+    # Bounds the number of files read ahead of the workers
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-upload') as pool:
+        try:
+            for name, open_member, error in batch_members(uploaded_files):
+                result = {'file': name}
+                results.append(result)
+                if error is not None:
+                    result['error'] = error
+                    continue
+                if len(pending) == limit:
+                    raise BatchTooLargeError(limit)
+                slots.acquire()
+                future = pool.submit(parse_member, name, open_member)
+                future.add_done_callback(lambda future: slots.release())
+                pending.append((result, future))
+        except BaseException:
+            # Remove whatever the workers have already stored
+            for _, future in pending:
+                fields, _ = future.result()
+                if fields is not None:
+                    delete_dataset(fields['data_key'])
+            raise
+
+    parsed = []
+    for result, future in pending:
+        fields, error = future.result()
+        if error is None:
+            parsed.append((result, fields))
+        else:
+            result['error'] = ingest_error_message(error)
+            if isinstance(error, InvalidRowsError):
+                result['invalid_rows'] = error.rows
+
+    parsed = deduplicate(parsed)
+    summaries = save_batch([fields for _, fields in parsed]) if parsed else []
+    for (result, _), summary in zip(parsed, summaries):
+        result['summary'] = summary
+    return results
+
+
+def deduplicate(parsed):
+    """
+    Share stored rows with retained datasets and earlier files of the
+    batch that have the same content hash, deleting the copies just
+    parsed. Results answered by a retained dataset get their summary
+    here; returns the (result, fields) pairs still to be saved.
+    """
+    new = []
+    first_by_hash = {}
+    for result, fields in parsed:
+        content_hash = fields['content_hash']
+        duplicate = find_duplicate(content_hash)
+        if duplicate is not None:
+            delete_dataset(fields['data_key'])
+            result['summary'] = duplicate
+        elif content_hash in first_by_hash:
+            delete_dataset(fields['data_key'])
+            new.append((result, dict(first_by_hash[content_hash])))
+        else:
+            first_by_hash[content_hash] = fields
+            new.append((result, fields))
+    return new
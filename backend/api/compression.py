@@ -0,0 +1,86 @@
+"""
+Response compression.
+
+CompressionMiddleware compresses responses of at least
+settings.COMPRESSION_MIN_BYTES with brotli (when the brotli package is
+installed and the client accepts it) or gzip. Streaming responses, such
+as PDF downloads, are sent as they are.
+
+Like Django's GZipMiddleware, a strong ETag is made weak on compressed
+responses (the bytes differ from the identity encoding); If-None-Match
+uses weak comparison, so revalidation still gets a 304.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+# Responses smaller than this are not worth compressing
+DEFAULT_MIN_BYTES = 1024
+
+
+def accepted_encodings(header):
+    """Content codings accepted by an Accept-Encoding header (q > 0)."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, quality=5)
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compresses large responses with brotli or gzip (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'COMPRESSION_MIN_BYTES', DEFAULT_MIN_BYTES)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        # The response depends on Accept-Encoding even when it is not compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_bytes:
+            return response
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            coding = 'br'
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+        else:
+            return response
+
+        compressed = compress(response.content, coding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,159 @@
+"""
+Content-hash deduplication of uploaded CSV files.
+
+Every upload is hashed with BLAKE2b while Django streams it in
+(HashingUploadHandler), so no extra pass over the file is needed. If a
+retained dataset has the same hash, the upload is not parsed again:
+a new DatasetSummary row is created that shares the stored rows
+(data_key) of the existing one.
+
+CSV files sent as the raw request body (see body_upload) and archive
+members (see batch.py) are hashed as they are read, with HashingReader.
+
+Stored rows are therefore reference-counted: they are only deleted when
+the last DatasetSummary using their data_key is deleted (see signals.py).
+Sharing and releasing rows both run in a database transaction that locks
+the rows referencing the data_key (select_for_update; on SQLite every
+write transaction holds the database write lock, see settings.py), so a
+server process never deletes rows that another one is starting to share.
+"""
+
+import hashlib
+import io
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+
+from .models import DatasetSummary
+from .storage import dataset_path, delete_dataset
+
+
+# Hex digest length of the content hash (BLAKE2b, 32-byte digest)
+HASH_LENGTH = 64
+
+# Fields copied from the original summary into a duplicate upload
+SHARED_FIELDS = [
+    'total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature',
+    'type_distribution', 'column_stats', 'stats_state',
+    'data_key', 'data_bytes', 'content_hash',
+]
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=HASH_LENGTH // 2)
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hashes every uploaded file as it streams in and passes the data on
+    unchanged to the next handler. The hex digests are stored in
+    request.upload_digests, keyed by form field name.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = new_hasher()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_digests'):
+            self.request.upload_digests = {}
+        self.request.upload_digests[self.field_name] = self.hasher.hexdigest()
+        return None  # the next handler builds the UploadedFile
+
+
+class HashingReader(io.RawIOBase):
+    """Passes a binary file through, hashing every byte that is read."""
+
+    def __init__(self, f):
+        self.f = f
+        self.hasher = new_hasher()
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        data = self.f.read(len(buffer))
+        buffer[:len(data)] = data
+        self.hasher.update(data)
+        self.position += len(data)
+        return len(data)
+
+    def hexdigest(self):
+        # Hash whatever the parser left unread (normally nothing)
+        while self.read(1024 * 1024):
+            pass
+        return self.hasher.hexdigest()
+
+
+def body_upload(request, file_name, field_name='file'):
+    """
+    Spool a file sent as the raw request body to a temporary file,
+    hashing it on the way like HashingUploadHandler. Returns it as an
+    UploadedFile; upload_digest() then finds its hash under field_name.
+    """
+    uploaded_file = TemporaryUploadedFile(file_name, 'application/octet-stream', 0, None)
+    # request.stream is None for an empty body
+    reader = HashingReader(request.stream or io.BytesIO())
+    while chunk := reader.read(1024 * 1024):
+        uploaded_file.write(chunk)
+    uploaded_file.size = uploaded_file.tell()
+    uploaded_file.seek(0)
+    if not hasattr(request, 'upload_digests'):
+        request.upload_digests = {}
+    request.upload_digests[field_name] = reader.hexdigest()
+    return uploaded_file
+
+
+def upload_digest(request, field_name, uploaded_file):
+    """Content hash of an uploaded file, hashing it now if no handler did."""
+    digest = getattr(request, 'upload_digests', {}).get(field_name)
+    if digest is None:
+        hasher = new_hasher()
+        for chunk in uploaded_file.chunks():
+            hasher.update(chunk)
+        uploaded_file.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def find_duplicate(content_hash):
+    """
+    Create a new DatasetSummary sharing the stored rows of the newest
+    retained dataset with this content hash. Returns None if there is none.
+    """
+    with transaction.atomic():
+        # Locking the original makes a concurrent delete of it wait until
+        # the new row is committed, so release_payload() then sees it
+        original = (DatasetSummary.objects
+                    .select_for_update()
+                    .filter(content_hash=content_hash)
+                    .only(*SHARED_FIELDS)
+                    .order_by('-uploaded_at', '-id')
+                    .first())
+        if original is None:
+            return None
+
+        # The original may have been pruned while we looked it up
+        if not dataset_path(original.data_key).exists():
+            return None
+        return DatasetSummary.objects.create(
+            **{field: getattr(original, field) for field in SHARED_FIELDS})
+
+
+def release_payload(data_key):
+    """Delete stored rows once no DatasetSummary references them any more."""
+    with transaction.atomic():
+        if DatasetSummary.objects.select_for_update().filter(data_key=data_key).exists():
+            return
+        # Still inside the transaction: no new reference can be created
+        # until the files are gone (find_duplicate checks they exist)
+        delete_dataset(data_key)
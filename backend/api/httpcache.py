@@ -0,0 +1,106 @@
+"""
+HTTP caching for the history and dataset summary responses.
+
+- Responses carry strong ETags derived from the ids and upload times of
+  the datasets they list, and requests with a matching If-None-Match
+  get a 304 Not Modified
+- Serialized response bodies are kept in a small in-process cache, so
+  repeated polling needs neither a database query nor serialization
+- The cache is invalidated through a version token on disk, which is
+  changed whenever a DatasetSummary is saved or deleted (see
+  signals.py). Every server process checks the token, so an upload
+  handled by one gunicorn worker is seen by all of them.
+
+QuerySet.bulk_create() and QuerySet.update() do not send signals; code
+that uses them must call bump_version() itself.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from .storage import storage_root
+
+
+# Most responses kept in the in-process cache
+MAX_ENTRIES = 256
+
+VERSION_FILE = '.summaries-version'
+
+_cache = OrderedDict()  # key -> (version, etag, body)
+_cache_lock = threading.Lock()
+
+
+def version_path():
+    return storage_root() / VERSION_FILE
+
+
+def current_version():
+    """Token that changes whenever any DatasetSummary changes."""
+    try:
+        return version_path().read_text()
+    except FileNotFoundError:
+        return bump_version()
+
+
+def bump_version():
+    """Invalidate every cached response, in every server process."""
+    version = uuid.uuid4().hex
+    path = version_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+
+def make_etag(summaries):
+    """Strong ETag for a list of datasets, from their ids and upload times."""
+    digest = hashlib.blake2b(digest_size=16)
+    for summary in summaries:
+        digest.update(f'{summary.id}:{summary.uploaded_at.timestamp():.6f};'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def cached_json_response(request, key, load):
+    """
+    Serve a JSON response from the cache, or build it with load().
+
+    load() returns (summaries, data): the datasets the response depends
+    on (for the ETag) and the data to serialize, or the JSON bytes
+    themselves (see materialized.py).
+    """
+    version = current_version()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(key)
+        else:
+            entry = None
+
+    if entry is None:
+        summaries, data = load()
+        body = data if isinstance(data, bytes) else JSONRenderer().render(data)
+        entry = (version, make_etag(summaries), body)
+        with _cache_lock:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+            while len(_cache) > MAX_ENTRIES:
+                _cache.popitem(last=False)
+
+    _, etag, body = entry
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Clients may keep the response, but must revalidate it every time
+    response['Cache-Control'] = 'no-cache'
+    return response
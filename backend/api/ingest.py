@@ -0,0 +1,530 @@
+"""
+Streaming CSV ingestion for uploaded equipment datasets.
+
+The upload is read in fixed-size chunks with Pandas so that memory use
+stays flat no matter how large the file is:
+- The header is checked before any of the body is parsed
+- Only the required columns are parsed, Type as a category
+- Running sums and counts are kept for the numeric columns
+- Type counts are merged chunk by chunk
+- Per-column statistics are updated chunk by chunk (see stats.py)
+- Raw rows are appended to columnar storage (see storage.py)
+- Once stored, values far from their Type's distribution are flagged
+  (see anomalies.py)
+- The full DataFrame is never held in memory
+
+Large files on disk can also be parsed in parallel: the file is split on
+line boundaries into byte ranges, each range is parsed by a worker
+process, and the partial results are merged (see summarize_file).
+
+Compressed uploads (.csv.gz, .csv.bz2 and, with the zstandard package,
+.csv.zst) are decompressed as a stream while they are parsed (see
+open_csv); the decompressed file is never written out.
+
+This module does not import the models at load time, so worker
+processes can import it without setting up Django.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, for .csv.zst uploads
+    zstandard = None
+
+from .anomalies import detect_anomalies
+from .instrumentation import span
+from .stats import DatasetStats
+from .storage import ColumnarReader, ColumnarWriter, delete_dataset, storage_root
+
+
+# Columns every uploaded CSV must contain
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+
+# Columns that are averaged in the summary
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+# Number of CSV rows parsed per chunk
+CHUNK_SIZE = 100_000
+
+# Declared dtypes of the equipment schema. Numeric columns are parsed by
+# the C parser and checked afterwards (see read_chunks), so that bad
+# values can be reported with their line numbers.
+SCHEMA_DTYPES = {'Type': 'category'}
+
+# Most invalid values listed in an InvalidRowsError
+MAX_REPORTED_ROWS = 20
+
+# Accepted upload file names, and the compression of each
+CSV_SUFFIXES = {
+    '.csv': None,
+    '.csv.gz': 'gzip',
+    '.csv.bz2': 'bz2',
+    '.csv.zst': 'zstd',
+}
+
+# Bytes read from a compressed stream at a time
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+class MissingColumnsError(ValueError):
+    """Raised when the CSV header lacks one or more required columns."""
+
+    def __init__(self, missing_columns):
+        self.missing_columns = missing_columns
+        super().__init__(f'Missing columns: {missing_columns}')
+
+
+class InvalidRowsError(ValueError):
+    """
+    Raised when numeric columns hold values that are not numbers.
+    rows lists {'line', 'column', 'value'} dicts; line 1 is the header.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        lines = sorted({row['line'] for row in rows})
+        super().__init__(f'Invalid numeric values on lines {lines}')
+
+    def __reduce__(self):
+        # Rebuilt from rows when sent back from a worker process
+        return type(self), (self.rows,)
+
+    def shifted(self, offset):
+        """The same error with every line number moved by offset."""
+        return InvalidRowsError([{**row, 'line': row['line'] + offset} for row in self.rows])
+
+
+class DecompressionError(ValueError):
+    """Raised when a compressed upload is corrupt or its format unsupported."""
+
+
+class SummaryAccumulator:
+    """
+    Running totals for the summary fields of a dataset.
+    Gives the same results as computing them on the whole DataFrame.
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.sums = {col: 0.0 for col in NUMERIC_COLUMNS}
+        self.counts = {col: 0 for col in NUMERIC_COLUMNS}
+        self.type_counts = Counter()
+
+    def update(self, chunk):
+        """Add one DataFrame chunk to the running totals."""
+        self.total_count += len(chunk)
+
+        for col in NUMERIC_COLUMNS:
+            values = chunk[col]
+            self.sums[col] += float(values.sum())
+            self.counts[col] += int(values.count())
+
+        # Count in first-appearance order, so equal counts keep file order
+        types = chunk['Type']
+        if isinstance(types.dtype, pd.CategoricalDtype):
+            codes = types.cat.codes.to_numpy()
+            codes = codes[codes >= 0]
+            counts = np.bincount(codes, minlength=len(types.cat.categories))
+            for code in pd.unique(codes):
+                self.type_counts[str(types.cat.categories[code])] += int(counts[code])
+        else:
+            for type_name, count in types.value_counts(sort=False).items():
+                self.type_counts[type_name] += int(count)
+
+    def merge(self, other):
+        """Add the totals of another accumulator (e.g. from a worker)."""
+        self.total_count += other.total_count
+        for col in NUMERIC_COLUMNS:
+            self.sums[col] += other.sums[col]
+            self.counts[col] += other.counts[col]
+        self.type_counts.update(other.type_counts)
+
+    def average(self, col):
+        """Mean of a numeric column (NaN values are skipped, like Pandas)."""
+        if self.counts[col] == 0:
+            return float('nan')
+        return round(self.sums[col] / self.counts[col], 2)
+
+    def type_distribution(self):
+        """Count per Type, most common first (like value_counts())."""
+        return dict(self.type_counts.most_common())
+
+
+def csv_suffix(name):
+    """The accepted suffix a file name ends with (see CSV_SUFFIXES), or None."""
+    name = name.lower()
+    # Longest first, so '.csv.gz' is not taken for '.gz'
+    for suffix in sorted(CSV_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+class DecompressingReader(io.RawIOBase):
+    """Binary stream of decompressed data; decoder errors become DecompressionError."""
+
+    def __init__(self, stream, compression):
+        self.stream = stream
+        self.compression = compression
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        # Decompressed bytes read so far
+        return self.position
+
+    def readinto(self, buffer):
+        try:
+            data = self.stream.read(len(buffer))
+        except (OSError, EOFError, zlib.error) as e:
+            raise DecompressionError(f'Could not decompress the {self.compression} upload: {e}') from None
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise DecompressionError(f'Could not decompress the zstd upload: {e}') from None
+            raise
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_csv(f, compression=None):
+    """
+    Binary stream of the CSV in f, decompressed on the fly if compression
+    is 'gzip', 'bz2' or 'zstd' (see CSV_SUFFIXES).
+    """
+    if compression is None:
+        return f
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=f, mode='rb')
+    elif compression == 'bz2':
+        stream = bz2.BZ2File(f, mode='rb')
+    elif compression == 'zstd' and zstandard is not None:
+        stream = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+    else:
+        raise DecompressionError(f'{compression} compressed uploads are not supported on this server.')
+    return io.BufferedReader(DecompressingReader(stream, compression), DECOMPRESS_BLOCK_SIZE)
+
+
+def check_columns(columns):
+    """Raise MissingColumnsError if any required column is absent."""
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise MissingColumnsError(missing_columns)
+
+
+def read_chunks(csv_file, chunk_size=CHUNK_SIZE, names=None, first_line=2):
+    """
+    Yield the CSV as DataFrame chunks in the equipment schema: only the
+    required columns, Type as category and float64 numeric columns.
+
+    The header is read and checked against REQUIRED_COLUMNS before any of
+    the body is parsed. names, if given, are the column names of a
+    headerless byte range instead. first_line is the line number of the
+    first row, used in InvalidRowsError (one line per row is assumed).
+    """
+    if names is None:
+        names = read_header(csv_file)
+        if not names:
+            raise pd.errors.EmptyDataError('No columns to parse from file')
+    check_columns(names)
+
+    reader = pd.read_csv(
+        csv_file,
+        chunksize=chunk_size,
+        header=None,
+        names=names,
+        usecols=REQUIRED_COLUMNS,
+        dtype=SCHEMA_DTYPES,
+    )
+    with reader:
+        for chunk in reader:
+            invalid_rows = []
+            for col in NUMERIC_COLUMNS:
+                values = chunk[col]
+                if not pd.api.types.is_numeric_dtype(values):
+                    # Some value is not a number: find and report it
+                    numbers = pd.to_numeric(values, errors='coerce')
+                    bad = values[numbers.isna() & values.notna()]
+                    invalid_rows.extend(
+                        {'line': first_line + int(index), 'column': col, 'value': str(value)}
+                        for index, value in bad.items()
+                    )
+                    values = numbers
+                # float64, not float32: stored rows and statistics keep
+                # the exact values that were uploaded
+                chunk[col] = values.astype('float64')
+            if invalid_rows:
+                invalid_rows.sort(key=lambda row: row['line'])
+                raise InvalidRowsError(invalid_rows[:MAX_REPORTED_ROWS])
+            yield chunk
+
+
+def summarize_csv(csv_file, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Parse an uploaded CSV chunk by chunk and store its rows.
+
+    progress, if given, is called with the number of bytes read so far
+    after every chunk.
+
+    Returns a dict of DatasetSummary field values.
+    """
+    accumulator = SummaryAccumulator()
+    stats = DatasetStats()
+    writer = ColumnarWriter()
+
+    try:
+        chunks = read_chunks(csv_file, chunk_size)
+        while True:
+            with span('parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            with span('stats'):
+                accumulator.update(chunk)
+                stats.update(chunk)
+            with span('store'):
+                writer.append(chunk)
+            if progress is not None:
+                progress(csv_file.tell())
+    except BaseException:
+        writer.abort()
+        raise
+
+    data_bytes = finish_dataset(writer, stats)
+    return summary_fields(accumulator, stats, writer.data_key, data_bytes)
+
+
+def finish_dataset(writer, stats):
+    """
+    Close a ColumnarWriter and flag the outliers of the stored rows (see
+    anomalies.py). Returns the size of the dataset on disk in bytes.
+    """
+    try:
+        with span('store'):
+            data_bytes = writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    try:
+        with span('anomalies'):
+            return data_bytes + detect_anomalies(writer.data_key, stats)
+    except BaseException:
+        delete_dataset(writer.data_key)
+        raise
+
+
+def summary_fields(accumulator, stats, data_key, data_bytes):
+    """DatasetSummary field values from the ingestion results."""
+    with span('encode'):
+        return {
+            'total_count': accumulator.total_count,
+            'avg_flowrate': accumulator.average('Flowrate'),
+            'avg_pressure': accumulator.average('Pressure'),
+            'avg_temperature': accumulator.average('Temperature'),
+            'type_distribution': json.dumps(accumulator.type_distribution()),
+            'column_stats': json.dumps(stats.result()),
+            'stats_state': json.dumps(stats.to_state()),
+            'data_key': data_key,
+            'data_bytes': data_bytes,
+        }
+
+
+class ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of an open binary file."""
+
+    def __init__(self, f, start, end):
+        self.f = f
+        self.f.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        data = self.f.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def read_header(f):
+    """Read the header line of a CSV file and return its columns."""
+    line = f.readline()
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig')
+    return next(csv.reader([line.lstrip('\ufeff')]), [])
+
+
+def split_byte_ranges(f, data_start, size, parts):
+    """
+    Split bytes [data_start, size) of a CSV into up to parts ranges that
+    all start at the beginning of a line.
+    """
+    bounds = [data_start]
+    for i in range(1, parts):
+        f.seek(data_start + (size - data_start) * i // parts)
+        f.readline()  # move to the start of the next line
+        bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+def ingest_byte_range(path, start, end, names, parts_root, chunk_size=CHUNK_SIZE):
+    """
+    Worker-process entry point: parse one byte range of a CSV file.
+
+    The rows are stored as a separate dataset under parts_root. Line
+    numbers in an InvalidRowsError are counted from the start of the range.
+    Returns (SummaryAccumulator, DatasetStats, part data_key).
+    """
+    accumulator = SummaryAccumulator()
+    stats = DatasetStats()
+    writer = ColumnarWriter(root=parts_root)
+
+    try:
+        with open(path, 'rb') as f:
+            stream = io.BufferedReader(ByteRange(f, start, end))
+            for chunk in read_chunks(stream, chunk_size, names=names, first_line=1):
+                accumulator.update(chunk)
+                stats.update(chunk)
+                writer.append(chunk)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    return accumulator, stats, writer.data_key
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Shared pool of parsing processes, created on first use."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: never fork a server process that is running threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.INGEST_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _process_pool
+
+
+def summarize_csv_parallel(path, workers, progress=None):
+    """
+    Parse a CSV file on disk in parallel byte ranges and store its rows.
+
+    Each range is parsed by a worker process into its own part dataset;
+    the partial totals and statistics are merged and the parts are
+    concatenated into one stored dataset.
+
+    Returns a dict of DatasetSummary field values.
+    """
+    with open(path, 'rb') as f:
+        names = read_header(f)
+        check_columns(names)
+        ranges = split_byte_ranges(f, f.tell(), os.fstat(f.fileno()).st_size, workers)
+
+    if len(ranges) < 2:
+        with open(path, 'rb') as f:
+            return summarize_csv(f, progress=progress)
+
+    parts_root = storage_root() / f'.parts-{uuid.uuid4().hex}'
+    pool = get_process_pool()
+    futures = [pool.submit(ingest_byte_range, path, start, end, names, str(parts_root))
+               for start, end in ranges]
+
+    accumulator = SummaryAccumulator()
+    stats = DatasetStats()
+    writer = ColumnarWriter()
+
+    try:
+        # Merge in file order, so rows and Type order match a serial parse
+        for future, (start, end) in zip(futures, ranges):
+            try:
+                with span('parse'):
+                    part_accumulator, part_stats, part_key = future.result()
+            except InvalidRowsError as e:
+                # Lines before this range: the header and the merged rows
+                raise e.shifted(accumulator.total_count + 1) from None
+            with span('stats'):
+                accumulator.merge(part_accumulator)
+                stats.merge(part_stats)
+            with span('store'):
+                writer.extend(ColumnarReader(part_key, root=parts_root))
+            if progress is not None:
+                progress(end)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        writer.abort()
+        raise
+    finally:
+        shutil.rmtree(parts_root, ignore_errors=True)
+
+    data_bytes = finish_dataset(writer, stats)
+    return summary_fields(accumulator, stats, writer.data_key, data_bytes)
+
+
+def summarize_file(path, progress=None, compression=None):
+    """
+    Parse a CSV file on disk, in parallel if it is large enough
+    (settings.INGEST_WORKERS and settings.PARALLEL_INGEST_MIN_BYTES).
+    Compressed files (see CSV_SUFFIXES) are parsed as one stream;
+    progress then counts compressed bytes.
+
+    Returns a dict of DatasetSummary field values.
+    """
+    workers = settings.INGEST_WORKERS
+    if compression is None and workers > 1 \
+            and os.path.getsize(path) >= settings.PARALLEL_INGEST_MIN_BYTES:
+        return summarize_csv_parallel(path, workers, progress=progress)
+    with open(path, 'rb') as f:
+        if compression is None:
+            return summarize_csv(f, progress=progress)
+        report = None if progress is None else (lambda _: progress(f.tell()))
+        return summarize_csv(open_csv(f, compression), progress=report)
+
+
+def ingest_error_message(exc):
+    """User-facing error message for a failed ingestion."""
+    if isinstance(exc, (MissingColumnsError, InvalidRowsError, DecompressionError)):
+        return str(exc)
+    if isinstance(exc, pd.errors.EmptyDataError):
+        return 'CSV file is empty.'
+    return f'Error processing CSV: {str(exc)}'
+
+
+def save_summary(fields):
+    """Create the DatasetSummary row, removing its stored rows if that fails."""
+    from .models import DatasetSummary
+
+    try:
+        with span('save'):
+            return DatasetSummary.objects.create(**fields)
+    except BaseException:
+        delete_dataset(fields['data_key'])
+        raise
@@ -0,0 +1,255 @@
+"""
+Opt-in request instrumentation.
+
+When settings.INSTRUMENTATION['ENABLED'] is set, InstrumentationMiddleware
+records for every request:
+- the duration of named phases, marked in the code with span()
+- the number and total time of database queries
+- the bytes processed (uploaded CSV, served PDF; see add_bytes())
+
+The results are sent back in a Server-Timing header, and added to
+process-wide metrics served in Prometheus text format at /api/metrics/.
+A fraction of requests (PROFILE_SAMPLE_RATE) is also run under cProfile;
+the stats are written to PROFILE_DIR and named in an X-Profile header.
+
+Spans outside a request (background upload jobs, retention pruning) are
+recorded under the view name "background". Metrics are per process, so
+each server worker process reports its own.
+
+When instrumentation is disabled span() and add_bytes() do nothing and
+the middleware removes itself.
+"""
+
+import cProfile
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+
+DEFAULT_CONFIG = {
+    'ENABLED': False,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_DIR': None,
+}
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# View name used for spans recorded outside a request
+BACKGROUND = 'background'
+
+_local = threading.local()
+
+
+def get_config():
+    """settings.INSTRUMENTATION on top of the defaults."""
+    return {**DEFAULT_CONFIG, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+def is_enabled():
+    return bool(getattr(settings, 'INSTRUMENTATION', {}).get('ENABLED'))
+
+
+class RequestProfile:
+    """Phase timings, query counts and bytes of one request."""
+
+    def __init__(self):
+        self.phases = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.bytes_processed = 0
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook that times every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+    def server_timing(self, total):
+        """Value of the Server-Timing header (durations in milliseconds)."""
+        entries = [f'total;dur={total * 1000:.1f}',
+                   f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items()]
+        return ', '.join(entries)
+
+
+class Metrics:
+    """Process-wide counters, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()                      # (view, method, status)
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = Counter()                  # view
+        self.duration_count = Counter()                # view
+        self.phase_sum = Counter()                     # (view, phase)
+        self.phase_count = Counter()                   # (view, phase)
+        self.db_queries = Counter()                    # view
+        self.db_seconds = Counter()                    # view
+        self.bytes_processed = Counter()               # view
+        self.profiles = 0
+
+    def observe_request(self, view, method, status, seconds, profile):
+        with self._lock:
+            self.requests[(view, method, str(status))] += 1
+            buckets = self.duration_buckets[view]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.duration_sum[view] += seconds
+            self.duration_count[view] += 1
+            for phase, phase_seconds in profile.phases.items():
+                self.phase_sum[(view, phase)] += phase_seconds
+                self.phase_count[(view, phase)] += 1
+            self.db_queries[view] += profile.db_queries
+            self.db_seconds[view] += profile.db_seconds
+            self.bytes_processed[view] += profile.bytes_processed
+
+    def observe_phase(self, view, phase, seconds):
+        with self._lock:
+            self.phase_sum[(view, phase)] += seconds
+            self.phase_count[(view, phase)] += 1
+
+    def observe_bytes(self, view, count):
+        with self._lock:
+            self.bytes_processed[view] += count
+
+    def observe_profile(self):
+        with self._lock:
+            self.profiles += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text
+                             else f'{name}{suffix} {value}')
+
+        with self._lock:
+            family('api_requests_total', 'counter', 'Requests handled.', [
+                ('', {'view': view, 'method': method, 'status': code}, count)
+                for (view, method, code), count in sorted(self.requests.items())
+            ])
+
+            samples = []
+            for view in sorted(self.duration_count):
+                for bound, count in zip(DURATION_BUCKETS, self.duration_buckets[view]):
+                    samples.append(('_bucket', {'view': view, 'le': bound}, count))
+                samples.append(('_bucket', {'view': view, 'le': '+Inf'}, self.duration_count[view]))
+                samples.append(('_sum', {'view': view}, self.duration_sum[view]))
+                samples.append(('_count', {'view': view}, self.duration_count[view]))
+            family('api_request_duration_seconds', 'histogram', 'Request duration.', samples)
+
+            samples = []
+            for (view, phase), total in sorted(self.phase_sum.items()):
+                samples.append(('_sum', {'view': view, 'phase': phase}, total))
+                samples.append(('_count', {'view': view, 'phase': phase},
+                                self.phase_count[(view, phase)]))
+            family('api_phase_duration_seconds', 'summary', 'Time spent in a phase.', samples)
+
+            family('api_db_queries_total', 'counter', 'Database queries run.', [
+                ('', {'view': view}, count) for view, count in sorted(self.db_queries.items())
+            ])
+            family('api_db_query_seconds_total', 'counter', 'Time spent in database queries.', [
+                ('', {'view': view}, total) for view, total in sorted(self.db_seconds.items())
+            ])
+            family('api_bytes_processed_total', 'counter', 'Bytes of CSV or PDF processed.', [
+                ('', {'view': view}, count) for view, count in sorted(self.bytes_processed.items())
+            ])
+            family('api_profiles_total', 'counter', 'Requests run under cProfile.', [
+                ('', {}, self.profiles),
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def span(name):
+    """Time a phase of the current request (or of background work)."""
+    if not is_enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        profile = getattr(_local, 'profile', None)
+        if profile is not None:
+            profile.add_phase(name, seconds)
+        else:
+            METRICS.observe_phase(BACKGROUND, name, seconds)
+
+
+def add_bytes(count):
+    """Count bytes processed by the current request (or background work)."""
+    if not is_enabled():
+        return
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile.bytes_processed += count
+    else:
+        METRICS.observe_bytes(BACKGROUND, count)
+
+
+class InstrumentationMiddleware:
+    """Times requests and adds Server-Timing headers (see module docstring)."""
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        profile = RequestProfile()
+        profiler = None
+        if random.random() < config['PROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+
+        _local.profile = profile
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile.execute_wrapper):
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match is not None and match.url_name else 'unmatched'
+        METRICS.observe_request(view, request.method, response.status_code, total, profile)
+        response['Server-Timing'] = profile.server_timing(total)
+
+        if profiler is not None and config['PROFILE_DIR']:
+            profile_dir = Path(config['PROFILE_DIR'])
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            file_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{view}-{uuid.uuid4().hex[:8]}.prof'
+            profiler.dump_stats(profile_dir / file_name)
+            METRICS.observe_profile()
+            response['X-Profile'] = file_name
+        return response
@@ -0,0 +1,149 @@
+"""
+Background processing of async CSV uploads.
+
+The upload view spools the file to settings.UPLOAD_TMP_DIR, creates an
+UploadJob row and returns immediately. A small in-process thread pool
+then does the Pandas work and records progress on the job row, which
+clients poll through GET /api/jobs/<id>/.
+
+Compressed uploads are spooled as they were sent, and decompressed
+while the worker parses them.
+
+A job's worker touches its updated_at as it reports progress. Jobs that
+are still pending or running after settings.UPLOAD_JOB_STALE_AFTER
+seconds without an update (e.g. lost when the server restarted) are
+marked failed and their spooled files deleted, whenever a job is polled
+(fail_stale_jobs). Resumable upload jobs get a new parser when their
+session is used again (see resumable.py), and fail once their session
+has received no chunk for settings.UPLOAD_SESSION_TIMEOUT seconds.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ingest import CSV_SUFFIXES, csv_suffix, ingest_error_message, save_summary, summarize_file
+from .instrumentation import add_bytes
+from .models import UploadJob
+from .retention import schedule_prune
+from .rows import schedule_index_build
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Shared worker pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.UPLOAD_JOB_WORKERS,
+                thread_name_prefix='upload-job',
+            )
+        return _executor
+
+
+def submit_upload(uploaded_file, content_hash=''):
+    """Spool an uploaded file to disk and queue it. Returns the UploadJob."""
+    job = UploadJob(file_name=uploaded_file.name, bytes_total=uploaded_file.size)
+    tmp_dir = Path(settings.UPLOAD_TMP_DIR)
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    # Keep the suffix, which says how the file is compressed
+    job.file_path = str(tmp_dir / f'{job.id}{csv_suffix(uploaded_file.name)}')
+
+    with open(job.file_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    job.save()
+
+    # Only start once the job row is visible to the worker's connection
+    transaction.on_commit(lambda: get_executor().submit(run_upload_job, job.id, content_hash))
+    return job
+
+
+def completed_job(uploaded_file, summary):
+    """A job that is already done, for an upload answered without parsing."""
+    return UploadJob.objects.create(
+        file_name=uploaded_file.name,
+        status=UploadJob.STATUS_DONE,
+        bytes_total=uploaded_file.size,
+        bytes_processed=uploaded_file.size,
+        summary=summary,
+    )
+
+
+def run_upload_job(job_id, content_hash=''):
+    """Worker entry point: ingest the spooled file of one job."""
+    job = None
+    try:
+        job = UploadJob.objects.get(pk=job_id)
+        job.status = UploadJob.STATUS_RUNNING
+        job.save(update_fields=['status', 'updated_at'])
+
+        def report_progress(bytes_read):
+            # Also a heartbeat: running jobs are not taken for stale ones
+            UploadJob.objects.filter(pk=job_id).update(
+                bytes_processed=bytes_read, updated_at=timezone.now())
+
+        compression = CSV_SUFFIXES[csv_suffix(job.file_path)]
+        fields = summarize_file(job.file_path, progress=report_progress, compression=compression)
+        fields['content_hash'] = content_hash
+
+        job.summary = save_summary(fields)
+        schedule_index_build(job.summary.data_key)
+        schedule_prune()
+        job.status = UploadJob.STATUS_DONE
+        job.bytes_processed = job.bytes_total
+        add_bytes(job.bytes_total)
+    except Exception as e:
+        # A job that could not even be loaded is left to fail_stale_jobs()
+        if job is not None:
+            job.status = UploadJob.STATUS_FAILED
+            job.error = ingest_error_message(e)
+    finally:
+        if job is not None and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+    if job is not None:
+        job.save(update_fields=['status', 'summary', 'bytes_processed', 'error', 'updated_at'])
+    close_old_connections()
+
+
+def fail_stale_jobs():
+    """
+    Mark upload jobs that stopped making progress as failed and delete
+    their spooled files: async jobs without an update for
+    settings.UPLOAD_JOB_STALE_AFTER seconds, and resumable upload jobs
+    whose session got no chunk for settings.UPLOAD_SESSION_TIMEOUT
+    seconds. Returns the number of jobs failed.
+    """
+    now = timezone.now()
+    unfinished = UploadJob.objects.filter(
+        status__in=[UploadJob.STATUS_PENDING, UploadJob.STATUS_RUNNING]).only('id', 'file_path', 'updated_at')
+    interrupted = unfinished.filter(
+        session__isnull=True, updated_at__lt=now - timedelta(seconds=settings.UPLOAD_JOB_STALE_AFTER))
+    abandoned = unfinished.filter(
+        session__updated_at__lt=now - timedelta(seconds=settings.UPLOAD_SESSION_TIMEOUT))
+
+    failed = 0
+    for jobs, error in [
+        (interrupted, 'Upload was interrupted (server restarted?). Please upload the file again.'),
+        (abandoned, 'Upload abandoned: no chunk arrived for too long.'),
+    ]:
+        for job in list(jobs):
+            # Skip jobs whose worker reported progress since they were listed
+            if not UploadJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(
+                    status=UploadJob.STATUS_FAILED, error=error, updated_at=timezone.now()):
+                continue
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+            failed += 1
+    return failed
@@ -0,0 +1,32 @@
+"""
+Delete datasets that break the retention policy (settings.RETENTION).
+
+    python manage.py prune_datasets [--dry-run] [--max-count N]
+        [--max-age-days N] [--max-total-bytes N]
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.retention import get_policy, prune
+
+
+class Command(BaseCommand):
+    help = 'Delete datasets that break the retention policy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the datasets that would be deleted.')
+        parser.add_argument('--max-count', type=int, help='Override RETENTION MAX_COUNT.')
+        parser.add_argument('--max-age-days', type=float, help='Override RETENTION MAX_AGE_DAYS.')
+        parser.add_argument('--max-total-bytes', type=int, help='Override RETENTION MAX_TOTAL_BYTES.')
+
+    def handle(self, *args, **options):
+        policy = get_policy(
+            MAX_COUNT=options['max_count'],
+            MAX_AGE_DAYS=options['max_age_days'],
+            MAX_TOTAL_BYTES=options['max_total_bytes'],
+        )
+        ids = prune(policy, dry_run=options['dry_run'])
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f'{verb} {len(ids)} dataset(s): {ids}')
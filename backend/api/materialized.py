@@ -0,0 +1,72 @@
+"""
+Summary JSON materialized at upload time.
+
+History and dataset responses list summaries exactly as
+DatasetSummarySerializer renders them. Rendering them on every request
+means parsing the type_distribution and column_stats JSON of each row
+and running DRF's serializer machinery. Instead:
+- Every DatasetSummary stores its rendered JSON in summary_json when it
+  is created (see signals.py, and batch.py for bulk inserts); a dataset
+  never changes after upload
+- Responses are built by joining those bytes (summaries_json), with no
+  JSON parsing or encoding per request
+- Rows without stored JSON (created before it existed, and not
+  backfilled) are rendered on the fly
+
+JSON is encoded with orjson when it is installed, otherwise with the
+standard json module.
+"""
+
+import json
+
+from rest_framework.fields import DateTimeField
+
+from .models import SUMMARY_FIELDS
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+# Fields stored as JSON text, sent as JSON objects
+JSON_TEXT_FIELDS = ('type_distribution', 'column_stats')
+
+_datetime_field = DateTimeField()
+
+
+def dumps(data):
+    """Compact JSON bytes, like DRF's JSONRenderer produces."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def summary_data(summary):
+    """
+    DatasetSummarySerializer's representation of a summary, from its
+    field values alone.
+    """
+    data = {}
+    for field in SUMMARY_FIELDS:
+        value = getattr(summary, field)
+        if field in JSON_TEXT_FIELDS:
+            value = json.loads(value)
+        elif field == 'uploaded_at':
+            value = _datetime_field.to_representation(value)
+        data[field] = value
+    return data
+
+
+def render_summary(summary):
+    return dumps(summary_data(summary))
+
+
+def summary_json(summary):
+    """The stored JSON of a summary, or a fresh rendering if it has none."""
+    return bytes(summary.summary_json) or render_summary(summary)
+
+
+def summaries_json(summaries):
+    """JSON array of several summaries, joined from their stored JSON."""
+    return b'[' + b','.join(summary_json(summary) for summary in summaries) + b']'
@@ -0,0 +1,65 @@
+"""
+Move DatasetSummary.original_data out of the database into columnar
+files on disk. Uses the frozen format-2 copy of api/storage.py in
+_frozen_storage.py, not the live module.
+"""
+
+import json
+
+import pandas as pd
+from django.db import migrations, models
+
+from ._frozen_storage import COLUMNS, delete_dataset, read_rows, write_dataframe
+
+
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+
+def original_data_to_columns(apps, schema_editor):
+    DatasetSummary = apps.get_model('api', 'DatasetSummary')
+    for summary in DatasetSummary.objects.all().iterator():
+        df = pd.DataFrame(json.loads(summary.original_data), columns=COLUMNS)
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col]).astype('float64')
+        summary.data_key, summary.data_bytes = write_dataframe(df)
+        summary.save(update_fields=['data_key', 'data_bytes'])
+
+
+def columns_to_original_data(apps, schema_editor):
+    DatasetSummary = apps.get_model('api', 'DatasetSummary')
+    for summary in DatasetSummary.objects.all().iterator():
+        rows = read_rows(summary.data_key)
+        summary.original_data = json.dumps(rows)
+        summary.save(update_fields=['original_data'])
+        delete_dataset(summary.data_key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='data_key',
+            field=models.CharField(db_index=True, default='', help_text='Directory of the stored rows', max_length=32),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='data_bytes',
+            field=models.BigIntegerField(default=0, help_text='Size of the stored rows on disk'),
+        ),
+        migrations.AlterField(
+            model_name='datasetsummary',
+            name='original_data',
+            field=models.TextField(default='[]', help_text='JSON: original CSV data'),
+        ),
+        migrations.RunPython(original_data_to_columns, columns_to_original_data),
+        migrations.RemoveField(
+            model_name='datasetsummary',
+            name='original_data',
+        ),
+    ]
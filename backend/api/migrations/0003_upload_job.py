@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:35
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_columnar_original_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_path', models.CharField(max_length=500)),
+                ('bytes_total', models.BigIntegerField(default=0)),
+                ('bytes_processed', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('summary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.datasetsummary')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:41
+
+import json
+
+from django.db import migrations, models
+
+from ._frozen_stats import DatasetStats
+from ._frozen_storage import read_meta, read_numeric
+
+
+# Rows read from storage at a time while backfilling
+BLOCK_SIZE = 100_000
+
+
+def compute_column_stats(apps, schema_editor):
+    DatasetSummary = apps.get_model('api', 'DatasetSummary')
+    for summary in DatasetSummary.objects.only('id', 'data_key').iterator():
+        row_count = read_meta(summary.data_key)['row_count']
+        stats = DatasetStats()
+        for start in range(0, row_count, BLOCK_SIZE):
+            stats.update(read_numeric(summary.data_key, start, start + BLOCK_SIZE))
+        summary.column_stats = json.dumps(stats.result())
+        summary.stats_state = json.dumps(stats.to_state())
+        summary.save(update_fields=['column_stats', 'stats_state'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_upload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='column_stats',
+            field=models.TextField(default='{}', help_text='JSON: min/max/mean/std/percentiles per column'),
+        ),
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='stats_state',
+            field=models.TextField(default='{}', help_text='JSON: mergeable statistics state'),
+        ),
+        migrations.RunPython(compute_column_stats, migrations.RunPython.noop),
+    ]
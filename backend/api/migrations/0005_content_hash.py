@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_column_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Hash of the uploaded CSV bytes', max_length=64),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:13
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('completed', models.BooleanField(default=False)),
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='session', to='api.uploadjob')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.uploadsession')),
+            ],
+            options={
+                'ordering': ['index'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'index'), name='unique_upload_chunk')],
+            },
+        ),
+    ]
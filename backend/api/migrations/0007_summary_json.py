@@ -0,0 +1,61 @@
+"""
+Store the rendered response JSON of every existing DatasetSummary.
+The rendering is a frozen copy of api/materialized.render_summary, as
+DatasetSummarySerializer rendered summaries at this migration.
+"""
+
+import json
+
+from django.db import migrations, models
+from rest_framework.fields import DateTimeField
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+SUMMARY_FIELDS = [
+    'id', 'uploaded_at', 'total_count', 'avg_flowrate', 'avg_pressure',
+    'avg_temperature', 'type_distribution', 'column_stats',
+]
+JSON_TEXT_FIELDS = ('type_distribution', 'column_stats')
+
+_datetime_field = DateTimeField()
+
+
+def render_summary(summary):
+    data = {}
+    for field in SUMMARY_FIELDS:
+        value = getattr(summary, field)
+        if field in JSON_TEXT_FIELDS:
+            value = json.loads(value)
+        elif field == 'uploaded_at':
+            value = _datetime_field.to_representation(value)
+        data[field] = value
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def render_summary_json(apps, schema_editor):
+    DatasetSummary = apps.get_model('api', 'DatasetSummary')
+    for summary in DatasetSummary.objects.all().iterator():
+        summary.summary_json = render_summary(summary)
+        summary.save(update_fields=['summary_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetsummary',
+            name='summary_json',
+            field=models.BinaryField(default=b'', help_text='Rendered summary JSON'),
+        ),
+        migrations.RunPython(render_summary_json, migrations.RunPython.noop),
+    ]
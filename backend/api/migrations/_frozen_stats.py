@@ -0,0 +1,167 @@
+"""
+Frozen copy of the statistics in api/stats.py, as migration 0004 first
+computed them. Migrations must not import live app code, so this module
+is left alone when api/stats.py changes. Only what the backfill needs is
+kept: updating chunk by chunk, the result and the mergeable state.
+
+The migration loader skips modules whose name starts with "_".
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+STATS_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+PERCENTILES = [5, 25, 50, 75, 95]
+DIGEST_COMPRESSION = 100
+
+
+class QuantileDigest:
+    """Merging t-digest with the k1 scale function."""
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+
+    def add(self, values):
+        if len(values):
+            self._compress(
+                np.concatenate([self.means, values]),
+                np.concatenate([self.weights, np.ones(len(values))]),
+            )
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+
+        merged_weights = np.bincount(bucket, weights=weights)
+        merged_sums = np.bincount(bucket, weights=means * weights)
+        used = merged_weights > 0
+        self.weights = merged_weights[used]
+        self.means = merged_sums[used] / self.weights
+
+    def quantile(self, q, minimum, maximum):
+        total = float(self.weights.sum())
+        if total == 0:
+            return None
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[minimum], self.means, [maximum]])
+        return float(np.interp(q * total, positions, values))
+
+    def to_state(self):
+        return {
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+
+class ColumnStats:
+    """Statistics of one numeric column (NaN values are skipped)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.digest = QuantileDigest()
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        count = self.count + len(values)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        # Chan et al. parallel variance update
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * len(values) / count
+        self.mean += delta * len(values) / count
+        self.count = count
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.digest.add(values)
+
+    def result(self):
+        if self.count == 0:
+            result = {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+            result.update({f'p{p}': None for p in PERCENTILES})
+            return result
+
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+        result = {
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.mean,
+            'std': std,
+        }
+        for p in PERCENTILES:
+            result[f'p{p}'] = self.digest.quantile(p / 100, self.minimum, self.maximum)
+        return result
+
+    def to_state(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.minimum if self.count else None,
+            'max': self.maximum if self.count else None,
+            'digest': self.digest.to_state(),
+        }
+
+
+def _column_stats():
+    return {col: ColumnStats() for col in STATS_COLUMNS}
+
+
+class DatasetStats:
+    """Per-column statistics for a whole dataset and per equipment Type."""
+
+    def __init__(self):
+        self.overall = _column_stats()
+        self.by_type = {}
+
+    def update(self, chunk):
+        codes, type_values = pd.factorize(chunk['Type'])
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(type_values)), side='left')
+        stops = np.searchsorted(sorted_codes, np.arange(len(type_values)), side='right')
+
+        for col in STATS_COLUMNS:
+            values = chunk[col].to_numpy(dtype=float, na_value=np.nan)
+            self.overall[col].update(values)
+
+            grouped = values[order]
+            for type_name, start, stop in zip(type_values, starts, stops):
+                type_stats = self.by_type.setdefault(str(type_name), _column_stats())
+                type_stats[col].update(grouped[start:stop])
+
+    def result(self):
+        return {
+            'overall': {col: stats.result() for col, stats in self.overall.items()},
+            'by_type': {
+                type_name: {col: stats.result() for col, stats in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
+
+    def to_state(self):
+        return {
+            'overall': {col: stats.to_state() for col, stats in self.overall.items()},
+            'by_type': {
+                type_name: {col: stats.to_state() for col, stats in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
@@ -0,0 +1,135 @@
+"""
+Frozen copy of the columnar storage format 2 (api/storage.py) for data
+migrations. Migrations must not import live app code, so this module is
+left alone when api/storage.py changes; a new format gets a new helper.
+
+The migration loader skips modules whose name starts with "_".
+"""
+
+import json
+import shutil
+import uuid
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+
+FORMAT_VERSION = 2
+
+NUMERIC_FILES = {
+    'Flowrate': 'flowrate.f8',
+    'Pressure': 'pressure.f8',
+    'Temperature': 'temperature.f8',
+}
+TYPE_FILE = 'type.i4'
+NAME_BLOCKS_FILE = 'name.blk'
+NAME_DATA_FILE = 'name.bin'
+META_FILE = 'meta.json'
+
+FLOAT_DTYPE = np.dtype('<f8')
+CODE_DTYPE = np.dtype('<i4')
+OFFSET_DTYPE = np.dtype('<i8')
+NAME_END_DTYPE = np.dtype('<u4')
+
+NAME_BLOCK_ROWS = 4096
+NAME_COMPRESSION_LEVEL = 1
+
+COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+
+
+def dataset_path(data_key):
+    return Path(settings.DATASET_STORAGE_DIR) / data_key
+
+
+def delete_dataset(data_key):
+    if data_key:
+        shutil.rmtree(dataset_path(data_key), ignore_errors=True)
+
+
+def write_dataframe(df):
+    """Store a whole DataFrame (numeric columns float64). Returns (data_key, size in bytes)."""
+    data_key = uuid.uuid4().hex
+    path = dataset_path(data_key)
+    tmp_path = path.parent / f'.tmp-{data_key}'
+    tmp_path.mkdir(parents=True)
+    try:
+        for col, name in NUMERIC_FILES.items():
+            (tmp_path / name).write_bytes(df[col].to_numpy(dtype=FLOAT_DTYPE, na_value=np.nan).tobytes())
+
+        types = df['Type']
+        types = types.where(types.isna(), types.astype(str))
+        type_values = [str(value) for value in pd.unique(types.dropna())]
+        codes = pd.Categorical(types, categories=type_values).codes
+        (tmp_path / TYPE_FILE).write_bytes(codes.astype(CODE_DTYPE).tobytes())
+
+        names = [name.encode('utf-8') for name in df['Equipment Name'].fillna('').astype(str)]
+        offsets = [0]
+        with open(tmp_path / NAME_DATA_FILE, 'wb') as f:
+            for start in range(0, len(names), NAME_BLOCK_ROWS):
+                block_names = names[start:start + NAME_BLOCK_ROWS]
+                ends = np.cumsum([len(name) for name in block_names], dtype=OFFSET_DTYPE)
+                if ends[-1] > np.iinfo(NAME_END_DTYPE).max:
+                    raise ValueError('Equipment Names are too long to store.')
+                block = zlib.compress(ends.astype(NAME_END_DTYPE).tobytes() + b''.join(block_names),
+                                      NAME_COMPRESSION_LEVEL)
+                f.write(block)
+                offsets.append(offsets[-1] + len(block))
+        (tmp_path / NAME_BLOCKS_FILE).write_bytes(np.array(offsets, dtype=OFFSET_DTYPE).tobytes())
+
+        meta = {'version': FORMAT_VERSION, 'row_count': len(df), 'type_values': type_values}
+        (tmp_path / META_FILE).write_text(json.dumps(meta))
+        tmp_path.rename(path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return data_key, sum(f.stat().st_size for f in path.iterdir())
+
+
+def read_meta(data_key):
+    return json.loads((dataset_path(data_key) / META_FILE).read_text())
+
+
+def read_numeric(data_key, start, stop):
+    """Rows [start, stop) without names: Type as category, numeric columns as float64."""
+    path = dataset_path(data_key)
+    meta = read_meta(data_key)
+    stop = min(stop, meta['row_count'])
+    columns = {}
+    codes = np.fromfile(path / TYPE_FILE, dtype=CODE_DTYPE, count=stop - start,
+                        offset=start * CODE_DTYPE.itemsize)
+    columns['Type'] = pd.Categorical.from_codes(codes, categories=meta['type_values'])
+    for col, name in NUMERIC_FILES.items():
+        columns[col] = np.fromfile(path / name, dtype=FLOAT_DTYPE, count=stop - start,
+                                   offset=start * FLOAT_DTYPE.itemsize)
+    return pd.DataFrame(columns)
+
+
+def read_rows(data_key):
+    """Every row as a dict keyed by CSV column (missing Type is None)."""
+    path = dataset_path(data_key)
+    meta = read_meta(data_key)
+    row_count, type_values = meta['row_count'], meta['type_values']
+    if row_count == 0:
+        return []
+
+    names = []
+    blob = (path / NAME_DATA_FILE).read_bytes()
+    offsets = np.fromfile(path / NAME_BLOCKS_FILE, dtype=OFFSET_DTYPE).tolist()
+    for index, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        data = zlib.decompress(blob[start:stop])
+        count = min(NAME_BLOCK_ROWS, row_count - index * NAME_BLOCK_ROWS)
+        header = count * NAME_END_DTYPE.itemsize
+        ends = (np.frombuffer(data, dtype=NAME_END_DTYPE, count=count) + header).tolist()
+        names.extend(data[a:b].decode('utf-8') for a, b in zip([header] + ends[:-1], ends))
+
+    columns = {
+        'Equipment Name': names,
+        'Type': [type_values[code] if code >= 0 else None
+                 for code in np.fromfile(path / TYPE_FILE, dtype=CODE_DTYPE).tolist()],
+    }
+    for col, name in NUMERIC_FILES.items():
+        columns[col] = np.fromfile(path / name, dtype=FLOAT_DTYPE).tolist()
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[col] for col in COLUMNS))]
@@ -4,18 +4,54 @@ Database models for storing uploaded dataset summaries.
 DatasetSummary model stores:
 - Computed statistics (averages, counts)
 - Type distribution as JSON
-- Original data as JSON (for report generation)
+- Per-column statistics, overall and per Type, as JSON
+- Key of the original rows in columnar storage (for report generation);
+  empty for summaries uploaded without rows (see preaggregated.py)
 - Upload timestamp
+- The summary's response JSON, rendered once at upload (see materialized.py)
+
+UploadJob model tracks CSV uploads processed in the background.
+
+UploadSession and UploadChunk models track resumable uploads, sent in
+fixed-size chunks (see resumable.py).
 """
 
 from django.db import models
 import json
+import uuid
+
+from .stats import DatasetStats
+from .storage import ColumnarReader
+
+
+# Columns returned by summary and history responses
+SUMMARY_FIELDS = [
+    'id',
+    'uploaded_at',
+    'total_count',
+    'avg_flowrate',
+    'avg_pressure',
+    'avg_temperature',
+    'type_distribution',
+    'column_stats',
+]
+
+
+class DatasetSummaryQuerySet(models.QuerySet):
+    def summaries(self):
+        """Select only SUMMARY_FIELDS, never storage or payload columns."""
+        return self.only(*SUMMARY_FIELDS)
+    
+    def materialized(self):
+        """Select only what is needed to send the stored summary JSON."""
+        return self.only('id', 'uploaded_at', 'summary_json')
 
 
 class DatasetSummary(models.Model):
     """
     Stores the summary of each uploaded CSV dataset.
-    Only the last 5 records are kept (older ones are deleted automatically).
+    Old records are deleted by the retention policy (settings.RETENTION,
+    see retention.py).
     """
     # Upload timestamp
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -30,8 +66,24 @@ class DatasetSummary(models.Model):
     # Example: {"Pump": 5, "Valve": 3, "Compressor": 2}
     type_distribution = models.TextField(help_text="JSON: count per equipment type")
     
-    # Store original data for PDF report generation
-    original_data = models.TextField(help_text="JSON: original CSV data")
+    # Per-column statistics (overall and per Type), see stats.py
+    # column_stats holds final values, stats_state the mergeable partials
+    column_stats = models.TextField(default='{}', help_text="JSON: min/max/mean/std/percentiles per column")
+    stats_state = models.TextField(default='{}', help_text="JSON: mergeable statistics state")
+    
+    # Original rows live in columnar files on disk (see storage.py)
+    data_key = models.CharField(max_length=32, db_index=True, help_text="Directory of the stored rows")
+    data_bytes = models.BigIntegerField(default=0, help_text="Size of the stored rows on disk")
+    
+    # BLAKE2b of the uploaded file; duplicates share data_key (see dedup.py)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True,
+                                    help_text="Hash of the uploaded CSV bytes")
+    
+    # DatasetSummarySerializer output as JSON bytes, stored when the row
+    # is created so responses need no serialization (see materialized.py)
+    summary_json = models.BinaryField(default=b'', editable=False, help_text="Rendered summary JSON")
+    
+    objects = DatasetSummaryQuerySet.as_manager()
     
     class Meta:
         ordering = ['-uploaded_at']  # Newest first
@@ -41,9 +93,130 @@ class DatasetSummary(models.Model):
         """Return type_distribution as Python dict."""
         return json.loads(self.type_distribution)
     
-    def get_original_data(self):
-        """Return original_data as Python list of dicts."""
-        return json.loads(self.original_data)
+    def get_column_stats(self):
+        """Return column_stats as Python dict."""
+        return json.loads(self.column_stats)
+    
+    def get_stats_state(self):
+        """Return the mergeable statistics as a DatasetStats."""
+        return DatasetStats.from_state(json.loads(self.stats_state))
+    
+    @property
+    def has_rows(self):
+        """False for pre-aggregated summaries uploaded without their rows."""
+        return bool(self.data_key)
+    
+    def open_data(self):
+        """Return a ColumnarReader over the stored original rows."""
+        return ColumnarReader(self.data_key)
+    
+    def get_original_data(self, start=0, stop=None):
+        """Return original rows [start, stop) as Python list of dicts."""
+        return self.open_data().read_rows(start, stop)
     
     def __str__(self):
         return f"Dataset #{self.id} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class UploadJob(models.Model):
+    """
+    An upload accepted in async mode and processed by a background worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    
+    # Uploaded file, spooled to disk until the worker has processed it
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500)
+    
+    # Progress in bytes of the uploaded file
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_processed = models.BigIntegerField(default=0)
+    
+    error = models.TextField(blank=True)
+    summary = models.ForeignKey(DatasetSummary, null=True, blank=True, on_delete=models.SET_NULL)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    @property
+    def progress(self):
+        """Fraction of the file processed, from 0.0 to 1.0."""
+        if self.status == self.STATUS_DONE:
+            return 1.0
+        if not self.bytes_total:
+            return 0.0
+        return min(self.bytes_processed / self.bytes_total, 1.0)
+    
+    def __str__(self):
+        return f"Upload job {self.id} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload: the file is sent as numbered chunks of chunk_size
+    bytes (the last one may be shorter), in any order and retried as
+    needed. Its job parses the chunks as they arrive.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Time the last chunk was stored; sessions idle for too long are abandoned
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    
+    # Set once the client has sent every chunk and called complete/
+    completed = models.BooleanField(default=False)
+    
+    # Parses the file; its file_path is where the chunks are written
+    job = models.OneToOneField(UploadJob, on_delete=models.CASCADE, related_name='session')
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    @property
+    def chunk_count(self):
+        return -(-self.file_size // self.chunk_size)
+    
+    def chunk_range(self, index):
+        """Byte range [start, stop) of chunk index in the file."""
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.file_size)
+    
+    def __str__(self):
+        return f"Upload session {self.id} ({self.file_name})"
+
+
+class UploadChunk(models.Model):
+    """A chunk of an UploadSession that was received and verified."""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    
+    # SHA-256 of the chunk, as sent by the client and checked on receipt
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk'),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.index} of {self.session_id}"
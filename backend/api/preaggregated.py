@@ -0,0 +1,280 @@
+"""
+Pre-aggregated uploads: datasets summarized by the client.
+
+A client that parsed a CSV itself (the desktop app's local mode) sends
+the summary instead of the file (see views.upload_summary):
+- summary: JSON with total_count, type_distribution and, per numeric
+  column, the count, mean, m2 (sum of squared deviations from the
+  mean), min and max of its non-missing values
+- payload (optional): the rows as an .npz file of 1-D arrays, laid out
+  like columnar storage (see storage.py):
+    Flowrate, Pressure, Temperature - float64
+    type_codes   - int32 codes into type_values (-1 = missing)
+    type_values  - the Type dictionary (unicode strings)
+    name_offsets - int64 offsets into name_data (row count + 1 entries)
+    name_data    - uint8, UTF-8 Equipment Names back to back
+
+With a payload, the arrays are streamed into columnar storage chunk by
+chunk (never loaded whole), the summary is recomputed from them, and
+the submission is rejected unless it matches. The dataset then works
+like an uploaded CSV.
+
+Without one, the summary is only checked for consistency and stored on
+its own: the dataset has no stored rows (data_key is empty) and its
+statistics have no percentiles.
+"""
+
+import json
+import math
+import zipfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .ingest import CHUNK_SIZE, NUMERIC_COLUMNS, SummaryAccumulator, finish_dataset, summary_fields
+from .stats import ColumnStats, DatasetStats
+from .storage import ColumnarWriter
+
+
+# Payload arrays that hold one value per row, and the dtype kind of each
+ROW_ARRAYS = {
+    'Flowrate': 'f',
+    'Pressure': 'f',
+    'Temperature': 'f',
+    'type_codes': 'i',
+}
+
+# Most distinct Type values accepted in a payload
+MAX_TYPE_VALUES = 100_000
+
+# Relative tolerance when comparing the summary with the payload
+# (sums depend on the order values are added in)
+MEAN_TOLERANCE = 1e-9
+M2_TOLERANCE = 1e-6
+
+
+class InvalidSubmissionError(ValueError):
+    """Raised when a pre-aggregated submission is malformed or inconsistent."""
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_number(value):
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value))
+
+
+def parse_summary(data):
+    """
+    Validate a submitted summary (a dict or JSON text).
+    Returns it normalized: floats for the column moments, Type counts as
+    a dict.
+    """
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            raise InvalidSubmissionError('summary is not valid JSON.') from None
+    if not isinstance(data, dict):
+        raise InvalidSubmissionError('summary must be a JSON object.')
+
+    total_count = data.get('total_count')
+    if not _is_count(total_count) or total_count == 0:
+        raise InvalidSubmissionError('total_count must be a positive integer.')
+
+    type_distribution = data.get('type_distribution')
+    if not isinstance(type_distribution, dict) or not all(
+            isinstance(name, str) and _is_count(count) and count > 0
+            for name, count in type_distribution.items()):
+        raise InvalidSubmissionError('type_distribution must map Type names to positive counts.')
+    # Rows with a missing Type are not counted
+    if sum(type_distribution.values()) > total_count:
+        raise InvalidSubmissionError('type_distribution counts more rows than total_count.')
+
+    columns = data.get('columns')
+    if not isinstance(columns, dict):
+        raise InvalidSubmissionError(f'columns must hold statistics for {NUMERIC_COLUMNS}.')
+    normalized = {}
+    for col in NUMERIC_COLUMNS:
+        moments = columns.get(col)
+        # Like a CSV upload, every numeric column needs at least one value
+        if not isinstance(moments, dict) or not _is_count(moments.get('count')) \
+                or not 1 <= moments['count'] <= total_count:
+            raise InvalidSubmissionError(f'{col}: count must be an integer from 1 to total_count.')
+        count = moments['count']
+        values = [moments.get(key) for key in ('mean', 'm2', 'min', 'max')]
+        if not all(_is_number(value) for value in values):
+            raise InvalidSubmissionError(f'{col}: mean, m2, min and max must be finite numbers.')
+        mean, m2, minimum, maximum = (float(value) for value in values)
+        slack = MEAN_TOLERANCE * max(abs(minimum), abs(maximum), 1.0)
+        if m2 < 0 or not minimum - slack <= mean <= maximum + slack:
+            raise InvalidSubmissionError(f'{col}: statistics are inconsistent.')
+        normalized[col] = {'count': count, 'mean': mean, 'm2': m2, 'min': minimum, 'max': maximum}
+
+    return {
+        'total_count': total_count,
+        'type_distribution': dict(type_distribution),
+        'columns': normalized,
+    }
+
+
+def client_summary_fields(summary):
+    """DatasetSummary field values for a summary submitted without rows."""
+    stats = DatasetStats()
+    for col, moments in summary['columns'].items():
+        column_stats = ColumnStats()
+        column_stats.count = moments['count']
+        column_stats.mean = moments['mean']
+        column_stats.m2 = moments['m2']
+        column_stats.minimum = moments['min']
+        column_stats.maximum = moments['max']
+        stats.overall[col] = column_stats
+
+    accumulator = SummaryAccumulator()
+    accumulator.total_count = summary['total_count']
+    for col, moments in summary['columns'].items():
+        accumulator.sums[col] = moments['mean'] * moments['count']
+        accumulator.counts[col] = moments['count']
+    accumulator.type_counts = Counter(summary['type_distribution'])
+    return summary_fields(accumulator, stats, data_key='', data_bytes=0)
+
+
+class ArrayStream:
+    """One array of an .npz payload, read sequentially."""
+
+    def __init__(self, archive, name, kind, length=None):
+        self.name = name
+        try:
+            self.stream = archive.open(f'{name}.npy')
+            version = np.lib.format.read_magic(self.stream)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.stream)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(self.stream)
+        except KeyError:
+            raise InvalidSubmissionError(f'payload lacks the {name} array.') from None
+        except (ValueError, zipfile.BadZipFile, OSError):
+            raise InvalidSubmissionError(f'payload array {name} is not a valid .npy array.') from None
+        if dtype.hasobject or dtype.kind != kind or len(shape) != 1:
+            raise InvalidSubmissionError(f'payload array {name} has the wrong type or shape.')
+        if length is not None and shape[0] != length:
+            raise InvalidSubmissionError(
+                f'payload array {name} has {shape[0]} entries, expected {length}.')
+        self.dtype = dtype
+        self.length = shape[0]
+
+    def read(self, count):
+        data = self.stream.read(count * self.dtype.itemsize)
+        if len(data) != count * self.dtype.itemsize:
+            raise InvalidSubmissionError(f'payload array {self.name} is truncated.')
+        return np.frombuffer(data, dtype=self.dtype)
+
+
+class PayloadReader:
+    """Reads the arrays of an .npz payload in row chunks."""
+
+    def __init__(self, payload_file, row_count):
+        self.row_count = row_count
+        try:
+            archive = zipfile.ZipFile(payload_file)
+        except (zipfile.BadZipFile, OSError):
+            raise InvalidSubmissionError('payload must be an .npz file.') from None
+
+        self.arrays = {name: ArrayStream(archive, name, kind, row_count)
+                       for name, kind in ROW_ARRAYS.items()}
+        self.name_offsets = ArrayStream(archive, 'name_offsets', 'i', row_count + 1)
+        self.name_data = ArrayStream(archive, 'name_data', 'u')
+        if self.name_data.dtype != np.uint8:
+            raise InvalidSubmissionError('payload array name_data must be uint8.')
+
+        type_values = ArrayStream(archive, 'type_values', 'U')
+        if type_values.length > MAX_TYPE_VALUES:
+            raise InvalidSubmissionError(f'payload has more than {MAX_TYPE_VALUES} Type values.')
+        self.type_values = [str(value) for value in type_values.read(type_values.length)]
+        if len(set(self.type_values)) != len(self.type_values):
+            raise InvalidSubmissionError('payload type_values must be unique.')
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Yield DataFrame chunks shaped like those of ingest.read_chunks."""
+        offset = int(self.name_offsets.read(1)[0])
+        if offset != 0:
+            raise InvalidSubmissionError('payload name_offsets must start at 0.')
+
+        for start in range(0, self.row_count, chunk_size):
+            count = min(chunk_size, self.row_count - start)
+
+            # Names: end offsets, then the bytes they span
+            ends = self.name_offsets.read(count).astype(np.int64)
+            if np.any(np.diff(ends, prepend=offset) < 0) or ends[-1] > self.name_data.length:
+                raise InvalidSubmissionError('payload name_offsets must increase within name_data.')
+            blob = self.name_data.read(int(ends[-1]) - offset).tobytes()
+            local_ends = ends - offset
+            local_starts = np.concatenate([[0], local_ends[:-1]])
+            names = [blob[a:b].decode('utf-8', errors='replace') for a, b in zip(local_starts, local_ends)]
+            offset = int(ends[-1])
+
+            codes = self.arrays['type_codes'].read(count).astype(np.int64)
+            if np.any((codes < -1) | (codes >= len(self.type_values))):
+                raise InvalidSubmissionError('payload type_codes must index type_values (or be -1).')
+
+            chunk = pd.DataFrame({
+                'Equipment Name': names,
+                'Type': pd.Categorical.from_codes(codes, categories=self.type_values),
+            })
+            for col in NUMERIC_COLUMNS:
+                chunk[col] = self.arrays[col].read(count).astype('float64')
+            yield chunk
+
+        if offset != self.name_data.length:
+            raise InvalidSubmissionError('payload name_data is longer than name_offsets says.')
+
+
+def _close(a, b, tolerance):
+    return math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance)
+
+
+def check_summary(summary, accumulator, stats):
+    """Raise InvalidSubmissionError unless the summary matches the recomputed one."""
+    mismatched = []
+    if summary['type_distribution'] != dict(accumulator.type_counts):
+        mismatched.append('type_distribution')
+    for col in NUMERIC_COLUMNS:
+        moments = summary['columns'][col]
+        actual = stats.overall[col]
+        if moments['count'] != actual.count:
+            mismatched.append(col)
+        elif not (
+                _close(moments['mean'], actual.mean, MEAN_TOLERANCE)
+                and _close(moments['m2'], actual.m2, M2_TOLERANCE)
+                and moments['min'] == actual.minimum
+                and moments['max'] == actual.maximum):
+            mismatched.append(col)
+    if mismatched:
+        raise InvalidSubmissionError(f'Summary does not match the payload rows: {mismatched}')
+
+
+def ingest_payload(payload_file, summary, chunk_size=CHUNK_SIZE):
+    """
+    Store the rows of a payload and check the summary against them.
+    Returns a dict of DatasetSummary field values, computed from the rows.
+    """
+    reader = PayloadReader(payload_file, summary['total_count'])
+    accumulator = SummaryAccumulator()
+    stats = DatasetStats()
+    writer = ColumnarWriter()
+
+    try:
+        for chunk in reader.chunks(chunk_size):
+            accumulator.update(chunk)
+            stats.update(chunk)
+            writer.append(chunk)
+        check_summary(summary, accumulator, stats)
+    except BaseException:
+        writer.abort()
+        raise
+
+    data_bytes = finish_dataset(writer, stats)
+    return summary_fields(accumulator, stats, writer.data_key, data_bytes)
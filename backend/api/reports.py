@@ -0,0 +1,207 @@
+"""
+PDF report generation with an on-disk cache.
+
+A dataset never changes after upload, so each report is rendered once
+with ReportLab and then served from settings.REPORT_CACHE_DIR:
+- Cache files are keyed by dataset id, upload time and REPORT_TEMPLATE_VERSION
+- Bumping REPORT_TEMPLATE_VERSION makes every cached report stale
+- Cached reports are evicted when their dataset is deleted (see signals.py)
+
+Full reports list every row. Rows are laid out in page-sized tables that
+read their slice of columnar storage on demand, and the PDF is written to
+a file on disk, so time grows linearly and memory stays flat.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet
+
+from .instrumentation import span
+
+
+# Bump whenever the report layout changes
+REPORT_TEMPLATE_VERSION = 2
+
+# Data rows per table; one table (plus header row) fills one page at 8pt
+ROWS_PER_TABLE = 34
+
+
+def report_key(summary, full=False):
+    """Cache key (also used as ETag) of a dataset's report."""
+    uploaded_us = int(summary.uploaded_at.timestamp() * 1_000_000)
+    mode = 'full' if full else 'brief'
+    return f'{summary.id}-{uploaded_us}-{mode}-v{REPORT_TEMPLATE_VERSION}'
+
+
+def report_path(summary, full=False):
+    return Path(settings.REPORT_CACHE_DIR) / f'report_{report_key(summary, full)}.pdf'
+
+
+def evict_reports(summary_id):
+    """Remove every cached report of a dataset, whatever its version."""
+    for path in Path(settings.REPORT_CACHE_DIR).glob(f'report_{summary_id}-*.pdf'):
+        path.unlink(missing_ok=True)
+
+
+def get_report(summary, full=False):
+    """Return the path of the dataset's cached report, rendering it if needed."""
+    path = report_path(summary, full)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Render to a temp file and move it into place, so concurrent
+        # requests never read a half-written report
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output, span('render'):
+                build_report(summary, output, full)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return path
+
+
+def build_report(summary, output, full=False):
+    """
+    Render the PDF report of a dataset into a binary file object.
+    The data table lists the first 20 rows, or every row if full is set.
+    """
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = []
+    
+    # Title
+    title = Paragraph(f"Chemical Equipment Report - Dataset #{summary.id}", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+    
+    # Upload timestamp
+    timestamp = Paragraph(f"Uploaded: {summary.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
+    elements.append(timestamp)
+    elements.append(Spacer(1, 20))
+    
+    # Summary statistics
+    summary_title = Paragraph("Summary Statistics", styles['Heading2'])
+    elements.append(summary_title)
+    
+    summary_data = [
+        ['Metric', 'Value'],
+        ['Total Equipment Count', str(summary.total_count)],
+        ['Average Flowrate', f"{summary.avg_flowrate:.2f}"],
+        ['Average Pressure', f"{summary.avg_pressure:.2f}"],
+        ['Average Temperature', f"{summary.avg_temperature:.2f}"],
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[200, 150])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 20))
+    
+    # Type distribution
+    type_title = Paragraph("Equipment Type Distribution", styles['Heading2'])
+    elements.append(type_title)
+    
+    type_dist = summary.get_type_distribution()
+    type_data = [['Type', 'Count']] + [[k, str(v)] for k, v in type_dist.items()]
+    
+    type_table = Table(type_data, colWidths=[200, 150])
+    type_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    elements.append(type_table)
+    elements.append(Spacer(1, 20))
+    
+    # Original data table (first 20 rows, or every row in full mode)
+    if summary.has_rows:
+        reader = summary.open_data()
+        if full:
+            # Start rows on a fresh page so every table lines up with a page
+            elements.append(PageBreak())
+            data_title = Paragraph(f"Equipment Data (All {reader.row_count} rows)", styles['Heading2'])
+            row_count = reader.row_count
+        else:
+            data_title = Paragraph("Equipment Data (First 20 rows)", styles['Heading2'])
+            row_count = min(reader.row_count, 20)
+        elements.append(data_title)
+        
+        # One page-sized table per block of rows, read from storage at layout time
+        for start in range(0, row_count, ROWS_PER_TABLE):
+            elements.append(RowRangeTable(reader, start, min(start + ROWS_PER_TABLE, row_count)))
+    else:
+        elements.append(Paragraph("Equipment Data", styles['Heading2']))
+        elements.append(Paragraph(
+            "The rows of this dataset were not uploaded (pre-aggregated summary).", styles['Normal']))
+    
+    # Build PDF
+    doc.build(elements)
+
+
+DATA_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.green),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+
+class RowRangeTable(Flowable):
+    """
+    Data table for rows [start, stop) of a dataset.
+    
+    The rows are only read and laid out when ReportLab places the table,
+    and dropped again once it is drawn, so memory use does not grow with
+    the number of rows in the report.
+    """
+    
+    def __init__(self, reader, start, stop):
+        super().__init__()
+        self.reader = reader
+        self.start = start
+        self.stop = stop
+        self.hAlign = 'CENTER'
+        self._table = None
+    
+    def _build_table(self):
+        rows = self.reader.read_rows(self.start, self.stop)
+        headers = list(rows[0].keys())
+        data_rows = [headers] + [[str(row.get(h, '')) for h in headers] for row in rows]
+        table = Table(data_rows, colWidths=[100, 60, 60, 60, 80], repeatRows=1)
+        table.setStyle(DATA_TABLE_STYLE)
+        return table
+    
+    def wrap(self, availWidth, availHeight):
+        if self._table is None:
+            self._table = self._build_table()
+        self.width, self.height = self._table.wrap(availWidth, availHeight)
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        # Continue on the next page, repeating the header row
+        if self._table is None:
+            self._table = self._build_table()
+        return self._table.split(availWidth, availHeight)
+    
+    def draw(self):
+        self._table.drawOn(self.canv, 0, 0)
+        self._table = None
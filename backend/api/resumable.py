@@ -0,0 +1,384 @@
+"""
+Resumable uploads: large CSV files sent in fixed-size chunks.
+
+Protocol (see views.py):
+1. POST /api/uploads/ with file_name and file_size creates a session;
+   the response gives its chunk_size and chunk_count
+2. PUT /api/uploads/<id>/chunks/<index>/ sends bytes
+   [index * chunk_size, (index + 1) * chunk_size) of the file as the raw
+   body, with their SHA-256 (hex) in the X-Chunk-SHA256 header. Chunks
+   may be sent in any order, and resent: a chunk received twice is
+   stored once
+3. GET /api/uploads/<id>/ lists the missing chunks, so a client that
+   lost its connection resends only those
+4. POST /api/uploads/<id>/complete/ checks that every chunk arrived and
+   returns the session's job, to poll at /api/jobs/<id>/
+
+Chunks are written in place into one file in settings.UPLOAD_TMP_DIR.
+The session's parser is queued on a pool of settings.UPLOAD_SESSION_WORKERS
+threads as soon as the session is created, and reads that file as its
+chunks arrive (see SessionReader): parsing keeps pace with the upload,
+and a file with bad columns fails before it has been sent whole.
+
+A parser shows it is alive by touching its job's updated_at. If it dies
+(e.g. the server restarts), the next request to the session starts a
+new one, which parses the file again from the start (ensure_parser).
+A parser that waits PARSER_IDLE_AFTER seconds for a chunk gives up its
+thread instead of holding it for a client that may never come back; the
+next chunk starts a new parser in the same way. A session that receives
+no chunk for settings.UPLOAD_SESSION_TIMEOUT seconds fails (see
+jobs.fail_stale_jobs).
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .dedup import HashingReader, find_duplicate
+from .ingest import (
+    CSV_SUFFIXES, csv_suffix, ingest_error_message, open_csv, save_summary, summarize_csv,
+)
+from .instrumentation import add_bytes
+from .models import UploadChunk, UploadJob, UploadSession
+from .retention import schedule_prune
+from .rows import schedule_index_build
+from .storage import delete_dataset
+
+
+# Seconds between checks for new chunks while the parser waits for them
+POLL_INTERVAL = 0.5
+
+# Seconds between parser heartbeats, and the silence after which a
+# parser is presumed dead and replaced
+HEARTBEAT_INTERVAL = 10
+PARSER_STALE_AFTER = 60
+
+# Seconds a parser waits for the next chunk before it frees its thread
+PARSER_IDLE_AFTER = 30
+
+# Jobs in these states no longer accept chunks
+FINISHED_STATES = (UploadJob.STATUS_DONE, UploadJob.STATUS_FAILED)
+
+
+class ChunkError(ValueError):
+    """Raised when a chunk is rejected (bad index, size or checksum)."""
+
+
+class SessionClosedError(Exception):
+    """Raised when a chunk arrives after the session's job has finished."""
+
+
+class ParserSuperseded(Exception):
+    """Raised in a parser whose job has been taken over by a new parser."""
+
+
+class ParserIdle(Exception):
+    """Raised in a parser that gave up its job while waiting for chunks."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Shared pool of session parsers, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.UPLOAD_SESSION_WORKERS,
+                thread_name_prefix='upload-session',
+            )
+        return _executor
+
+
+def create_session(file_name, file_size):
+    """Create an UploadSession, its job and its file, and start its parser."""
+    job = UploadJob(file_name=file_name, bytes_total=file_size)
+    tmp_dir = Path(settings.UPLOAD_TMP_DIR)
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    # Keep the suffix, which says how the file is compressed
+    job.file_path = str(tmp_dir / f'{job.id}{csv_suffix(file_name)}')
+
+    # Sparse file of the final size; chunks are written into place
+    with open(job.file_path, 'wb') as f:
+        f.truncate(file_size)
+    try:
+        with transaction.atomic():
+            job.save()
+            session = UploadSession.objects.create(
+                file_name=file_name,
+                file_size=file_size,
+                chunk_size=settings.UPLOAD_CHUNK_SIZE,
+                job=job,
+            )
+            # Only start once the rows are visible to the parser's connection
+            transaction.on_commit(lambda: start_parser(job.id, job.updated_at))
+    except BaseException:
+        os.remove(job.file_path)
+        raise
+    return session
+
+
+def missing_chunks(session):
+    """Indexes of the chunks not received yet, in order."""
+    received = set(session.chunks.values_list('index', flat=True))
+    return [index for index in range(session.chunk_count) if index not in received]
+
+
+def read_exactly(stream, size):
+    """Read up to size bytes from a request stream (None for an empty body)."""
+    parts = []
+    while stream is not None and size > 0:
+        data = stream.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def store_chunk(session, index, stream, sha256):
+    """
+    Verify chunk index, read from stream, against its SHA-256 and write
+    it into the session's file. Returns True if it was new, False if it
+    had been received before.
+    """
+    if not 0 <= index < session.chunk_count:
+        raise ChunkError(f'Chunk index must be from 0 to {session.chunk_count - 1}.')
+    if session.job.status in FINISHED_STATES:
+        raise SessionClosedError()
+
+    start, stop = session.chunk_range(index)
+    # One byte more than expected, to detect chunks that are too long
+    data = read_exactly(stream, stop - start + 1)
+    if len(data) != stop - start:
+        raise ChunkError(f'Chunk {index} must be {stop - start} bytes.')
+    digest = hashlib.sha256(data).hexdigest()
+    if digest != sha256.strip().lower():
+        raise ChunkError(f'Chunk {index} does not match its X-Chunk-SHA256 checksum.')
+
+    existing = session.chunks.filter(index=index).first()
+    if existing is not None:
+        if existing.sha256 != digest:
+            raise ChunkError(f'Chunk {index} was already received with different content.')
+        return False
+
+    try:
+        with open(session.job.file_path, 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+    except FileNotFoundError:
+        # The parser finished and removed the file
+        raise SessionClosedError() from None
+    try:
+        UploadChunk.objects.create(session=session, index=index, sha256=digest)
+    except IntegrityError:
+        # The same chunk, resent while the first copy was being stored
+        return False
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+    return True
+
+
+def complete_session(session):
+    """
+    Mark a session complete. Returns the indexes of missing chunks (and
+    leaves the session open) if some have not arrived.
+    """
+    missing = missing_chunks(session)
+    if not missing:
+        UploadSession.objects.filter(pk=session.pk).update(completed=True)
+        session.completed = True
+        ensure_parser(session.job)
+    return missing
+
+
+def claim(job_id, seen):
+    """Take over a job whose updated_at is still seen. Returns the new stamp or None."""
+    now = timezone.now()
+    if UploadJob.objects.filter(pk=job_id, updated_at=seen).update(updated_at=now):
+        return now
+    return None
+
+
+def start_parser(job_id, seen):
+    stamp = claim(job_id, seen)
+    if stamp is not None:
+        # A parser still queued when its claim goes stale is superseded
+        # by the next one and stops at its first heartbeat
+        get_executor().submit(run_session, job_id, stamp)
+
+
+def ensure_parser(job):
+    """Start a new parser for a session job whose parser has stopped."""
+    if job.status in FINISHED_STATES:
+        return
+    if job.updated_at < timezone.now() - timedelta(seconds=PARSER_STALE_AFTER):
+        start_parser(job.id, job.updated_at)
+
+
+class Heartbeat:
+    """A parser's claim on its job, renewed by touching the job's updated_at."""
+
+    def __init__(self, job_id, stamp):
+        self.job_id = job_id
+        self.stamp = stamp
+
+    def beat(self, force=False, **fields):
+        """Renew the claim (and update fields); raises ParserSuperseded if it was lost."""
+        now = timezone.now()
+        if not force and now - self.stamp < timedelta(seconds=HEARTBEAT_INTERVAL):
+            return
+        if not UploadJob.objects.filter(pk=self.job_id, updated_at=self.stamp).update(
+                updated_at=now, **fields):
+            raise ParserSuperseded()
+        self.stamp = now
+
+    def release(self):
+        """Give up the claim, so that ensure_parser() replaces this parser at once."""
+        released = self.stamp - timedelta(seconds=PARSER_STALE_AFTER)
+        if not UploadJob.objects.filter(pk=self.job_id, updated_at=self.stamp).update(
+                updated_at=released):
+            raise ParserSuperseded()
+        self.stamp = released
+
+    def reclaim(self):
+        """Take the claim back after release(); raises ParserSuperseded if it was lost."""
+        stamp = claim(self.job_id, self.stamp)
+        if stamp is None:
+            raise ParserSuperseded()
+        self.stamp = stamp
+
+
+class SessionReader(io.RawIOBase):
+    """
+    Reads a session's file from the start, waiting for each chunk to
+    arrive before reading it.
+    """
+
+    def __init__(self, session, heartbeat):
+        self.session = session
+        self.heartbeat = heartbeat
+        self.f = open(session.job.file_path, 'rb')
+        self.position = 0
+        # Chunks 0 .. next_index - 1 have all arrived
+        self.next_index = 0
+        self.available = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        while self.position >= self.available:
+            if self.available >= self.session.file_size:
+                return 0
+            self.wait()
+        self.f.seek(self.position)
+        data = self.f.read(min(len(buffer), self.available - self.position))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def refresh(self):
+        indexes = (UploadChunk.objects
+                   .filter(session_id=self.session.pk, index__gte=self.next_index)
+                   .order_by('index')
+                   .values_list('index', flat=True))
+        for index in indexes:
+            if index != self.next_index:
+                break
+            self.next_index += 1
+        self.available = min(self.next_index * self.session.chunk_size, self.session.file_size)
+
+    def wait(self):
+        """
+        Block until the next chunk has arrived. Raises ParserIdle if none
+        arrives within PARSER_IDLE_AFTER seconds.
+        """
+        before = self.next_index
+        idle_at = time.monotonic() + PARSER_IDLE_AFTER
+        while True:
+            self.refresh()
+            if self.next_index > before:
+                return
+            self.heartbeat.beat()
+            if time.monotonic() >= idle_at:
+                self.heartbeat.release()
+                # A chunk that arrived meanwhile saw this parser still alive
+                self.refresh()
+                if self.next_index == before:
+                    raise ParserIdle()
+                self.heartbeat.reclaim()
+                return
+            time.sleep(POLL_INTERVAL)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def discard_unsaved(job, fields):
+    """Delete rows that were stored for a job but never got their DatasetSummary."""
+    if fields is not None and job.summary_id is None:
+        delete_dataset(fields['data_key'])
+
+
+def run_session(job_id, stamp):
+    """Parser thread: ingest a session's file as its chunks arrive."""
+    heartbeat = Heartbeat(job_id, stamp)
+    session = UploadSession.objects.select_related('job').get(job_id=job_id)
+    job = session.job
+    fields = None
+
+    try:
+        heartbeat.beat(force=True, status=UploadJob.STATUS_RUNNING)
+        with SessionReader(session, heartbeat) as reader:
+            # Hash the bytes as sent, like any other upload (see dedup.py)
+            hashing = HashingReader(reader)
+            compression = CSV_SUFFIXES[csv_suffix(session.file_name)]
+            fields = summarize_csv(
+                open_csv(io.BufferedReader(hashing), compression),
+                progress=lambda _: heartbeat.beat(force=True, bytes_processed=reader.tell()),
+            )
+            fields['content_hash'] = hashing.hexdigest()
+
+        # Last check that no other parser took over before saving
+        heartbeat.beat(force=True)
+        duplicate = find_duplicate(fields['content_hash'])
+        if duplicate is not None:
+            # Same bytes as a retained dataset: share its stored rows
+            delete_dataset(fields['data_key'])
+            job.summary = duplicate
+        else:
+            job.summary = save_summary(fields)
+            schedule_index_build(job.summary.data_key)
+        schedule_prune()
+        job.status = UploadJob.STATUS_DONE
+        job.bytes_processed = job.bytes_total
+        add_bytes(job.bytes_total)
+    except (ParserSuperseded, ParserIdle):
+        # Another parser carries on, now or when the next chunk arrives
+        discard_unsaved(job, fields)
+        close_old_connections()
+        return
+    except Exception as e:
+        discard_unsaved(job, fields)
+        job.status = UploadJob.STATUS_FAILED
+        job.error = ingest_error_message(e)
+
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    job.save(update_fields=['status', 'summary', 'bytes_processed', 'error', 'updated_at'])
+    close_old_connections()
@@ -0,0 +1,136 @@
+"""
+History retention for uploaded datasets.
+
+Datasets are deleted (together with their stored rows and cached
+reports) when they break any limit of settings.RETENTION:
+- MAX_COUNT: keep only the newest N datasets
+- MAX_AGE_DAYS: delete datasets uploaded more than N days ago
+- MAX_TOTAL_BYTES: keep the newest datasets whose stored rows fit in N bytes
+A limit of None disables it.
+
+Pruning runs off the request path: uploads call schedule_prune(), which
+queues at most one pending prune on a background thread once their
+transaction commits. It can also be run from cron with
+`python manage.py prune_datasets`.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .instrumentation import span
+from .models import DatasetSummary
+
+
+# Datasets kept by default, and listed by the history endpoint when
+# MAX_COUNT is disabled
+DEFAULT_MAX_COUNT = 5
+
+DEFAULT_POLICY = {
+    'MAX_COUNT': DEFAULT_MAX_COUNT,
+    'MAX_AGE_DAYS': None,
+    'MAX_TOTAL_BYTES': None,
+    'BATCH_SIZE': 100,
+    'PRUNE_AFTER_UPLOAD': True,
+}
+
+
+def get_policy(**overrides):
+    """settings.RETENTION on top of the defaults, plus any overrides."""
+    policy = {**DEFAULT_POLICY, **getattr(settings, 'RETENTION', {})}
+    policy.update({k: v for k, v in overrides.items() if v is not None})
+    return policy
+
+
+def history_limit():
+    """Number of datasets returned by the history endpoint: all those MAX_COUNT retains."""
+    max_count = get_policy()['MAX_COUNT']
+    return DEFAULT_MAX_COUNT if max_count is None else max_count
+
+
+def expired_ids(policy):
+    """Ids of the datasets that break at least one retention limit."""
+    expired = set()
+    newest_first = DatasetSummary.objects.order_by('-uploaded_at', '-id')
+
+    if policy['MAX_COUNT'] is not None:
+        expired.update(newest_first.values_list('id', flat=True)[policy['MAX_COUNT']:])
+
+    if policy['MAX_AGE_DAYS'] is not None:
+        cutoff = timezone.now() - timedelta(days=policy['MAX_AGE_DAYS'])
+        expired.update(newest_first.filter(uploaded_at__lt=cutoff).values_list('id', flat=True))
+
+    if policy['MAX_TOTAL_BYTES'] is not None:
+        total_bytes = 0
+        counted_keys = set()
+        for summary_id, data_key, data_bytes in newest_first.values_list('id', 'data_key', 'data_bytes'):
+            # Duplicate uploads share their stored rows: count them once
+            if data_key not in counted_keys:
+                counted_keys.add(data_key)
+                total_bytes += data_bytes
+            if total_bytes > policy['MAX_TOTAL_BYTES']:
+                expired.add(summary_id)
+
+    return sorted(expired)
+
+
+def prune(policy=None, dry_run=False):
+    """
+    Delete every expired dataset in batches, inside one transaction.
+    Returns the ids that were (or, with dry_run, would be) deleted.
+    """
+    policy = policy or get_policy()
+    with transaction.atomic(), span('prune'):
+        ids = expired_ids(policy)
+        if not dry_run:
+            batch_size = policy['BATCH_SIZE']
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                # Only load the columns the delete handlers need
+                DatasetSummary.objects.filter(id__in=batch).only('id', 'data_key').delete()
+    return ids
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='retention')
+_pending = False
+_pending_lock = threading.Lock()
+
+
+def schedule_prune():
+    """
+    Prune in the background once the current transaction commits
+    (nothing is queued if it rolls back). Calls made while a prune is
+    already queued are merged into it.
+    """
+    if not get_policy()['PRUNE_AFTER_UPLOAD']:
+        return
+    transaction.on_commit(_queue_prune)
+
+
+def _queue_prune():
+    global _pending
+    with _pending_lock:
+        if _pending:
+            return
+        _pending = True
+    try:
+        _executor.submit(_run_scheduled_prune)
+    except BaseException:
+        with _pending_lock:
+            _pending = False
+        raise
+
+
+def _run_scheduled_prune():
+    global _pending
+    with _pending_lock:
+        # Uploads arriving from now on need another prune
+        _pending = False
+    try:
+        prune()
+    finally:
+        close_old_connections()
@@ -0,0 +1,278 @@
+"""
+Filtered, sorted and keyset-paginated access to the raw rows of a dataset.
+
+Queries are answered from the columnar files (see storage.py) plus
+sorted indexes that are kept next to them. They are built in the
+background after an upload (schedule_index_build), or on first use:
+- <column>.idx / <column>.srt - row ids ordered by the column's value
+  (ties by row id, missing values last) and the values in that order
+- type.idx / type.idx.off      - row ids grouped by Type code, with the
+  start offset of every code
+
+A page is found in one of two ways:
+- candidates: when one predicate matches few rows, its index gives the
+  matching row ids directly; the other predicates are checked on those
+- scan: otherwise the rows are walked in sort order from the cursor,
+  block by block, until a page of matches is found (with c matching
+  rows out of n, about limit * n / c rows are checked)
+Either way only the rows of the page are decoded.
+
+Cursors are opaque strings holding the sort value and row id of the
+last row of a page, so pages stay stable while paging.
+"""
+
+import base64
+import json
+import math
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.db import transaction
+
+from .storage import NUMERIC_FILES, OFFSET_DTYPE, FLOAT_DTYPE, CODE_DTYPE, ColumnarReader
+
+
+# Orders that rows can be sorted by ('-' prefix for descending)
+SORT_KEYS = ['row', 'Flowrate', 'Pressure', 'Temperature']
+
+# Page size when none is requested, and the largest one allowed
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Relative cost of sorting one candidate row versus scanning one row;
+# candidates are used when they are cheaper than the expected scan
+CANDIDATE_COST = 4
+
+# Rows checked per step of a scan (doubles every step)
+SCAN_BLOCK = 4096
+
+ROW_DTYPE = OFFSET_DTYPE
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(value, row):
+    # JSON has no NaN: missing values are stored as null
+    value = None if value is not None and math.isnan(value) else value
+    return base64.urlsafe_b64encode(json.dumps([value, row]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, row = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float('nan') if value is None else float(value)), int(row)
+    except (ValueError, TypeError):
+        raise InvalidCursorError('Invalid cursor.') from None
+
+
+def _write_atomic(path, array):
+    """Write an array file so that readers never see it half-written."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(array.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def column_index(reader, col):
+    """(row ids, values) of a numeric column in value order, built on first use."""
+    stem = NUMERIC_FILES[col].split('.')[0]
+    rows_path = reader.path / f'{stem}.idx'
+    values_path = reader.path / f'{stem}.srt'
+    if not values_path.exists():
+        values = np.asarray(reader.column(col))
+        order = np.argsort(values, kind='stable').astype(ROW_DTYPE)
+        _write_atomic(rows_path, order)
+        _write_atomic(values_path, values[order].astype(FLOAT_DTYPE))
+    return (reader._memmap(rows_path.name, ROW_DTYPE, reader.row_count),
+            reader._memmap(values_path.name, FLOAT_DTYPE, reader.row_count))
+
+
+def type_index(reader):
+    """(row ids grouped by Type code, offsets), built on first use.
+    Rows of code c are rows[offsets[c + 1]:offsets[c + 2]] (c = -1 is missing)."""
+    rows_path = reader.path / 'type.idx'
+    offsets_path = reader.path / 'type.idx.off'
+    if not offsets_path.exists():
+        codes = np.asarray(reader.type_codes())
+        _write_atomic(rows_path, np.argsort(codes, kind='stable').astype(ROW_DTYPE))
+        counts = np.bincount(codes + 1, minlength=len(reader.type_values) + 1)
+        _write_atomic(offsets_path, np.concatenate([[0], np.cumsum(counts)]).astype(OFFSET_DTYPE))
+    offsets = np.fromfile(offsets_path, dtype=OFFSET_DTYPE)
+    return reader._memmap(rows_path.name, ROW_DTYPE, reader.row_count), offsets
+
+
+def build_indexes(data_key):
+    """Build every index of a stored dataset (those missing)."""
+    try:
+        reader = ColumnarReader(data_key)
+    except FileNotFoundError:
+        return  # deleted in the meantime
+    type_index(reader)
+    for col in NUMERIC_FILES:
+        column_index(reader, col)
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='row-index')
+
+
+def schedule_index_build(data_key):
+    """Build the indexes of a new dataset in the background after commit."""
+    transaction.on_commit(lambda: _executor.submit(build_indexes, data_key))
+
+
+class RowQuery:
+    """
+    One page of rows of a stored dataset.
+
+    types:  Type values to keep (None keeps all)
+    ranges: {column: (low, high)}, inclusive; None for an open end
+    sort:   one of SORT_KEYS; descending reverses the order
+    """
+
+    def __init__(self, reader, types=None, ranges=None, sort='row',
+                 descending=False, limit=DEFAULT_LIMIT, cursor=None):
+        self.reader = reader
+        self.type_codes = None
+        if types is not None:
+            codes = {value: code for code, value in enumerate(reader.type_values)}
+            self.type_codes = np.array([codes[t] for t in types if t in codes], dtype=CODE_DTYPE)
+        self.ranges = ranges or {}
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.cursor = decode_cursor(cursor) if cursor else None
+
+    def matches(self, rows):
+        """Boolean mask of the given row ids that pass every predicate."""
+        mask = np.ones(len(rows), dtype=bool)
+        if self.type_codes is not None:
+            mask &= np.isin(np.asarray(self.reader.type_codes())[rows], self.type_codes)
+        for col, (low, high) in self.ranges.items():
+            values = self.reader.column(col)[rows]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return mask
+
+    def sort_values(self, rows):
+        if self.sort == 'row':
+            return rows.astype(float)
+        return np.asarray(self.reader.column(self.sort)[rows])
+
+    def candidates(self):
+        """Row ids matching the most selective predicate, if few enough."""
+        best = None
+        if self.type_codes is not None:
+            rows, offsets = type_index(self.reader)
+            slices = [(offsets[code + 1], offsets[code + 2]) for code in self.type_codes]
+            # Bind rows/slices now: the range loop below reuses `rows`
+            best = (sum(stop - start for start, stop in slices),
+                    lambda rows=rows, slices=slices: np.concatenate(
+                        [rows[start:stop] for start, stop in slices]
+                        or [np.zeros(0, dtype=ROW_DTYPE)]))
+        for col, (low, high) in self.ranges.items():
+            rows, values = column_index(self.reader, col)
+            start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+            # Missing values sort last and never match a range
+            stop = int(np.searchsorted(values, np.inf if high is None else high, side='right'))
+            if best is None or stop - start < best[0]:
+                best = (stop - start, lambda rows=rows, start=start, stop=stop: rows[start:stop])
+        if best is None:
+            return None
+        count, get_rows = best
+        expected_scan = (self.limit + 1) * self.reader.row_count / max(count, 1)
+        if count * CANDIDATE_COST <= expected_scan:
+            return np.asarray(get_rows())
+        return None
+
+    def after_cursor(self, values, rows):
+        """Mask of (value, row) pairs that come after the cursor in sort order."""
+        value, row = self.cursor
+        if self.sort == 'row':
+            return rows < row if self.descending else rows > row
+        # Missing values sort after every number
+        values = np.where(np.isnan(values), np.inf, values)
+        value = np.inf if math.isnan(value) else value
+        if self.descending:
+            return (values < value) | ((values == value) & (rows < row))
+        return (values > value) | ((values == value) & (rows > row))
+
+    def page_from_candidates(self, rows):
+        rows = rows[self.matches(rows)]
+        values = self.sort_values(rows)
+        order = np.lexsort((rows, np.where(np.isnan(values), np.inf, values)))
+        if self.descending:
+            order = order[::-1]
+        rows, values = rows[order], values[order]
+        if self.cursor is not None:
+            keep = self.after_cursor(values, rows)
+            rows, values = rows[keep], values[keep]
+        return rows[:self.limit + 1]
+
+    def scan_position(self, sorted_values, sorted_rows):
+        """Position in ascending sort order of the first row after the cursor."""
+        value, row = self.cursor
+        if self.sort == 'row':
+            return row + (0 if self.descending else 1)
+        # Rows with equal values are ordered by row id within the index
+        low = int(np.searchsorted(sorted_values, value, side='left'))
+        high = int(np.searchsorted(sorted_values, value, side='right'))
+        tied = np.asarray(sorted_rows[low:high])
+        return low + int(np.searchsorted(tied, row, side='left' if self.descending else 'right'))
+
+    def page_from_scan(self):
+        n = self.reader.row_count
+        sorted_rows = sorted_values = None
+        if self.sort != 'row':
+            sorted_rows, sorted_values = column_index(self.reader, self.sort)
+
+        if self.cursor is not None:
+            position = self.scan_position(sorted_values, sorted_rows)
+        else:
+            position = n if self.descending else 0
+
+        found = []
+        wanted = self.limit + 1
+        block = SCAN_BLOCK
+        while wanted > 0 and (position > 0 if self.descending else position < n):
+            if self.descending:
+                start, stop = max(0, position - block), position
+                position = start
+            else:
+                start, stop = position, min(n, position + block)
+                position = stop
+            if sorted_rows is None:
+                rows = np.arange(start, stop, dtype=ROW_DTYPE)
+            else:
+                rows = np.asarray(sorted_rows[start:stop])
+            if self.descending:
+                rows = rows[::-1]
+            rows = rows[self.matches(rows)][:wanted]
+            found.append(rows)
+            wanted -= len(rows)
+            block *= 2
+        return np.concatenate(found) if found else np.zeros(0, dtype=ROW_DTYPE)
+
+    def run(self):
+        """Returns (rows as dicts with their 'row' id, next cursor or None)."""
+        candidates = self.candidates()
+        if candidates is not None:
+            rows = self.page_from_candidates(candidates)
+        else:
+            rows = self.page_from_scan()
+
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = int(rows[-1])
+            next_cursor = encode_cursor(float(self.sort_values(rows[-1:])[0]), last)
+        return self.reader.take(rows), next_cursor
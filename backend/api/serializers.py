@@ -3,31 +3,30 @@ DRF Serializers for converting model instances to JSON.
 """
 
 from rest_framework import serializers
-from .models import DatasetSummary
+from .models import SUMMARY_FIELDS, DatasetSummary, UploadJob, UploadSession
+from .resumable import missing_chunks
 
 
 class DatasetSummarySerializer(serializers.ModelSerializer):
     """
     Serializer for DatasetSummary model.
-    Converts type_distribution from JSON string to dict for API response.
+    Converts type_distribution and column_stats from JSON strings to dicts
+    for API response.
     """
     type_distribution = serializers.SerializerMethodField()
+    column_stats = serializers.SerializerMethodField()
     
     class Meta:
         model = DatasetSummary
-        fields = [
-            'id',
-            'uploaded_at',
-            'total_count',
-            'avg_flowrate',
-            'avg_pressure',
-            'avg_temperature',
-            'type_distribution',
-        ]
+        fields = SUMMARY_FIELDS
     
     def get_type_distribution(self, obj):
         """Convert JSON string to dict."""
         return obj.get_type_distribution()
+    
+    def get_column_stats(self, obj):
+        """Convert JSON string to dict."""
+        return obj.get_column_stats()
 
 
 class DatasetSummaryDetailSerializer(DatasetSummarySerializer):
@@ -37,8 +36,62 @@ class DatasetSummaryDetailSerializer(DatasetSummarySerializer):
     original_data = serializers.SerializerMethodField()
     
     class Meta(DatasetSummarySerializer.Meta):
-        fields = DatasetSummarySerializer.Meta.fields + ['original_data']
+        fields = SUMMARY_FIELDS + ['original_data']
     
     def get_original_data(self, obj):
-        """Convert JSON string to list of dicts."""
-        return obj.get_original_data()
+        """Read the stored rows as a list of dicts."""
+        return obj.get_original_data() if obj.has_rows else []
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for UploadJob status polling.
+    Includes the dataset summary once the job is done.
+    """
+    progress = serializers.FloatField(read_only=True)
+    summary = DatasetSummarySerializer(read_only=True)
+    
+    class Meta:
+        model = UploadJob
+        fields = [
+            'id',
+            'status',
+            'file_name',
+            'created_at',
+            'updated_at',
+            'bytes_total',
+            'bytes_processed',
+            'progress',
+            'error',
+            'summary_id',
+            'summary',
+        ]
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for resumable upload sessions.
+    Lists the chunks still missing and includes the job parsing the file.
+    """
+    chunk_count = serializers.IntegerField(read_only=True)
+    missing = serializers.SerializerMethodField()
+    job = UploadJobSerializer(read_only=True)
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'file_name',
+            'file_size',
+            'chunk_size',
+            'chunk_count',
+            'completed',
+            'created_at',
+            'updated_at',
+            'missing',
+            'job',
+        ]
+    
+    def get_missing(self, obj):
+        """Indexes of the chunks not received yet."""
+        return missing_chunks(obj)
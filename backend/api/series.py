@@ -0,0 +1,87 @@
+"""
+Downsampled row series of stored datasets, for charting.
+
+A numeric column over a row range is reduced to a point budget straight
+from the memory-mapped column files (see storage.py):
+- minmax: split the rows into equal buckets and keep the minimum and
+  maximum of each, in row order (preserves spikes, 2 points per bucket)
+- lttb:   Largest-Triangle-Three-Buckets, keeps the point of each bucket
+  that forms the largest triangle with its neighbors (preserves shape)
+
+Rows whose value is missing (NaN) are skipped. Row indices are returned
+as the x values.
+"""
+
+import numpy as np
+
+
+# Downsampling methods accepted by downsample()
+METHODS = ['lttb', 'minmax']
+
+# Point budget when none is requested, and the largest one allowed
+DEFAULT_POINTS = 2000
+MAX_POINTS = 20000
+
+
+def minmax_downsample(x, y, points):
+    """Keep the min and max of points // 2 equal buckets (row order kept)."""
+    buckets = max(1, points // 2)
+    size = -(-len(y) // buckets)  # ceil division
+    padding = buckets * size - len(y)
+
+    # One row per bucket; the last bucket is padded with NaN
+    grid = np.concatenate([y, np.full(padding, np.nan)]).reshape(buckets, size)
+    low = np.argmin(np.where(np.isnan(grid), np.inf, grid), axis=1)
+    high = np.argmax(np.where(np.isnan(grid), -np.inf, grid), axis=1)
+
+    offsets = np.arange(buckets) * size
+    picks = np.sort(np.stack([offsets + low, offsets + high], axis=1), axis=1).ravel()
+    picks = np.unique(picks[picks < len(y)])
+    return x[picks], y[picks]
+
+
+def lttb_downsample(x, y, points):
+    """Largest-Triangle-Three-Buckets; always keeps the first and last point."""
+    n = len(y)
+    if points < 3:
+        return x[[0, -1]], y[[0, -1]]
+
+    # Bucket edges for the n - 2 inner points, and each bucket's mean point
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1].astype(float), edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+
+    picks = np.empty(points, dtype=np.int64)
+    picks[0] = 0
+    picks[-1] = n - 1
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Next bucket's mean (the last point after the final bucket)
+        next_x = mean_x[i + 1] if i + 1 < len(mean_x) else x[-1]
+        next_y = mean_y[i + 1] if i + 1 < len(mean_y) else y[-1]
+        prev_x, prev_y = x[picks[i]], y[picks[i]]
+        # Twice the triangle area (prev, candidate, next mean), vectorized
+        area = np.abs((prev_x - next_x) * (y[start:stop] - prev_y)
+                      - (prev_x - x[start:stop]) * (next_y - prev_y))
+        picks[i + 1] = start + int(np.argmax(area))
+    return x[picks], y[picks]
+
+
+def downsample_column(reader, column, start, stop, points, method):
+    """
+    Downsample rows [start, stop) of a numeric column of a stored dataset.
+    Returns {'x': [...], 'y': [...]} with at most points points.
+    """
+    y = np.asarray(reader.column(column)[start:stop])
+    x = np.arange(start, start + len(y))
+    present = ~np.isnan(y)
+    if not present.all():
+        x, y = x[present], y[present]
+
+    if len(y) > points:
+        if method == 'minmax':
+            x, y = minmax_downsample(x, y, points)
+        else:
+            x, y = lttb_downsample(x, y, points)
+    return {'x': x.tolist(), 'y': y.tolist()}
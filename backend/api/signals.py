@@ -0,0 +1,64 @@
+"""
+Signal handlers for the API app.
+
+- Stored rows and cached PDF reports of a dataset are removed from disk
+  once its DatasetSummary row is deleted and the transaction commits
+- Stored rows shared by duplicate uploads are kept until the last row
+  using them is deleted
+- Cached history and summary responses are invalidated whenever a
+  DatasetSummary is saved or deleted
+- The response JSON of a new DatasetSummary is rendered and stored
+  (see materialized.py)
+- New SQLite connections are configured with settings.SQLITE_PRAGMAS
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .dedup import release_payload
+from .httpcache import bump_version
+from .materialized import render_summary
+from .models import DatasetSummary
+from .reports import evict_reports
+
+
+@receiver(post_delete, sender=DatasetSummary)
+def delete_stored_rows(sender, instance, **kwargs):
+    """Remove the columnar files of a deleted dataset, unless still shared."""
+    data_key = instance.data_key
+    transaction.on_commit(lambda: release_payload(data_key))
+
+
+@receiver(post_delete, sender=DatasetSummary)
+def evict_cached_reports(sender, instance, **kwargs):
+    """Remove the cached PDF reports of a deleted dataset."""
+    summary_id = instance.id
+    transaction.on_commit(lambda: evict_reports(summary_id))
+
+
+@receiver(post_save, sender=DatasetSummary)
+def materialize_summary_json(sender, instance, created, **kwargs):
+    """Store the response JSON of a new dataset; id and upload time are known now."""
+    if created and not instance.summary_json:
+        instance.summary_json = render_summary(instance)
+        DatasetSummary.objects.filter(pk=instance.pk).update(summary_json=instance.summary_json)
+
+
+@receiver(post_save, sender=DatasetSummary)
+@receiver(post_delete, sender=DatasetSummary)
+def invalidate_cached_responses(sender, **kwargs):
+    """Make every server process rebuild its cached history and summaries."""
+    transaction.on_commit(bump_version)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS (WAL mode, sync level, ...) to a new connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
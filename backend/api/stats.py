@@ -0,0 +1,254 @@
+"""
+Mergeable per-column statistics for equipment datasets.
+
+Statistics are kept as partial states that can be updated chunk by chunk
+and merged across chunks, workers or datasets:
+- count, mean and M2 (sum of squared deviations) for mean/std
+- min and max
+- a t-digest style quantile sketch for percentiles
+
+DatasetStats keeps one state per numeric column for the whole dataset
+and per equipment Type. Every update is a vectorized NumPy pass over a
+chunk; only the (few) Types are looped over in Python.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# Columns that statistics are computed for
+STATS_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+# Percentiles reported by ColumnStats.result()
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Digest size; higher is more accurate and larger
+DIGEST_COMPRESSION = 100
+
+
+class QuantileDigest:
+    """
+    Merging t-digest: weighted centroids, kept small by grouping points
+    whose quantiles fall in the same unit of the k1 scale function.
+    Centroids are narrow at the tails and wide near the median.
+    """
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+
+    @property
+    def total_weight(self):
+        return float(self.weights.sum())
+
+    def add(self, values):
+        """Add an array of non-NaN values."""
+        if len(values):
+            self._compress(
+                np.concatenate([self.means, values]),
+                np.concatenate([self.weights, np.ones(len(values))]),
+            )
+
+    def merge(self, other):
+        if len(other.means):
+            self._compress(
+                np.concatenate([self.means, other.means]),
+                np.concatenate([self.weights, other.weights]),
+            )
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+
+        # k1 scale of each point's quantile; one centroid per unit of k
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+
+        merged_weights = np.bincount(bucket, weights=weights)
+        merged_sums = np.bincount(bucket, weights=means * weights)
+        used = merged_weights > 0
+        self.weights = merged_weights[used]
+        self.means = merged_sums[used] / self.weights
+
+    def quantile(self, q, minimum, maximum):
+        """Estimate the q-th quantile (0 <= q <= 1)."""
+        total = self.total_weight
+        if total == 0:
+            return None
+        # Interpolate between centroid centers, pinned to the exact min/max
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[minimum], self.means, [maximum]])
+        return float(np.interp(q * total, positions, values))
+
+    def to_state(self):
+        return {
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        digest = cls()
+        digest.means = np.asarray(state['means'], dtype=float)
+        digest.weights = np.asarray(state['weights'], dtype=float)
+        return digest
+
+
+class ColumnStats:
+    """Mergeable statistics of one numeric column (NaN values are skipped)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.digest = QuantileDigest()
+
+    def update(self, values):
+        """Add a float array of values."""
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        other = ColumnStats()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.minimum = float(values.min())
+        other.maximum = float(values.max())
+        self._merge_moments(other)
+        self.digest.add(values)
+
+    def merge(self, other):
+        self._merge_moments(other)
+        self.digest.merge(other.digest)
+
+    def _merge_moments(self, other):
+        # Chan et al. parallel variance update
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def result(self):
+        """Final statistics as a JSON-safe dict (None where undefined)."""
+        if self.count == 0:
+            result = {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+            result.update({f'p{p}': None for p in PERCENTILES})
+            return result
+
+        # Sample standard deviation, like pandas (ddof=1)
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+        result = {
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.mean,
+            'std': std,
+        }
+        for p in PERCENTILES:
+            result[f'p{p}'] = self.digest.quantile(p / 100, self.minimum, self.maximum)
+        return result
+
+    def to_state(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.minimum if self.count else None,
+            'max': self.maximum if self.count else None,
+            'digest': self.digest.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.count = state['count']
+        stats.mean = state['mean']
+        stats.m2 = state['m2']
+        if stats.count:
+            stats.minimum = state['min']
+            stats.maximum = state['max']
+        stats.digest = QuantileDigest.from_state(state['digest'])
+        return stats
+
+
+def _column_stats():
+    return {col: ColumnStats() for col in STATS_COLUMNS}
+
+
+class DatasetStats:
+    """Per-column statistics for a whole dataset and per equipment Type."""
+
+    def __init__(self):
+        self.overall = _column_stats()
+        self.by_type = {}
+
+    def update(self, chunk):
+        """Add a DataFrame chunk (numeric columns as float64)."""
+        # Group rows by Type once: sort by type code, then slice per Type
+        codes, type_values = pd.factorize(chunk['Type'])
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(type_values)), side='left')
+        stops = np.searchsorted(sorted_codes, np.arange(len(type_values)), side='right')
+
+        for col in STATS_COLUMNS:
+            values = chunk[col].to_numpy(dtype=float, na_value=np.nan)
+            self.overall[col].update(values)
+
+            grouped = values[order]
+            for type_name, start, stop in zip(type_values, starts, stops):
+                type_stats = self.by_type.setdefault(str(type_name), _column_stats())
+                type_stats[col].update(grouped[start:stop])
+
+    def merge(self, other):
+        for col in STATS_COLUMNS:
+            self.overall[col].merge(other.overall[col])
+        for type_name, columns in other.by_type.items():
+            type_stats = self.by_type.setdefault(type_name, _column_stats())
+            for col in STATS_COLUMNS:
+                type_stats[col].merge(columns[col])
+
+    def result(self):
+        """Final statistics: {'overall': {col: {...}}, 'by_type': {type: {col: {...}}}}."""
+        return {
+            'overall': {col: stats.result() for col, stats in self.overall.items()},
+            'by_type': {
+                type_name: {col: stats.result() for col, stats in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
+
+    def to_state(self):
+        return {
+            'overall': {col: stats.to_state() for col, stats in self.overall.items()},
+            'by_type': {
+                type_name: {col: stats.to_state() for col, stats in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        dataset_stats = cls()
+        dataset_stats.overall = {
+            col: ColumnStats.from_state(s) for col, s in state['overall'].items()
+        }
+        dataset_stats.by_type = {
+            type_name: {col: ColumnStats.from_state(s) for col, s in columns.items()}
+            for type_name, columns in state['by_type'].items()
+        }
+        return dataset_stats
@@ -0,0 +1,320 @@
+"""
+Columnar on-disk storage for the raw rows of uploaded datasets.
+
+Each dataset gets its own directory under settings.DATASET_STORAGE_DIR:
+- flowrate.f8 / pressure.f8 / temperature.f8 - raw float64 arrays
+- type.i4   - int32 codes into the Type dictionary (-1 = missing)
+- name.bin  - Equipment Names in blocks of NAME_BLOCK_ROWS rows, each
+  zlib-compressed: uint32 end offsets, then the UTF-8 names back to back
+- name.blk  - int64 offsets of the blocks in name.bin (blocks + 1 entries)
+- meta.json - format version, row count and the Type dictionary
+
+All arrays are little-endian and opened with np.memmap, so a row range
+can be read without decoding the rest of the dataset; for names only the
+blocks holding the rows are decompressed.
+
+Names are compressed rather than dictionary-encoded: they are usually
+unique per row (a tag per piece of equipment), so a dictionary would be
+as large as the column. The numeric columns stay raw, since queries
+read them through np.memmap (see rows.py, series.py, anomalies.py).
+"""
+
+import json
+import shutil
+import uuid
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+
+FORMAT_VERSION = 2
+
+# CSV column -> file holding it
+NUMERIC_FILES = {
+    'Flowrate': 'flowrate.f8',
+    'Pressure': 'pressure.f8',
+    'Temperature': 'temperature.f8',
+}
+TYPE_FILE = 'type.i4'
+NAME_BLOCKS_FILE = 'name.blk'
+NAME_DATA_FILE = 'name.bin'
+META_FILE = 'meta.json'
+
+FLOAT_DTYPE = np.dtype('<f8')
+CODE_DTYPE = np.dtype('<i4')
+OFFSET_DTYPE = np.dtype('<i8')
+NAME_END_DTYPE = np.dtype('<u4')
+
+# Names per compressed block (a page of rows decompresses a few blocks)
+NAME_BLOCK_ROWS = 4096
+NAME_COMPRESSION_LEVEL = 1
+
+# Column order used when rows are read back
+COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+
+
+def storage_root():
+    """Directory that holds one sub-directory per stored dataset."""
+    return Path(settings.DATASET_STORAGE_DIR)
+
+
+def dataset_path(data_key, root=None):
+    return Path(root or storage_root()) / data_key
+
+
+def new_data_key():
+    return uuid.uuid4().hex
+
+
+def delete_dataset(data_key, root=None):
+    """Remove the stored columns of a dataset (missing ones are ignored)."""
+    if data_key:
+        shutil.rmtree(dataset_path(data_key, root), ignore_errors=True)
+
+
+class ColumnarWriter:
+    """
+    Appends DataFrame chunks to a new dataset directory.
+
+    Files are written to a temporary directory and moved into place by
+    close(), so readers never see a half-written dataset. root overrides
+    settings.DATASET_STORAGE_DIR (used for the parts of parallel ingestion).
+    """
+
+    def __init__(self, data_key=None, root=None):
+        self.data_key = data_key or new_data_key()
+        self.path = dataset_path(self.data_key, root)
+        self.tmp_path = self.path.parent / f'.tmp-{self.data_key}'
+        self.tmp_path.mkdir(parents=True)
+
+        self.row_count = 0
+        self.type_values = []
+        self._type_index = {}
+        self.name_offset = 0
+        # Encoded names not yet written, fewer than NAME_BLOCK_ROWS
+        self._pending_names = []
+        self._numeric = {col: open(self.tmp_path / name, 'wb') for col, name in NUMERIC_FILES.items()}
+        self._types = open(self.tmp_path / TYPE_FILE, 'wb')
+        self._name_blocks = open(self.tmp_path / NAME_BLOCKS_FILE, 'wb')
+        self._names = open(self.tmp_path / NAME_DATA_FILE, 'wb')
+        self._name_blocks.write(np.zeros(1, dtype=OFFSET_DTYPE).tobytes())
+
+    def append(self, chunk):
+        """Append one DataFrame chunk (numeric columns already float64)."""
+        for col, f in self._numeric.items():
+            f.write(chunk[col].to_numpy(dtype=FLOAT_DTYPE, na_value=np.nan).tobytes())
+
+        # Dictionary-encode Type, extending the dictionary with new values
+        types = chunk['Type']
+        if isinstance(types.dtype, pd.CategoricalDtype):
+            # Already encoded: only the categories need mapping
+            categories = [str(value) for value in types.cat.categories]
+            self._add_types(categories)
+            mapping = np.array([self._type_index[v] for v in categories] + [-1], dtype=CODE_DTYPE)
+            codes = mapping[types.cat.codes.to_numpy()]
+        else:
+            types = types.where(types.isna(), types.astype(str))
+            self._add_types(pd.unique(types.dropna()))
+            codes = pd.Categorical(types, categories=self.type_values).codes
+        self._types.write(codes.astype(CODE_DTYPE).tobytes())
+
+        self._add_names([name.encode('utf-8') for name in chunk['Equipment Name'].fillna('').astype(str)])
+        self.row_count += len(chunk)
+
+    def extend(self, reader, block_size=1_000_000):
+        """
+        Append every row of another stored dataset.
+        Numeric columns are copied as raw bytes and Type codes remapped;
+        names are decompressed and compressed again in this dataset's
+        blocks. Nothing is parsed again.
+        """
+        for col, f in self._numeric.items():
+            with open(reader.path / NUMERIC_FILES[col], 'rb') as src:
+                shutil.copyfileobj(src, f)
+
+        # Map the other dataset's Type codes onto this dictionary (-1 stays -1)
+        self._add_types(reader.type_values)
+        mapping = np.array([self._type_index[v] for v in reader.type_values] + [-1], dtype=CODE_DTYPE)
+        codes = reader.type_codes()
+        for start in range(0, reader.row_count, block_size):
+            self._types.write(mapping[codes[start:start + block_size]].tobytes())
+            self._add_names(reader.name_bytes(start, start + block_size))
+        self.row_count += reader.row_count
+
+    def _add_names(self, encoded):
+        """Queue encoded names, writing every full block."""
+        pending = self._pending_names + encoded
+        full = len(pending) - len(pending) % NAME_BLOCK_ROWS
+        for start in range(0, full, NAME_BLOCK_ROWS):
+            self._write_name_block(pending[start:start + NAME_BLOCK_ROWS])
+        self._pending_names = pending[full:]
+
+    def _write_name_block(self, names):
+        ends = np.cumsum(np.fromiter(map(len, names), dtype=OFFSET_DTYPE, count=len(names)))
+        if len(ends) and ends[-1] > np.iinfo(NAME_END_DTYPE).max:
+            raise ValueError('Equipment Names are too long to store.')
+        block = zlib.compress(ends.astype(NAME_END_DTYPE).tobytes() + b''.join(names),
+                              NAME_COMPRESSION_LEVEL)
+        self._names.write(block)
+        self.name_offset += len(block)
+        self._name_blocks.write(np.array([self.name_offset], dtype=OFFSET_DTYPE).tobytes())
+
+    def _add_types(self, values):
+        for value in values:
+            if value not in self._type_index:
+                self._type_index[value] = len(self.type_values)
+                self.type_values.append(value)
+
+    def _close_files(self):
+        for f in [*self._numeric.values(), self._types, self._name_blocks, self._names]:
+            f.close()
+
+    def close(self):
+        """Finish the dataset and return its size on disk in bytes."""
+        if self._pending_names:
+            self._write_name_block(self._pending_names)
+            self._pending_names = []
+        self._close_files()
+        meta = {
+            'version': FORMAT_VERSION,
+            'row_count': self.row_count,
+            'type_values': self.type_values,
+        }
+        (self.tmp_path / META_FILE).write_text(json.dumps(meta))
+        self.tmp_path.rename(self.path)
+        return sum(f.stat().st_size for f in self.path.iterdir())
+
+    def abort(self):
+        """Discard everything written so far."""
+        self._close_files()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+def write_dataframe(df):
+    """Store a whole DataFrame at once. Returns (data_key, size in bytes)."""
+    writer = ColumnarWriter()
+    try:
+        writer.append(df)
+        return writer.data_key, writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+class ColumnarReader:
+    """Reads row ranges and single columns of a stored dataset."""
+
+    def __init__(self, data_key, root=None):
+        self.path = dataset_path(data_key, root)
+        meta = json.loads((self.path / META_FILE).read_text())
+        self.row_count = meta['row_count']
+        self.type_values = meta['type_values']
+
+    def _memmap(self, name, dtype, count):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path / name, dtype=dtype, mode='r', shape=(count,))
+
+    def column(self, col):
+        """Memory-mapped float64 array of a numeric column."""
+        return self._memmap(NUMERIC_FILES[col], FLOAT_DTYPE, self.row_count)
+
+    def type_codes(self):
+        """Memory-mapped int32 array of Type codes (index into type_values)."""
+        return self._memmap(TYPE_FILE, CODE_DTYPE, self.row_count)
+
+    def _name_block(self, f, index):
+        """(start offsets, end offsets, bytes) of the names in block index."""
+        blocks = self._memmap(NAME_BLOCKS_FILE, OFFSET_DTYPE, -(-self.row_count // NAME_BLOCK_ROWS) + 1)
+        start, stop = int(blocks[index]), int(blocks[index + 1])
+        f.seek(start)
+        data = zlib.decompress(f.read(stop - start))
+        count = min(NAME_BLOCK_ROWS, self.row_count - index * NAME_BLOCK_ROWS)
+        header = count * NAME_END_DTYPE.itemsize
+        ends = (np.frombuffer(data, dtype=NAME_END_DTYPE, count=count) + header).tolist()
+        return [header] + ends[:-1], ends, data
+
+    def name_bytes(self, start, stop):
+        """UTF-8 encoded Equipment Names of rows [start, stop)."""
+        start, stop, _ = slice(start, stop).indices(self.row_count)
+        if start >= stop:
+            return []
+        names = []
+        with open(self.path / NAME_DATA_FILE, 'rb') as f:
+            for index in range(start // NAME_BLOCK_ROWS, (stop - 1) // NAME_BLOCK_ROWS + 1):
+                starts, ends, data = self._name_block(f, index)
+                first = index * NAME_BLOCK_ROWS
+                for row in range(max(start, first) - first, min(stop, first + len(ends)) - first):
+                    names.append(data[starts[row]:ends[row]])
+        return names
+
+    def names(self, start, stop):
+        """Decode Equipment Names for rows [start, stop)."""
+        return [name.decode('utf-8') for name in self.name_bytes(start, stop)]
+
+    def take_names(self, rows):
+        """Decode the Equipment Names of the given row ids (in that order)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        names = []
+        with open(self.path / NAME_DATA_FILE, 'rb') as f:
+            # Decompress every block once, however many rows it holds
+            blocks = {}
+            for row in rows.tolist():
+                index, position = divmod(row, NAME_BLOCK_ROWS)
+                if index not in blocks:
+                    blocks[index] = self._name_block(f, index)
+                starts, ends, data = blocks[index]
+                names.append(data[starts[position]:ends[position]].decode('utf-8'))
+        return names
+
+    def types(self, start, stop):
+        """Decode Type values for rows [start, stop) (None if missing)."""
+        return [self.type_values[code] if code >= 0 else None
+                for code in self.type_codes()[start:stop].tolist()]
+
+    def read_frame(self, start=0, stop=None, names=True):
+        """Return rows [start, stop) as a DataFrame (Type as category)."""
+        start, stop, _ = slice(start, stop).indices(self.row_count)
+        stop = max(start, stop)
+        columns = {}
+        if names:
+            columns['Equipment Name'] = self.names(start, stop)
+        columns['Type'] = pd.Categorical.from_codes(
+            np.asarray(self.type_codes()[start:stop]), categories=self.type_values)
+        for col in NUMERIC_FILES:
+            columns[col] = np.asarray(self.column(col)[start:stop])
+        return pd.DataFrame(columns)
+
+    def read_rows(self, start=0, stop=None):
+        """Return rows [start, stop) as a list of dicts keyed by CSV column."""
+        start, stop, _ = slice(start, stop).indices(self.row_count)
+        if start >= stop:
+            return []
+        columns = {
+            'Equipment Name': self.names(start, stop),
+            'Type': self.types(start, stop),
+        }
+        for col in NUMERIC_FILES:
+            columns[col] = self.column(col)[start:stop].tolist()
+        return [dict(zip(COLUMNS, values)) for values in zip(*(columns[col] for col in COLUMNS))]
+
+    def take(self, rows):
+        """
+        Return the rows with the given ids (in that order) as dicts keyed
+        by CSV column plus 'row'. Missing numbers are None.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        codes = self.type_codes()[rows].tolist()
+        columns = {
+            'row': rows.tolist(),
+            'Equipment Name': self.take_names(rows),
+            'Type': [self.type_values[code] if code >= 0 else None for code in codes],
+        }
+        for col in NUMERIC_FILES:
+            values = self.column(col)[rows]
+            columns[col] = np.where(np.isnan(values), None, values).tolist()
+        keys = ['row', *COLUMNS]
+        return [dict(zip(keys, values)) for values in zip(*(columns[key] for key in keys))]
@@ -0,0 +1,711 @@
+"""
+Tests for the API app.
+
+Run with: python manage.py test api
+"""
+
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import uuid
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import zstandard
+
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+
+from . import retention
+from .dedup import find_duplicate, release_payload
+from .ingest import InvalidRowsError, summarize_csv, summarize_csv_parallel
+from .jobs import fail_stale_jobs, run_upload_job
+from .models import SUMMARY_FIELDS, DatasetSummary, UploadJob, UploadSession
+from .resumable import claim, run_session
+from .rows import RowQuery
+from .storage import (
+    NAME_BLOCK_ROWS, ColumnarReader, ColumnarWriter, dataset_path, delete_dataset, storage_root,
+    write_dataframe,
+)
+
+
+CSV_HEADER = 'Equipment Name,Type,Flowrate,Pressure,Temperature\n'
+
+
+def make_csv(rows):
+    """CSV bytes for (name, type, flowrate, pressure, temperature) tuples."""
+    return (CSV_HEADER + ''.join(','.join(map(str, row)) + '\n' for row in rows)).encode()
+
+
+SAMPLE_CSV = make_csv([
+    ('Pump-1', 'Pump', 120.5, 5.2, 110),
+    ('Valve-1', 'Valve', 60.0, 4.1, 105),
+    ('Pump-2', 'Pump', 130.0, 5.8, 115),
+])
+
+
+class StorageTestCase(TestCase):
+    """Runs every test with its own directories for stored rows, reports and uploads."""
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        settings_override = override_settings(
+            DATASET_STORAGE_DIR=f'{tmp_dir}/datasets',
+            REPORT_CACHE_DIR=f'{tmp_dir}/reports',
+            UPLOAD_TMP_DIR=f'{tmp_dir}/uploads',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, content=SAMPLE_CSV, name='data.csv'):
+        """POST a CSV to /api/upload/ and return the response."""
+        return self.client.post('/api/upload/', {'file': SimpleUploadedFile(name, content)})
+
+    def stored_datasets(self):
+        """Directories of the stored datasets."""
+        if not storage_root().exists():
+            return []
+        return [path for path in storage_root().iterdir() if path.is_dir()]
+
+
+class SummaryQueryTests(StorageTestCase):
+    """History and summary responses never load stored rows or statistics state."""
+
+    # Columns that history and summary responses must not select
+    HEAVY_COLUMNS = ['original_data', 'stats_state', 'data_key']
+
+    def assert_light_queries(self, queries):
+        selects = [q['sql'] for q in queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            for column in self.HEAVY_COLUMNS:
+                self.assertNotIn(f'"{column}"', sql)
+
+    def test_history_selects_only_summary_json(self):
+        self.assertEqual(self.upload().status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assert_light_queries(queries.captured_queries)
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"summary_json"', sql)
+        self.assertNotIn('"column_stats"', sql)
+
+    def test_summary_selects_only_summary_json(self):
+        pk = self.upload().json()['id']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/datasets/{pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], pk)
+        self.assert_light_queries(queries.captured_queries)
+
+    def test_summaries_queryset_selects_summary_fields(self):
+        self.upload()
+        with CaptureQueriesContext(connection) as queries:
+            list(DatasetSummary.objects.summaries())
+        sql = queries.captured_queries[-1]['sql']
+        for field in SUMMARY_FIELDS:
+            self.assertIn(f'"{field}"', sql)
+        self.assert_light_queries(queries.captured_queries)
+
+
+class RowQueryTests(StorageTestCase):
+    """RowQuery pages agree with the same filter applied by pandas."""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        n = 20_000
+        types = rng.choice(['Pump', 'Valve', 'Compressor'], size=n).astype(object)
+        types[rng.choice(n, size=40, replace=False)] = 'Rare'
+        self.df = pd.DataFrame({
+            'Equipment Name': [f'EQ-{i}' for i in range(n)],
+            'Type': types,
+            'Flowrate': rng.uniform(0, 500, n),
+            'Pressure': rng.uniform(0, 100, n),
+            'Temperature': rng.uniform(0, 300, n),
+        })
+        self.reader = ColumnarReader(write_dataframe(self.df)[0])
+
+    def fetch_all(self, **kwargs):
+        """Row ids of every page of a query, following the cursors."""
+        rows, cursor = [], None
+        while True:
+            page, cursor = RowQuery(self.reader, limit=7, cursor=cursor, **kwargs).run()
+            rows.extend(row['row'] for row in page)
+            if cursor is None:
+                return rows
+
+    def expected(self, types, col, low, high, sort='row', descending=False):
+        df = self.df[self.df['Type'].isin(types) & self.df[col].between(low, high)]
+        if sort != 'row':
+            df = df.sort_values(sort, kind='stable')
+        ids = df.index.tolist()
+        return ids[::-1] if descending else ids
+
+    def test_selective_type_with_range(self):
+        # The Type filter is the most selective: its index gives the candidates
+        expected = self.expected(['Rare'], 'Pressure', 0, 30)
+        self.assertTrue(expected)
+        self.assertEqual(self.fetch_all(types=['Rare'], ranges={'Pressure': (0, 30)}), expected)
+
+    def test_selective_range_with_type(self):
+        expected = self.expected(['Pump', 'Valve'], 'Pressure', 10, 10.5)
+        self.assertEqual(
+            self.fetch_all(types=['Pump', 'Valve'], ranges={'Pressure': (10, 10.5)}), expected)
+
+    def test_scan_sorted_descending(self):
+        expected = self.expected(['Pump'], 'Flowrate', 100, 400, sort='Temperature', descending=True)
+        rows = self.fetch_all(types=['Pump'], ranges={'Flowrate': (100, 400)},
+                              sort='Temperature', descending=True)
+        self.assertEqual(rows, expected)
+
+
+class DeduplicationTests(StorageTestCase):
+    """Identical uploads share their stored rows until the last one is deleted."""
+
+    def test_duplicate_upload_shares_stored_rows(self):
+        first = DatasetSummary.objects.get(pk=self.upload().json()['id'])
+        second = DatasetSummary.objects.get(pk=self.upload(name='copy.csv').json()['id'])
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(first.data_key, second.data_key)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(second.get_original_data(), first.get_original_data())
+
+    def test_stored_rows_kept_until_last_reference_deleted(self):
+        first = DatasetSummary.objects.get(pk=self.upload().json()['id'])
+        second = DatasetSummary.objects.get(pk=self.upload().json()['id'])
+        path = dataset_path(first.data_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(path.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(path.exists())
+
+    def test_no_duplicate_once_stored_rows_are_gone(self):
+        summary = DatasetSummary.objects.get(pk=self.upload().json()['id'])
+        delete_dataset(summary.data_key)
+        self.assertIsNone(find_duplicate(summary.content_hash))
+
+    def test_release_keeps_referenced_rows(self):
+        summary = DatasetSummary.objects.get(pk=self.upload().json()['id'])
+        release_payload(summary.data_key)
+        self.assertTrue(dataset_path(summary.data_key).exists())
+
+
+class BatchUploadTests(StorageTestCase):
+    """Batches of CSV files and archives, stored in one transaction."""
+
+    def upload_batch(self, *files):
+        return self.client.post('/api/upload/batch/', {'files': list(files)})
+
+    def zip_file(self, name, members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for member_name, content in members.items():
+                archive.writestr(member_name, content)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_reuploaded_archive_shares_stored_rows(self):
+        other = make_csv([('Valve-9', 'Valve', 1, 2, 3)])
+        members = {'a.csv': SAMPLE_CSV, 'b.csv': other}
+        self.assertEqual(self.upload_batch(self.zip_file('first.zip', members)).status_code, 201)
+        response = self.upload_batch(self.zip_file('again.zip', members))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(DatasetSummary.objects.count(), 4)
+        self.assertEqual(len(self.stored_datasets()), 2)
+
+    def test_identical_files_in_one_batch_share_stored_rows(self):
+        response = self.upload_batch(self.zip_file('same.zip', {'a.csv': SAMPLE_CSV, 'b.csv': SAMPLE_CSV}))
+        self.assertEqual(response.status_code, 201)
+        keys = set(DatasetSummary.objects.values_list('data_key', flat=True))
+        self.assertEqual(len(keys), 1)
+        self.assertEqual([path.name for path in self.stored_datasets()], list(keys))
+
+    def test_duplicate_of_single_upload(self):
+        first = self.upload().json()
+        response = self.upload_batch(SimpleUploadedFile('copy.csv', SAMPLE_CSV))
+        summary = response.json()['results'][0]['summary']
+        self.assertNotEqual(summary['id'], first['id'])
+        self.assertEqual(len(self.stored_datasets()), 1)
+
+    def test_partial_failure(self):
+        bad_values = make_csv([('Pump-9', 'Pump', 'fast', 1, 2)])
+        response = self.upload_batch(self.zip_file('mixed.zip', {
+            'good.csv': SAMPLE_CSV,
+            'columns.csv': b'Name,Flowrate\nPump-1,1\n',
+            'values.csv': bad_values,
+        }))
+        self.assertEqual(response.status_code, 207)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (1, 2))
+        good, columns, values = data['results']
+        self.assertEqual(good['summary']['total_count'], 3)
+        self.assertIn('error', columns)
+        self.assertEqual(values['invalid_rows'], [{'line': 2, 'column': 'Flowrate', 'value': 'fast'}])
+        self.assertEqual(DatasetSummary.objects.count(), 1)
+        self.assertEqual(len(self.stored_datasets()), 1)
+
+    def test_every_file_failed(self):
+        response = self.upload_batch(SimpleUploadedFile('bad.csv', b'Name\nPump-1\n'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(self.stored_datasets(), [])
+
+    def test_failed_save_removes_stored_rows(self):
+        other = make_csv([('Valve-9', 'Valve', 1, 2, 3)])
+        with mock.patch('api.batch.render_summary', side_effect=DatabaseError('disk I/O error')):
+            with self.assertRaises(DatabaseError):
+                self.upload_batch(SimpleUploadedFile('a.csv', SAMPLE_CSV), SimpleUploadedFile('b.csv', other))
+        self.assertFalse(DatasetSummary.objects.exists())
+        self.assertEqual(self.stored_datasets(), [])
+
+
+@mock.patch('api.resumable.close_old_connections')  # keep the test's connection open
+class ResumableUploadTests(StorageTestCase):
+    """Chunked uploads, with the session's parser run in the test thread."""
+
+    def start_session(self, content=SAMPLE_CSV, chunks=None, complete=True):
+        """Create a session and send its chunks (all, or the given indexes)."""
+        response = self.client.post('/api/uploads/', {'file_name': 'big.csv', 'file_size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        session = UploadSession.objects.select_related('job').get(pk=response.json()['id'])
+        for index in range(session.chunk_count) if chunks is None else chunks:
+            self.assertEqual(self.put_chunk(session, index, content).status_code, 201)
+        if complete:
+            self.assertEqual(self.client.post(f'/api/uploads/{session.pk}/complete/').status_code, 202)
+        return session
+
+    def put_chunk(self, session, index, content=SAMPLE_CSV):
+        start, stop = session.chunk_range(index)
+        chunk = content[start:stop]
+        return self.client.put(
+            f'/api/uploads/{session.pk}/chunks/{index}/', chunk,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def run_parser(self, session):
+        job = UploadJob.objects.get(pk=session.job_id)
+        run_session(job.pk, claim(job.pk, job.updated_at))
+        job.refresh_from_db()
+        return job
+
+    def test_chunks_are_parsed(self, _):
+        job = self.run_parser(self.start_session())
+        self.assertEqual(job.status, UploadJob.STATUS_DONE)
+        self.assertEqual(job.summary.total_count, 3)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_duplicate_shares_stored_rows(self, _):
+        first = self.upload().json()
+        job = self.run_parser(self.start_session())
+        self.assertEqual(job.status, UploadJob.STATUS_DONE)
+        self.assertNotEqual(job.summary_id, first['id'])
+        self.assertEqual(job.summary.data_key, DatasetSummary.objects.get(pk=first['id']).data_key)
+        self.assertEqual(len(self.stored_datasets()), 1)
+
+    def test_parsers_run_on_bounded_pool(self, _):
+        with mock.patch('api.resumable.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                session = self.start_session(complete=False)
+        get_executor.return_value.submit.assert_called_once_with(run_session, session.job_id, mock.ANY)
+
+    @override_settings(UPLOAD_CHUNK_SIZE=64)
+    @mock.patch('api.resumable.POLL_INTERVAL', 0)
+    @mock.patch('api.resumable.PARSER_IDLE_AFTER', 0)
+    def test_idle_parser_is_replaced_by_next_chunk(self, _):
+        session = self.start_session(chunks=[0], complete=False)
+        self.assertGreater(session.chunk_count, 1)
+        job = self.run_parser(session)
+        # The parser gave up waiting without failing the upload
+        self.assertEqual(job.status, UploadJob.STATUS_RUNNING)
+
+        with mock.patch('api.resumable.get_executor') as get_executor:
+            for index in range(1, session.chunk_count):
+                self.put_chunk(session, index)
+        get_executor.return_value.submit.assert_called_once()
+        run_session(*get_executor.return_value.submit.call_args.args[1:])
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.STATUS_DONE)
+        self.assertEqual(job.summary.total_count, 3)
+
+    def test_abandoned_session_fails(self, _):
+        session = self.start_session(chunks=[], complete=False)
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(fail_stale_jobs(), 1)
+        session.job.refresh_from_db()
+        self.assertEqual(session.job.status, UploadJob.STATUS_FAILED)
+        self.assertFalse(os.path.exists(session.job.file_path))
+
+    def test_bad_checksum_rejected(self, _):
+        session = self.start_session()
+        response = self.client.put(
+            f'/api/uploads/{session.pk}/chunks/0/', SAMPLE_CSV,
+            content_type='application/octet-stream', HTTP_X_CHUNK_SHA256='0' * 64,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_superseded_parser_leaves_no_stored_rows(self, _):
+        def summarize_then_lose_claim(*args, **kwargs):
+            fields = summarize_csv(*args, **kwargs)
+            # Another parser takes over the job before this one saves
+            UploadJob.objects.filter(pk=session.job_id).update(updated_at=timezone.now())
+            return fields
+
+        session = self.start_session()
+        with mock.patch('api.resumable.summarize_csv', side_effect=summarize_then_lose_claim):
+            job = self.run_parser(session)
+        self.assertIsNone(job.summary)
+        self.assertEqual(self.stored_datasets(), [])
+
+
+class RetentionTests(StorageTestCase):
+    """Scheduled pruning and the history limit follow settings.RETENTION."""
+
+    def setUp(self):
+        super().setUp()
+        retention._pending = False
+        self.addCleanup(setattr, retention, '_pending', False)
+
+    def test_rolled_back_schedule_does_not_block_later_prunes(self):
+        with mock.patch.object(retention._executor, 'submit') as submit:
+            try:
+                with transaction.atomic():
+                    retention.schedule_prune()
+                    raise RuntimeError('upload failed')
+            except RuntimeError:
+                pass
+            self.assertFalse(retention._pending)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                retention.schedule_prune()
+                retention.schedule_prune()
+        submit.assert_called_once_with(retention._run_scheduled_prune)
+
+    @override_settings(RETENTION={'MAX_COUNT': 2})
+    def test_history_lists_retained_datasets(self):
+        for index in range(3):
+            self.upload(make_csv([(f'Pump-{index}', 'Pump', index, 1, 1)]))
+        self.assertEqual(len(self.client.get('/api/history/').json()), 2)
+        retention.prune()
+        self.assertEqual(DatasetSummary.objects.count(), 2)
+
+
+class CompressedUploadTests(StorageTestCase):
+    """Compressed CSV uploads give the same summary as the plain file."""
+
+    def assert_same_summary(self, content, name):
+        response = self.upload(content, name)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['total_count'], 3)
+        self.assertEqual(response.json()['type_distribution'], {'Pump': 2, 'Valve': 1})
+
+    def test_gzip(self):
+        self.assert_same_summary(gzip.compress(SAMPLE_CSV), 'data.csv.gz')
+
+    def test_bzip2(self):
+        self.assert_same_summary(bz2.compress(SAMPLE_CSV), 'data.csv.bz2')
+
+    def test_zstd(self):
+        self.assert_same_summary(zstandard.ZstdCompressor().compress(SAMPLE_CSV), 'data.csv.zst')
+
+
+@mock.patch('api.jobs.close_old_connections')  # keep the test's connection open
+class UploadJobTests(StorageTestCase):
+    """Async uploads, with the job's worker run in the test thread."""
+
+    def submit(self, content=SAMPLE_CSV):
+        response = self.client.post('/api/upload/', {'file': SimpleUploadedFile('data.csv', content), 'async': 'true'})
+        self.assertEqual(response.status_code, 202)
+        return UploadJob.objects.get(pk=response.json()['id'])
+
+    def test_job_is_processed(self, _):
+        job = self.submit()
+        run_upload_job(job.pk)
+        response = self.client.get(f'/api/jobs/{job.pk}/')
+        self.assertEqual(response.json()['status'], UploadJob.STATUS_DONE)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_bad_file_fails_job(self, _):
+        job = self.submit(b'a,b\n1,2\n')
+        run_upload_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_missing_job_is_ignored(self, _):
+        run_upload_job(uuid.uuid4())
+
+    def test_stale_job_fails_when_polled(self, _):
+        job = self.submit()
+        UploadJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        response = self.client.get(f'/api/jobs/{job.pk}/')
+        self.assertEqual(response.json()['status'], UploadJob.STATUS_FAILED)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_recent_job_is_not_stale(self, _):
+        job = self.submit()
+        self.assertEqual(fail_stale_jobs(), 0)
+        self.assertTrue(os.path.exists(job.file_path))
+
+
+class ColumnarStorageTests(StorageTestCase):
+    """Stored rows read back exactly, across name blocks."""
+
+    def frame(self, n, start=0):
+        return pd.DataFrame({
+            'Equipment Name': [f'EQ-{i:08d}' if i % 7 else f'Ünïcode {i}' for i in range(start, start + n)],
+            'Type': ['Pump' if i % 3 else None for i in range(start, start + n)],
+            'Flowrate': np.arange(start, start + n, dtype=float),
+            'Pressure': np.full(n, 2.5),
+            'Temperature': np.where(np.arange(n) % 5, 100.0, np.nan),
+        })
+
+    def test_names_across_blocks(self):
+        n = NAME_BLOCK_ROWS * 2 + 17
+        df = self.frame(n)
+        reader = ColumnarReader(write_dataframe(df)[0])
+        expected = df['Equipment Name'].tolist()
+        self.assertEqual(reader.names(0, n), expected)
+        self.assertEqual(reader.names(NAME_BLOCK_ROWS - 3, NAME_BLOCK_ROWS + 3),
+                         expected[NAME_BLOCK_ROWS - 3:NAME_BLOCK_ROWS + 3])
+        rows = [n - 1, 0, NAME_BLOCK_ROWS, 5, NAME_BLOCK_ROWS * 2 + 1]
+        self.assertEqual([row['Equipment Name'] for row in reader.take(rows)], [expected[r] for r in rows])
+
+    def test_chunked_writes_match_single_write(self):
+        df = self.frame(10_000)
+        writer = ColumnarWriter()
+        for start in range(0, len(df), 3_001):
+            writer.append(df.iloc[start:start + 3_001])
+        writer.close()
+        # Compared as JSON, where NaN equals NaN
+        self.assertEqual(json.dumps(ColumnarReader(writer.data_key).read_rows()),
+                         json.dumps(ColumnarReader(write_dataframe(df)[0]).read_rows()))
+
+    def test_extend(self):
+        first, second = self.frame(5_000), self.frame(3_000, start=5_000)
+        writer = ColumnarWriter()
+        writer.append(first)
+        writer.extend(ColumnarReader(write_dataframe(second)[0]))
+        writer.close()
+        reader = ColumnarReader(writer.data_key)
+        self.assertEqual(reader.names(0, 8_000), first['Equipment Name'].tolist() + second['Equipment Name'].tolist())
+
+    def test_names_are_compressed(self):
+        reader = ColumnarReader(write_dataframe(self.frame(100_000))[0])
+        # Uncompressed names alone would take about 19 bytes per row
+        self.assertLess((reader.path / 'name.bin').stat().st_size, 100_000 * 5)
+
+
+class StreamingIngestTests(StorageTestCase):
+    """Uploads are parsed chunk by chunk, with nothing kept per row."""
+
+    def csv_file(self, rows):
+        return io.BytesIO(make_csv(
+            (f'EQ-{i}', 'Pump' if i % 2 else 'Valve', i % 300 + 0.5, i % 50 + 0.1, i % 200 + 0.2)
+            for i in range(rows)))
+
+    def peak_memory(self, rows):
+        csv_file = self.csv_file(rows)
+        tracemalloc.start()
+        try:
+            fields = summarize_csv(csv_file, chunk_size=5_000)
+            return tracemalloc.get_traced_memory()[1], fields
+        finally:
+            tracemalloc.stop()
+
+    @mock.patch('api.anomalies.BLOCK_SIZE', 5_000)
+    def test_peak_memory_does_not_grow_with_rows(self):
+        small, _ = self.peak_memory(20_000)
+        large, fields = self.peak_memory(200_000)
+        self.assertEqual(fields['total_count'], 200_000)
+        self.assertLess(large, small * 1.5)
+
+    def test_summary_matches_whole_frame(self):
+        fields = summarize_csv(self.csv_file(12_345), chunk_size=1_000)
+        df = pd.read_csv(self.csv_file(12_345))
+        self.assertEqual(fields['total_count'], len(df))
+        # Averages are rounded to 2 decimals, as before chunked parsing
+        self.assertEqual(fields['avg_flowrate'], round(df['Flowrate'].mean(), 2))
+        self.assertEqual(fields['avg_temperature'], round(df['Temperature'].mean(), 2))
+        self.assertEqual(json.loads(fields['type_distribution']), df['Type'].value_counts().to_dict())
+        self.assertEqual(ColumnarReader(fields['data_key']).row_count, len(df))
+
+
+class AnomalyTests(StorageTestCase):
+    """Values are flagged against the distribution of their own equipment Type."""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        rows = []
+        for type_name, flowrate in [('Pump', 100), ('Valve', 10)]:
+            for i in range(60):
+                rows.append((f'{type_name}-{i}', type_name, round(rng.normal(flowrate, 1), 3),
+                             round(rng.normal(5, 0.5), 3), round(rng.normal(50, 2), 3)))
+        rows += [
+            # Normal for the other Type, far off for their own
+            ('Pump-odd', 'Pump', 10, 5, 50),
+            ('Valve-odd', 'Valve', 100, 5, 50),
+            # No Type, and a Type with too few rows: never checked
+            ('Lone', '', 1000, 5, 50),
+            ('Rare-1', 'Rare', 1, 5, 50),
+            ('Rare-2', 'Rare', 1000, 5, 50),
+        ]
+        self.pk = self.upload(make_csv(rows)).json()['id']
+
+    def get_anomalies(self, **params):
+        response = self.client.get(f'/api/datasets/{self.pk}/anomalies/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_flags_values_far_from_their_type(self):
+        data = self.get_anomalies()
+        self.assertEqual([row['Equipment Name'] for row in data['results']], ['Pump-odd', 'Valve-odd'])
+        for row in data['results']:
+            self.assertEqual(list(row['anomalies']), ['Flowrate'])
+            self.assertGreater(abs(row['anomalies']['Flowrate']), data['threshold'])
+        self.assertEqual(data['counts'], {'Flowrate': 2, 'Pressure': 0, 'Temperature': 0})
+        self.assertEqual(sorted(data['types']), ['Pump', 'Valve'])
+        self.assertAlmostEqual(data['types']['Pump']['Flowrate']['median'], 100, delta=1)
+
+    def test_filters(self):
+        valves = self.get_anomalies(type='Valve')
+        self.assertEqual([row['Equipment Name'] for row in valves['results']], ['Valve-odd'])
+        self.assertEqual(self.get_anomalies(column='Pressure,Temperature')['total'], 0)
+        page = self.get_anomalies(limit=1, offset=1)
+        self.assertEqual((page['total'], page['results'][0]['Equipment Name']), (2, 'Valve-odd'))
+
+    def test_unknown_column(self):
+        response = self.client.get(f'/api/datasets/{self.pk}/anomalies/', {'column': 'Speed'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ParallelIngestTests(StorageTestCase):
+    """Parsing a CSV in byte ranges on worker processes matches a serial parse."""
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        self.path = os.path.join(tmp_dir, 'data.csv')
+
+    def write_csv(self, rows):
+        with open(self.path, 'wb') as f:
+            f.write(make_csv(rows))
+
+    def rows(self, n):
+        rng = np.random.default_rng(0)
+        for i in range(n):
+            name = f'"Pump {i}, north"' if i % 11 == 0 else f'EQ-{i}'
+            type_name = ['Pump', 'Valve', 'Compressor', ''][i % 7 % 4]
+            temperature = '' if i % 13 == 0 else round(rng.normal(100, 20), 2)
+            yield name, type_name, round(rng.uniform(0, 500), 2), round(rng.uniform(0, 10), 3), temperature
+
+    def test_matches_serial_parse(self):
+        self.write_csv(self.rows(5_000))
+        parallel = summarize_csv_parallel(self.path, 4)
+        with open(self.path, 'rb') as f:
+            serial = summarize_csv(f)
+
+        for field in ['total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature', 'type_distribution']:
+            self.assertEqual(parallel[field], serial[field], field)
+        parallel_reader = ColumnarReader(parallel['data_key'])
+        serial_reader = ColumnarReader(serial['data_key'])
+        self.assertEqual(parallel_reader.type_values, serial_reader.type_values)
+        # Compared as JSON, where NaN equals NaN
+        self.assertEqual(json.dumps(parallel_reader.read_rows()), json.dumps(serial_reader.read_rows()))
+
+        # Merged moments match up to rounding; percentiles come from merged digests
+        parallel_stats = json.loads(parallel['column_stats'])['overall']
+        serial_stats = json.loads(serial['column_stats'])['overall']
+        for col, expected in serial_stats.items():
+            actual = parallel_stats[col]
+            self.assertEqual((actual['count'], actual['min'], actual['max']),
+                             (expected['count'], expected['min'], expected['max']))
+            self.assertAlmostEqual(actual['mean'], expected['mean'], places=9)
+            self.assertAlmostEqual(actual['std'], expected['std'], places=9)
+            self.assertAlmostEqual(actual['p50'], expected['p50'], delta=expected['std'] * 0.05)
+
+    def test_invalid_row_line_numbers(self):
+        rows = list(self.rows(2_000))
+        rows[1_900] = ('EQ-bad', 'Pump', 'fast', 1, 2)
+        self.write_csv(rows)
+        with self.assertRaises(InvalidRowsError) as parallel:
+            summarize_csv_parallel(self.path, 4)
+        with open(self.path, 'rb') as f, self.assertRaises(InvalidRowsError) as serial:
+            summarize_csv(f)
+        self.assertEqual(parallel.exception.rows, serial.exception.rows)
+        self.assertEqual(parallel.exception.rows[0]['line'], 1_902)
+        # The parts of the ranges that did parse are removed
+        self.assertEqual(self.stored_datasets(), [])
+
+
+@mock.patch('api.views.schedule_prune')  # prunes are run explicitly
+class HttpCacheTests(StorageTestCase):
+    """History and summary responses are cached, conditional and invalidated on change."""
+
+    def upload_committed(self, content=SAMPLE_CSV):
+        """Upload and run the on-commit callbacks that invalidate the cache."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_not_modified(self, _):
+        pk = self.upload_committed()
+        for url in ['/api/history/', f'/api/datasets/{pk}/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            with self.assertNumQueries(0):
+                cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached['ETag'], response['ETag'])
+            self.assertEqual(cached.content, b'')
+
+    def test_upload_invalidates(self, _):
+        self.upload_committed()
+        first = self.client.get('/api/history/')
+        self.upload_committed(make_csv([('Valve-9', 'Valve', 1, 2, 3)]))
+        response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(len(response.json()), 2)
+
+    @override_settings(RETENTION={'MAX_AGE_DAYS': 30})
+    def test_prune_invalidates(self, _):
+        old_pk = self.upload_committed()
+        self.upload_committed(make_csv([('Valve-9', 'Valve', 1, 2, 3)]))
+        first = self.client.get('/api/history/')
+        self.assertEqual(len(first.json()), 2)
+
+        # update() sends no signals: the cached history is still served
+        DatasetSummary.objects.filter(pk=old_pk).update(uploaded_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(self.client.get('/api/history/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(retention.prune(), [old_pk])
+        response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(old_pk, [summary['id'] for summary in response.json()])
+        self.assertEqual(self.client.get(f'/api/datasets/{old_pk}/').status_code, 404)
@@ -3,9 +3,22 @@ URL patterns for the API app.
 
 Routes:
 - POST /api/upload/       -> upload CSV and get summary
-- GET  /api/history/      -> get last 5 datasets
-- GET  /api/report/<id>/  -> generate PDF report
+- POST /api/upload/summary/ -> store a summary computed by the client
+- POST /api/upload/batch/ -> upload many CSVs, or ZIP / tar archives of them
+- GET  /api/history/      -> newest datasets (settings.RETENTION MAX_COUNT)
+- GET  /api/report/<id>/  -> generate PDF report (?full=true for all rows)
 - POST /api/auth/login/   -> get auth token
+- GET  /api/jobs/<id>/    -> async upload job status
+- POST /api/uploads/      -> start a resumable upload
+- GET  /api/uploads/<id>/ -> resumable upload status (missing chunks)
+- PUT  /api/uploads/<id>/chunks/<index>/ -> send one chunk
+- POST /api/uploads/<id>/complete/      -> finish a resumable upload
+- GET  /api/aggregate/    -> combined statistics of several datasets
+- GET  /api/metrics/      -> request metrics (Prometheus text format)
+- GET  /api/datasets/<id>/        -> summary of one dataset
+- GET  /api/datasets/<id>/series/ -> downsampled columns for charts
+- GET  /api/datasets/<id>/rows/   -> filtered, sorted pages of raw rows
+- GET  /api/datasets/<id>/anomalies/ -> rows far from their Type's distribution
 """
 
 from django.urls import path
@@ -13,7 +26,20 @@ from . import views
 
 urlpatterns = [
     path('upload/', views.upload_csv, name='upload_csv'),
+    path('upload/summary/', views.upload_summary, name='upload_summary'),
+    path('upload/batch/', views.upload_batch, name='upload_batch'),
     path('history/', views.get_history, name='get_history'),
     path('report/<int:pk>/', views.generate_report, name='generate_report'),
     path('auth/login/', views.login_view, name='login'),
+    path('jobs/<uuid:pk>/', views.get_job, name='get_job'),
+    path('uploads/', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:pk>/', views.get_upload_session, name='get_upload_session'),
+    path('uploads/<uuid:pk>/chunks/<int:index>/', views.put_upload_chunk, name='put_upload_chunk'),
+    path('uploads/<uuid:pk>/complete/', views.complete_upload_session, name='complete_upload_session'),
+    path('aggregate/', views.get_aggregate, name='get_aggregate'),
+    path('metrics/', views.get_metrics, name='get_metrics'),
+    path('datasets/<int:pk>/', views.get_summary, name='get_summary'),
+    path('datasets/<int:pk>/series/', views.get_series, name='get_series'),
+    path('datasets/<int:pk>/rows/', views.get_rows, name='get_rows'),
+    path('datasets/<int:pk>/anomalies/', views.get_anomalies, name='get_anomalies'),
 ]
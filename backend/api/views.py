@@ -3,34 +3,68 @@ API Views for the Chemical Equipment Parameter Visualizer.
 
 Endpoints:
 1. POST /api/upload/     - Upload CSV, compute summary, store in DB
-2. GET  /api/history/    - Get last 5 uploaded datasets
-3. GET  /api/report/<id>/ - Generate PDF report for a dataset
+2. GET  /api/history/    - Get the newest datasets kept by the retention policy
+3. GET  /api/report/<id>/ - Generate PDF report for a dataset (?full=true for all rows)
 4. POST /api/auth/login/ - Simple token authentication
+5. GET  /api/jobs/<id>/  - Status of an async upload job
+6. GET  /api/aggregate/  - Combined statistics of several datasets
+7. GET  /api/metrics/    - Request metrics in Prometheus text format
+8. GET  /api/datasets/<id>/series/ - Downsampled numeric columns for charts
+9. GET  /api/datasets/<id>/rows/   - Filtered, sorted pages of raw rows
+10. GET /api/datasets/<id>/        - Summary of one dataset
+11. POST /api/upload/summary/      - Store a summary computed by the client
+12. POST /api/upload/batch/        - Upload many CSVs, or ZIP / tar archives of them
+13. POST /api/uploads/             - Start a resumable (chunked) upload
+14. GET  /api/uploads/<id>/        - Resumable upload status and missing chunks
+15. PUT  /api/uploads/<id>/chunks/<index>/ - Send one chunk of a resumable upload
+16. POST /api/uploads/<id>/complete/       - Finish a resumable upload
+17. GET  /api/datasets/<id>/anomalies/     - Values far from their Type's distribution
 """
 
-import json
-import pandas as pd
-from io import BytesIO
-
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from django.contrib.auth import authenticate
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+from .aggregate import AGGREGATE_FIELDS, aggregate_summaries
+from .anomalies import open_anomalies
+from .batch import BatchTooLargeError, ingest_batch
+from .dedup import body_upload, find_duplicate, upload_digest
+from .httpcache import cached_json_response
+from .ingest import (
+    CSV_SUFFIXES, InvalidRowsError, csv_suffix, ingest_error_message, open_csv, save_summary,
+    summarize_csv, summarize_file,
+)
+from .instrumentation import METRICS, add_bytes, is_enabled
+from .jobs import completed_job, fail_stale_jobs, submit_upload
+from .materialized import summaries_json, summary_json
+from .models import DatasetSummary, UploadJob, UploadSession
+from .preaggregated import InvalidSubmissionError, client_summary_fields, ingest_payload, parse_summary
+from .reports import get_report, report_key
+from .resumable import (
+    ChunkError, SessionClosedError, complete_session, create_session, ensure_parser, store_chunk,
+)
+from .retention import history_limit, schedule_prune
+from .rows import (
+    DEFAULT_LIMIT, MAX_LIMIT, SORT_KEYS, InvalidCursorError, RowQuery, schedule_index_build,
+)
+from .serializers import DatasetSummarySerializer, UploadJobSerializer, UploadSessionSerializer
+from .series import DEFAULT_POINTS, MAX_POINTS, METHODS, downsample_column
+from .stats import STATS_COLUMNS
 
-from .models import DatasetSummary
-from .serializers import DatasetSummarySerializer
 
+# Content types of a CSV file sent as the raw request body
+RAW_CSV_CONTENT_TYPES = ('text/csv', 'application/octet-stream')
 
-# Maximum number of datasets to keep in history
-MAX_HISTORY = 5
+# Content-Encodings accepted on a raw body, and the suffix each adds to its file name
+BODY_ENCODINGS = {'identity': '', 'gzip': '.gz'}
 
 
 @api_view(['POST'])
@@ -39,85 +73,354 @@ def upload_csv(request):
     """
     POST /api/upload/
     
-    Accept CSV file, parse with Pandas, compute summary, store in SQLite.
+    Accept CSV file, parse it with Pandas in chunks, compute summary, store in SQLite.
     Expected CSV columns: Equipment Name, Type, Flowrate, Pressure, Temperature
     
-    Returns: JSON summary of the uploaded data
-    """
-    # Check if file was uploaded
-    if 'file' not in request.FILES:
-        return Response(
-            {'error': 'No file uploaded. Use "file" field in multipart/form-data.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    Send async=true (query or form field) to process the file in the
+    background; the response is then 202 with a job to poll at /api/jobs/<id>/.
     
-    csv_file = request.FILES['file']
+    A file identical to a retained dataset is not parsed again: the new
+    dataset shares the stored rows of the existing one.
     
-    # Validate file extension
-    if not csv_file.name.endswith('.csv'):
-        return Response(
-            {'error': 'File must be a CSV file.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    The file may be compressed (.csv.gz, .csv.bz2, .csv.zst); it is
+    decompressed while it is parsed. It may also be sent as the raw
+    request body (Content-Type: text/csv, file name in ?name=), with
+    Content-Encoding: gzip if compressed.
     
-    try:
-        # Read CSV with Pandas
-        df = pd.read_csv(csv_file)
-        
-        # Validate required columns
-        required_columns = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+    Returns: JSON summary of the uploaded data
+    (400 with invalid_rows, by line number, if numeric columns hold
+    values that are not numbers)
+    """
+    encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    
+    media_type = request.content_type.split(';')[0].strip().lower()
+    if media_type in RAW_CSV_CONTENT_TYPES:
+        # Raw body: its form fields cannot be read, so options come from the query
+        if encoding not in BODY_ENCODINGS:
+            return Response(
+                {'error': f'Unsupported Content-Encoding: {encoding}.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        file_name = request.query_params.get('name', 'upload.csv') + BODY_ENCODINGS[encoding]
+        if csv_suffix(file_name) is None:
+            return Response(
+                {'error': 'File must be a CSV file.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        csv_file = body_upload(request, file_name)
+        run_async = str(request.query_params.get('async', '')).lower() in ('1', 'true')
+    else:
+        if encoding != 'identity':
+            return Response(
+                {'error': 'Content-Encoding is only supported for raw CSV request bodies.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
         
-        if missing_columns:
+        # Check if file was uploaded
+        if 'file' not in request.FILES:
             return Response(
-                {'error': f'Missing columns: {missing_columns}'},
+                {'error': 'No file uploaded. Use "file" field in multipart/form-data.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Compute summary statistics
-        total_count = len(df)
-        avg_flowrate = round(df['Flowrate'].mean(), 2)
-        avg_pressure = round(df['Pressure'].mean(), 2)
-        avg_temperature = round(df['Temperature'].mean(), 2)
+        csv_file = request.FILES['file']
         
-        # Count per Type (e.g., {"Pump": 5, "Valve": 3})
-        type_distribution = df['Type'].value_counts().to_dict()
+        # Validate file extension
+        if csv_suffix(csv_file.name) is None:
+            return Response(
+                {'error': 'File must be a CSV file (.csv, .csv.gz, .csv.bz2 or .csv.zst).'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Store original data for PDF report generation
-        original_data = df.to_dict(orient='records')
+        run_async = str(request.query_params.get('async', request.data.get('async', ''))).lower() in ('1', 'true')
+    
+    compression = CSV_SUFFIXES[csv_suffix(csv_file.name)]
+    add_bytes(csv_file.size)
+    
+    # Same bytes as a retained dataset: reuse its results (hashed on upload)
+    content_hash = upload_digest(request, 'file', csv_file)
+    duplicate = find_duplicate(content_hash)
+    if duplicate is not None:
+        schedule_prune()
+        if run_async:
+            return Response(
+                UploadJobSerializer(completed_job(csv_file, duplicate)).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+        serializer = DatasetSummarySerializer(duplicate)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    # Async mode: hand the file to the background workers and return a job
+    if run_async:
+        job = submit_upload(csv_file, content_hash)
+        return Response(
+            UploadJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    try:
+        # Read CSV in chunks and compute summary statistics
+        # (large uploads spooled to disk are parsed in parallel)
+        if hasattr(csv_file, 'temporary_file_path'):
+            fields = summarize_file(csv_file.temporary_file_path(), compression=compression)
+        else:
+            fields = summarize_csv(open_csv(csv_file, compression))
+        fields['content_hash'] = content_hash
         
         # Create new summary record
-        summary = DatasetSummary.objects.create(
-            total_count=total_count,
-            avg_flowrate=avg_flowrate,
-            avg_pressure=avg_pressure,
-            avg_temperature=avg_temperature,
-            type_distribution=json.dumps(type_distribution),
-            original_data=json.dumps(original_data),
-        )
+        summary = save_summary(fields)
+        schedule_index_build(summary.data_key)
         
-        # Keep only last 5 datasets (delete older ones)
-        all_summaries = DatasetSummary.objects.all()
-        if all_summaries.count() > MAX_HISTORY:
-            # Get IDs of records to keep (newest 5)
-            ids_to_keep = all_summaries[:MAX_HISTORY].values_list('id', flat=True)
-            # Delete older records
-            DatasetSummary.objects.exclude(id__in=ids_to_keep).delete()
+        # Apply the retention policy in the background
+        schedule_prune()
         
         # Return the summary
         serializer = DatasetSummarySerializer(summary)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
-    except pd.errors.EmptyDataError:
+    except Exception as e:
+        error = {'error': ingest_error_message(e)}
+        if isinstance(e, InvalidRowsError):
+            error['invalid_rows'] = e.rows
+        return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def upload_summary(request):
+    """
+    POST /api/upload/summary/
+    
+    Store a dataset that the client has summarized itself, so large
+    files need not be uploaded (see preaggregated.py for the format).
+    Send either JSON {"summary": {...}} or multipart/form-data with a
+    "summary" field (JSON text) and an optional "payload" .npz file of
+    the rows. With a payload, the rows are stored and the summary must
+    match them.
+    
+    Returns: JSON summary of the dataset, like /api/upload/
+    """
+    payload = request.FILES.get('payload')
+    try:
+        summary = parse_summary(request.data.get('summary'))
+        if payload is None:
+            fields = client_summary_fields(summary)
+        else:
+            add_bytes(payload.size)
+            fields = ingest_payload(payload, summary)
+    except InvalidSubmissionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    summary = save_summary(fields)
+    if summary.has_rows:
+        schedule_index_build(summary.data_key)
+    schedule_prune()
+    
+    serializer = DatasetSummarySerializer(summary)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def upload_batch(request):
+    """
+    POST /api/upload/batch/
+    
+    Upload many CSV files in one request: repeat the "files" field of
+    multipart/form-data, with CSV files and/or ZIP or tar(.gz) archives
+    of CSV files. Files are parsed concurrently and all datasets are
+    stored in one transaction (see batch.py).
+    
+    Returns: {'results': [...], 'created': n, 'failed': n}, one result
+    per CSV with its summary or error; 201 if every file was stored,
+    207 if only some were, 400 if none was
+    """
+    uploaded_files = request.FILES.getlist('files')
+    if not uploaded_files:
         return Response(
-            {'error': 'CSV file is empty.'},
+            {'error': 'No files uploaded. Use "files" fields in multipart/form-data.'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    except Exception as e:
+    
+    add_bytes(sum(f.size for f in uploaded_files))
+    try:
+        results = ingest_batch(uploaded_files)
+    except BatchTooLargeError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    created = 0
+    for result in results:
+        if 'summary' in result:
+            result['summary'] = DatasetSummarySerializer(result['summary']).data
+            created += 1
+    
+    # Apply the retention policy once for the whole batch
+    if created:
+        schedule_prune()
+    
+    if created == len(results):
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response(
+        {'results': results, 'created': created, 'failed': len(results) - created},
+        status=response_status
+    )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_job(request, pk):
+    """
+    GET /api/jobs/<id>/
+    
+    Return status and progress of an async upload job.
+    Once the job is done, includes the resulting dataset summary.
+    Jobs lost by a server restart are reported as failed.
+    """
+    fail_stale_jobs()
+    try:
+        job = UploadJob.objects.select_related('summary').get(pk=pk)
+    except UploadJob.DoesNotExist:
         return Response(
-            {'error': f'Error processing CSV: {str(e)}'},
+            {'error': 'Job not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    serializer = UploadJobSerializer(job)
+    return Response(serializer.data)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def create_upload_session(request):
+    """
+    POST /api/uploads/
+    
+    Start a resumable upload of a large CSV (see resumable.py).
+    Send file_name and file_size (bytes); the response gives the
+    chunk_size, chunk_count and the job that parses the chunks as they
+    arrive.
+    """
+    file_name = str(request.data.get('file_name', ''))
+    if csv_suffix(file_name) is None:
+        return Response(
+            {'error': 'file_name must be a CSV file (.csv, .csv.gz, .csv.bz2 or .csv.zst).'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        file_size = int(request.data.get('file_size'))
+    except (TypeError, ValueError):
+        file_size = 0
+    if file_size <= 0:
+        return Response(
+            {'error': 'file_size must be a positive number of bytes.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    session = create_session(file_name, file_size)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_upload_session(request, pk):
+    """
+    GET /api/uploads/<id>/
+    
+    Return a resumable upload with the indexes of its missing chunks,
+    so an interrupted client resends only those.
+    """
+    try:
+        session = UploadSession.objects.select_related('job__summary').get(pk=pk)
+    except UploadSession.DoesNotExist:
+        return Response(
+            {'error': 'Upload session not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    ensure_parser(session.job)
+    return Response(UploadSessionSerializer(session).data)
+
+
+@api_view(['PUT'])
+@permission_classes([AllowAny])
+def put_upload_chunk(request, pk, index):
+    """
+    PUT /api/uploads/<id>/chunks/<index>/
+    
+    Store one chunk of a resumable upload, sent as the raw body: bytes
+    [index * chunk_size, (index + 1) * chunk_size) of the file, with their
+    SHA-256 (hex) in the X-Chunk-SHA256 header.
+    
+    Returns 201 for a new chunk, 200 for one received before, and 409
+    once the upload has been processed.
+    """
+    checksum = request.headers.get('X-Chunk-SHA256')
+    if not checksum:
+        return Response(
+            {'error': 'Send the SHA-256 of the chunk in the X-Chunk-SHA256 header.'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    
+    try:
+        session = UploadSession.objects.select_related('job').get(pk=pk)
+    except UploadSession.DoesNotExist:
+        return Response(
+            {'error': 'Upload session not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    try:
+        created = store_chunk(session, index, request.stream, checksum)
+    except ChunkError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except SessionClosedError:
+        session.job.refresh_from_db()
+        return Response(
+            {'error': 'This upload has already been processed.', 'job': UploadJobSerializer(session.job).data},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    ensure_parser(session.job)
+    return Response(
+        {'index': index, 'stored': created},
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def complete_upload_session(request, pk):
+    """
+    POST /api/uploads/<id>/complete/
+    
+    Finish a resumable upload once every chunk has been sent.
+    Returns 202 with the job to poll at /api/jobs/<id>/, or 409 with the
+    missing chunk indexes.
+    """
+    try:
+        session = UploadSession.objects.select_related('job__summary').get(pk=pk)
+    except UploadSession.DoesNotExist:
+        return Response(
+            {'error': 'Upload session not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    missing = complete_session(session)
+    if missing:
+        return Response(
+            {'error': 'Some chunks have not been received.', 'missing': missing},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    return Response(UploadJobSerializer(session.job).data, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['GET'])
@@ -126,11 +429,39 @@ def get_history(request):
     """
     GET /api/history/
     
-    Return list of last 5 uploaded datasets with summary and timestamp.
+    Return list of the last uploaded datasets with summary and timestamp
+    (as many as RETENTION MAX_COUNT keeps, 5 by default).
+    Served from an in-process cache until a dataset is added or deleted;
+    send If-None-Match with the ETag to get a 304 when nothing changed.
+    The body is joined from the JSON stored with each dataset at upload.
     """
-    summaries = DatasetSummary.objects.all()[:MAX_HISTORY]
-    serializer = DatasetSummarySerializer(summaries, many=True)
-    return Response(serializer.data)
+    def load():
+        summaries = list(DatasetSummary.objects.materialized()[:history_limit()])
+        return summaries, summaries_json(summaries)
+    
+    return cached_json_response(request, 'history', load)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_summary(request, pk):
+    """
+    GET /api/datasets/<id>/
+    
+    Return the summary of one dataset (cached and conditional like
+    the history).
+    """
+    def load():
+        summary = DatasetSummary.objects.materialized().get(pk=pk)
+        return [summary], summary_json(summary)
+    
+    try:
+        return cached_json_response(request, f'summary:{pk}', load)
+    except DatasetSummary.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
 
 @api_view(['GET'])
@@ -139,8 +470,11 @@ def generate_report(request, pk):
     """
     GET /api/report/<id>/
     
-    Generate and return a PDF report for the selected dataset.
-    Uses ReportLab to create the PDF.
+    Return the PDF report for the selected dataset.
+    Reports are rendered once with ReportLab and cached on disk; repeat
+    downloads honor If-None-Match / If-Modified-Since with a 304.
+    
+    Add ?full=true for a report listing every row instead of the first 20.
     """
     try:
         summary = DatasetSummary.objects.get(pk=pk)
@@ -150,96 +484,311 @@ def generate_report(request, pk):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Create PDF in memory
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title
-    title = Paragraph(f"Chemical Equipment Report - Dataset #{summary.id}", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-    
-    # Upload timestamp
-    timestamp = Paragraph(f"Uploaded: {summary.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
-    elements.append(timestamp)
-    elements.append(Spacer(1, 20))
-    
-    # Summary statistics
-    summary_title = Paragraph("Summary Statistics", styles['Heading2'])
-    elements.append(summary_title)
-    
-    summary_data = [
-        ['Metric', 'Value'],
-        ['Total Equipment Count', str(summary.total_count)],
-        ['Average Flowrate', f"{summary.avg_flowrate:.2f}"],
-        ['Average Pressure', f"{summary.avg_pressure:.2f}"],
-        ['Average Temperature', f"{summary.avg_temperature:.2f}"],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[200, 150])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 20))
-    
-    # Type distribution
-    type_title = Paragraph("Equipment Type Distribution", styles['Heading2'])
-    elements.append(type_title)
-    
-    type_dist = summary.get_type_distribution()
-    type_data = [['Type', 'Count']] + [[k, str(v)] for k, v in type_dist.items()]
-    
-    type_table = Table(type_data, colWidths=[200, 150])
-    type_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(type_table)
-    elements.append(Spacer(1, 20))
-    
-    # Original data table (first 20 rows for brevity)
-    data_title = Paragraph("Equipment Data (First 20 rows)", styles['Heading2'])
-    elements.append(data_title)
-    
-    original_data = summary.get_original_data()[:20]
-    if original_data:
-        headers = list(original_data[0].keys())
-        data_rows = [headers] + [[str(row.get(h, '')) for h in headers] for row in original_data]
-        
-        data_table = Table(data_rows, colWidths=[100, 60, 60, 60, 80])
-        data_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.green),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(data_table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Return PDF response
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="report_dataset_{pk}.pdf"'
+    # Serve the cached report (rendered on first request)
+    full = str(request.query_params.get('full', '')).lower() in ('1', 'true')
+    etag = f'"{report_key(summary, full)}"'
+    last_modified = int(summary.uploaded_at.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    
+    # Streamed from the file on disk, never buffered in memory
+    filename = f'report_dataset_{pk}_full.pdf' if full else f'report_dataset_{pk}.pdf'
+    report = get_report(summary, full)
+    add_bytes(report.stat().st_size)
+    response = FileResponse(
+        open(report, 'rb'),
+        as_attachment=True,
+        filename=filename,
+        content_type='application/pdf',
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
     return response
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_aggregate(request):
+    """
+    GET /api/aggregate/
+    
+    Combine the stored statistics of several datasets without rescanning
+    their rows. Select datasets with either:
+    - ?ids=1,2,3                       (dataset ids)
+    - ?since=<datetime>&until=<datetime> (upload time window, ISO 8601)
+    With no parameters, all retained datasets are combined.
+    
+    Returns: summary-shaped JSON (counts, averages, type distribution,
+    per-column statistics) plus the ids that were combined
+    """
+    summaries = DatasetSummary.objects.only(*AGGREGATE_FIELDS)
+    
+    ids_param = request.query_params.get('ids')
+    if ids_param:
+        try:
+            ids = [int(i) for i in ids_param.split(',') if i.strip()]
+        except ValueError:
+            return Response(
+                {'error': 'ids must be a comma-separated list of dataset ids.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        summaries = summaries.filter(id__in=ids)
+        missing_ids = sorted(set(ids) - {s.id for s in summaries})
+        if missing_ids:
+            return Response(
+                {'error': f'Datasets not found: {missing_ids}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+    
+    for param, lookup in [('since', 'uploaded_at__gte'), ('until', 'uploaded_at__lte')]:
+        value = request.query_params.get(param)
+        if value:
+            moment = parse_datetime(value)
+            if moment is None:
+                return Response(
+                    {'error': f'{param} must be an ISO 8601 datetime.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            summaries = summaries.filter(**{lookup: moment})
+    
+    return Response(aggregate_summaries(summaries))
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_series(request, pk):
+    """
+    GET /api/datasets/<id>/series/
+    
+    Downsampled values of numeric columns across rows, for charting
+    large datasets with a few thousand points. Query parameters:
+    - column: Flowrate, Pressure and/or Temperature (comma-separated, default all)
+    - start, stop: row range (default all rows)
+    - points: point budget per column (default 2000, max 20000)
+    - method: lttb (default) or minmax
+    
+    Returns: {'series': {column: {'x': [row, ...], 'y': [value, ...]}}, ...}
+    """
+    try:
+        summary = DatasetSummary.objects.only('id', 'data_key').get(pk=pk)
+    except DatasetSummary.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not summary.has_rows:
+        return Response(
+            {'error': 'The rows of this dataset were not uploaded.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    columns = request.query_params.get('column', ','.join(STATS_COLUMNS)).split(',')
+    invalid_columns = [col for col in columns if col not in STATS_COLUMNS]
+    if invalid_columns:
+        return Response(
+            {'error': f'Unknown columns: {invalid_columns}. Use {STATS_COLUMNS}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    method = request.query_params.get('method', 'lttb')
+    if method not in METHODS:
+        return Response(
+            {'error': f'method must be one of {METHODS}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    reader = summary.open_data()
+    try:
+        points = int(request.query_params.get('points', DEFAULT_POINTS))
+        start = int(request.query_params.get('start', 0))
+        stop = int(request.query_params.get('stop', max(start, reader.row_count)))
+    except ValueError:
+        return Response(
+            {'error': 'points, start and stop must be integers.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 2 <= points <= MAX_POINTS or not 0 <= start <= stop:
+        return Response(
+            {'error': f'points must be 2-{MAX_POINTS} and 0 <= start <= stop.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    stop = min(stop, reader.row_count)
+    start = min(start, stop)
+    
+    return Response({
+        'dataset_id': summary.id,
+        'method': method,
+        'start': start,
+        'stop': stop,
+        'series': {
+            col: downsample_column(reader, col, start, stop, points, method)
+            for col in columns
+        },
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_rows(request, pk):
+    """
+    GET /api/datasets/<id>/rows/
+    
+    One page of the raw rows of a dataset. Query parameters:
+    - type: Type values to keep (comma-separated)
+    - flowrate_min, flowrate_max, pressure_min, ... : inclusive ranges
+    - sort: row (default), Flowrate, Pressure or Temperature; prefix
+      with - for descending
+    - limit: rows per page (default 100, max 1000)
+    - cursor: next_cursor of the previous page
+    
+    Returns: {'results': [row, ...], 'next_cursor': str or null}
+    """
+    try:
+        summary = DatasetSummary.objects.only('id', 'data_key').get(pk=pk)
+    except DatasetSummary.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not summary.has_rows:
+        return Response(
+            {'error': 'The rows of this dataset were not uploaded.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    params = request.query_params
+    sort = params.get('sort', 'row')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORT_KEYS:
+        return Response(
+            {'error': f'sort must be one of {SORT_KEYS} (- prefix for descending).'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        ranges = {}
+        for col in STATS_COLUMNS:
+            low = params.get(f'{col.lower()}_min')
+            high = params.get(f'{col.lower()}_max')
+            if low is not None or high is not None:
+                ranges[col] = (
+                    None if low is None else float(low),
+                    None if high is None else float(high),
+                )
+    except ValueError:
+        return Response(
+            {'error': 'limit and range bounds must be numbers.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 1 <= limit <= MAX_LIMIT:
+        return Response(
+            {'error': f'limit must be 1-{MAX_LIMIT}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    types = params.get('type')
+    try:
+        query = RowQuery(
+            summary.open_data(),
+            types=types.split(',') if types else None,
+            ranges=ranges,
+            sort=sort,
+            descending=descending,
+            limit=limit,
+            cursor=params.get('cursor'),
+        )
+    except InvalidCursorError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results, next_cursor = query.run()
+    return Response({
+        'dataset_id': summary.id,
+        'results': results,
+        'next_cursor': next_cursor,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_anomalies(request, pk):
+    """
+    GET /api/datasets/<id>/anomalies/
+    
+    Rows with a Flowrate, Pressure or Temperature far from the values of
+    their equipment Type (see anomalies.py), in row order. Query parameters:
+    - column: only rows flagged in these columns (comma-separated, default all)
+    - type: Type values to keep (comma-separated)
+    - limit: rows per page (default 100, max 1000)
+    - offset: rows to skip
+    
+    Returns: {'results': [row + {'anomalies': {column: z-score}}, ...],
+              'total': matching rows, 'counts': {column: flagged values},
+              'threshold': z-score limit, 'types': {type: {column: {'median', 'scale'}}}}
+    """
+    try:
+        summary = DatasetSummary.objects.only('id', 'data_key').get(pk=pk)
+    except DatasetSummary.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not summary.has_rows:
+        return Response(
+            {'error': 'The rows of this dataset were not uploaded.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    params = request.query_params
+    columns = params.get('column')
+    columns = columns.split(',') if columns else None
+    invalid_columns = [col for col in columns or [] if col not in STATS_COLUMNS]
+    if invalid_columns:
+        return Response(
+            {'error': f'Unknown columns: {invalid_columns}. Use {STATS_COLUMNS}.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+    except ValueError:
+        return Response(
+            {'error': 'limit and offset must be integers.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 1 <= limit <= MAX_LIMIT or offset < 0:
+        return Response(
+            {'error': f'limit must be 1-{MAX_LIMIT} and offset at least 0.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    types = params.get('type')
+    anomalies = open_anomalies(summary)
+    results, total = anomalies.page(
+        offset,
+        limit,
+        columns=columns,
+        types=types.split(',') if types else None,
+    )
+    return Response({
+        'dataset_id': summary.id,
+        'threshold': anomalies.threshold,
+        'counts': anomalies.counts(),
+        'types': anomalies.params,
+        'total': total,
+        'offset': offset,
+        'results': results,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
@@ -275,3 +824,25 @@ def login_view(request):
         'user_id': user.id,
         'username': user.username,
     })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_metrics(request):
+    """
+    GET /api/metrics/
+    
+    Request, phase, query and byte counters of this server process in
+    Prometheus text format. Only available when settings.INSTRUMENTATION
+    is enabled.
+    """
+    if not is_enabled():
+        return Response(
+            {'error': 'Instrumentation is disabled.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return HttpResponse(
+        METRICS.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
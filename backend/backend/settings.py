@@ -3,8 +3,12 @@ Django settings for Chemical Equipment Parameter Visualizer backend.
 MINIMAL configuration for the intern project.
 """
 
+import os
 from pathlib import Path
 
+import django
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key secret in production!
@@ -33,6 +37,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be at top
+    'api.instrumentation.InstrumentationMiddleware',  # No-op unless INSTRUMENTATION is enabled
+    'api.compression.CompressionMiddleware',  # gzip/brotli above COMPRESSION_MIN_BYTES
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this for static files
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,14 +69,121 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
-# Database - SQLite for simplicity
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database - SQLite for simplicity, tuned for several gunicorn workers
+# (see SQLITE_PRAGMAS). Set POSTGRES_DB (and POSTGRES_HOST, POSTGRES_PORT,
+# POSTGRES_USER, POSTGRES_PASSWORD) to use PostgreSQL instead; this
+# needs the psycopg package.
+# Connections are closed after every request unless DB_CONN_MAX_AGE is
+# set in the environment: production (gunicorn) can reuse them for that
+# many seconds, e.g. DB_CONN_MAX_AGE=60. Left at 0 for runserver and tests.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '0'))
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds to wait for another process's write lock before
+                # "database is locked" (SQLite's busy timeout)
+                'timeout': 30,
+            },
+        }
     }
+    if django.VERSION >= (5, 1):
+        # Take the write lock when a transaction starts, so that it
+        # waits for the lock instead of failing when it first writes
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# PRAGMAs run on every new SQLite connection (see api/signals.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # readers and the writer don't block each other
+    'synchronous': 'NORMAL',        # safe with WAL; fsync at checkpoints only
+    'mmap_size': 256 * 1024 * 1024,  # read the database through mmap
+}
+
+# Raw rows of uploaded datasets (columnar files, one directory per dataset)
+DATASET_STORAGE_DIR = BASE_DIR / 'datasets'
+
+# Rendered PDF reports, cached until their dataset is deleted
+REPORT_CACHE_DIR = BASE_DIR / 'reports'
+
+# Async uploads: spooled files and number of background workers per process
+UPLOAD_TMP_DIR = BASE_DIR / 'uploads'
+UPLOAD_JOB_WORKERS = 2
+
+# Seconds without progress after which a pending or running async upload
+# job is presumed lost (e.g. by a restart) and marked failed
+UPLOAD_JOB_STALE_AFTER = 60 * 60
+
+# Resumable uploads (see api/resumable.py): chunk size in bytes, the
+# seconds a session waits for its next chunk before it is abandoned, and
+# the number of sessions parsed at once per process
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TIMEOUT = 24 * 60 * 60
+UPLOAD_SESSION_WORKERS = 4
+
+# Parallel CSV parsing: worker processes per server process, and the
+# smallest file (in bytes) that is split across them
+INGEST_WORKERS = os.cpu_count() or 1
+PARALLEL_INGEST_MIN_BYTES = 64 * 1024 * 1024
+
+# Batch uploads: CSV files parsed concurrently per request, and the most
+# CSV files (archive members included) accepted in one batch
+BATCH_UPLOAD_WORKERS = 4
+MAX_BATCH_FILES = 100
+
+# Dataset retention, applied in the background after uploads and by
+# `manage.py prune_datasets` (None disables a limit)
+RETENTION = {
+    'MAX_COUNT': 5,
+    'MAX_AGE_DAYS': None,
+    'MAX_TOTAL_BYTES': None,
+    'BATCH_SIZE': 100,
+    'PRUNE_AFTER_UPLOAD': True,
+}
+
+# Outlier detection run at upload (see api/anomalies.py): values whose
+# robust z-score within their Type exceeds Z_THRESHOLD are flagged; Types
+# with fewer than MIN_TYPE_ROWS values in a column are not checked
+ANOMALY_DETECTION = {
+    'Z_THRESHOLD': 3.5,
+    'MIN_TYPE_ROWS': 10,
 }
 
+# Opt-in request instrumentation: Server-Timing headers, /api/metrics/
+# and cProfile stats for a sampled fraction of requests
+INSTRUMENTATION = {
+    'ENABLED': os.environ.get('API_INSTRUMENTATION', '') == '1',
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('API_PROFILE_SAMPLE_RATE', '0')),
+    'PROFILE_DIR': BASE_DIR / 'profiles',
+}
+
+# Uploads are hashed as they stream in, for deduplication (see api/dedup.py)
+FILE_UPLOAD_HANDLERS = [
+    'api.dedup.HashingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Responses at least this large are compressed (brotli if installed, else gzip)
+COMPRESSION_MIN_BYTES = 1024
+
 # Password validation (minimal for dev)
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -93,6 +206,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS settings - Allow React frontend
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
+CORS_ALLOW_HEADERS = (*default_headers, 'x-chunk-sha256')  # resumable upload chunks
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -0,0 +1,9 @@
+"""
+Performance benchmarks for the backend.
+
+Run from the backend directory, e.g.:
+    python -m benchmarks.parallel_ingest --rows 5000000
+
+benchmarks.harness runs the upload, history and report endpoints at
+several dataset sizes and compares the results with a stored baseline.
+"""
@@ -0,0 +1,38 @@
+"""
+Synthetic equipment CSVs for benchmarks.
+
+Columns: Equipment Name, Type, Flowrate, Pressure, Temperature
+"""
+
+import numpy as np
+import pandas as pd
+
+
+TYPES = ['Pump', 'Valve', 'Compressor', 'Heat Exchanger', 'Reactor', 'Condenser']
+
+# Rows generated and written at a time
+BLOCK_SIZE = 500_000
+
+
+def write_equipment_csv(path, rows, seed=0, extra_columns=0):
+    """
+    Write a CSV with the given number of random equipment rows.
+    extra_columns adds that many free-text columns (Note 1, Note 2, ...)
+    that ingestion does not use, like a historian export would have.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as f:
+        for start in range(0, rows, BLOCK_SIZE):
+            n = min(BLOCK_SIZE, rows - start)
+            types = rng.choice(TYPES, size=n)
+            block = pd.DataFrame({
+                'Equipment Name': [f'EQ-{i:08d}' for i in range(start, start + n)],
+                'Type': types,
+                'Flowrate': rng.uniform(0, 300, n).round(1),
+                'Pressure': rng.uniform(1, 50, n).round(1),
+                'Temperature': rng.uniform(20, 200, n).round(1),
+            })
+            for i in range(1, extra_columns + 1):
+                block[f'Note {i}'] = [f'inspected {d} days ago' for d in rng.integers(0, 365, n)]
+            block.to_csv(f, index=False, header=(start == 0))
+    return path
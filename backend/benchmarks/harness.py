@@ -0,0 +1,240 @@
+"""
+Benchmark harness for the upload, history and report endpoints.
+
+For every dataset size it generates a synthetic equipment CSV and drives
+the API through Django's test client against a throw-away database and
+storage directory:
+- upload       POST /api/upload/ with the CSV
+- history      GET  /api/history/ (median of --repeat requests)
+- report       GET  /api/report/<id>/ with an empty report cache
+- report_cached GET /api/report/<id>/ again
+- report_full  GET  /api/report/<id>/?full=true (up to --full-report-max-rows)
+- rows         GET  /api/datasets/<id>/rows/ (filtered, sorted page of 100)
+
+Wall time, peak RSS and database query count of each operation are
+written to a JSON results file. With --baseline the run is compared to
+an earlier results file, and the exit status is 1 if any operation got
+slower or bigger by more than --tolerance, or ran more queries.
+
+    python -m benchmarks.harness --sizes 1k,100k,1M --output results.json
+    python -m benchmarks.harness --sizes 1k,100k,1M --baseline results.json
+
+Peak RSS is reset before every operation where Linux allows it
+(/proc/self/clear_refs); elsewhere it is the process high-water mark.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+
+
+SIZE_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+# Differences below these are noise, whatever the tolerance
+MIN_TIME_DELTA = 0.005
+MIN_RSS_DELTA_MB = 5
+
+
+def parse_size(text):
+    """'1k' -> 1000, '10M' -> 10000000, '500' -> 500."""
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark, if the platform allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def measure(operation):
+    """Run operation() once: (result, {'seconds', 'peak_rss_mb', 'queries'})."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    reset_peak_rss()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = operation()
+        elapsed = time.perf_counter() - start
+    return result, {
+        'seconds': round(elapsed, 6),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'queries': len(queries),
+    }
+
+
+def read_response(response):
+    """Consume a (possibly streaming) response body and check its status."""
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+    if response.streaming:
+        body = b''.join(response.streaming_content)
+        response.close()
+        return body
+    return response.content
+
+
+def run_size(client, path, rows, args):
+    """Benchmark every operation for one CSV; returns {operation: metrics}."""
+    from api.models import DatasetSummary
+    from api.reports import evict_reports
+    from api.rows import build_indexes
+
+    results = {}
+
+    def upload():
+        with open(path, 'rb') as f:
+            response = client.post('/api/upload/', {'file': f})
+        read_response(response)
+        return response.json()['id']
+
+    dataset_id, results['upload'] = measure(upload)
+
+    history = [measure(lambda: read_response(client.get('/api/history/')))[1]
+               for _ in range(args.repeat)]
+    results['history'] = {
+        'seconds': round(statistics.median(m['seconds'] for m in history), 6),
+        'peak_rss_mb': max(m['peak_rss_mb'] for m in history),
+        'queries': max(m['queries'] for m in history),
+    }
+
+    evict_reports(dataset_id)
+    report_url = f'/api/report/{dataset_id}/'
+    _, results['report'] = measure(lambda: read_response(client.get(report_url)))
+    _, results['report_cached'] = measure(lambda: read_response(client.get(report_url)))
+    if rows <= args.full_report_max_rows:
+        _, results['report_full'] = measure(
+            lambda: read_response(client.get(report_url, {'full': 'true'})))
+
+    # Indexes are normally built in the background after the upload
+    build_indexes(DatasetSummary.objects.get(pk=dataset_id).data_key)
+    rows_url = f'/api/datasets/{dataset_id}/rows/'
+    rows_params = {'type': 'Pump', 'flowrate_min': 100, 'sort': '-Temperature'}
+    _, results['rows'] = measure(lambda: read_response(client.get(rows_url, rows_params)))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison with a baseline run; returns the regressions."""
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            print(f'{key:<28} (not in baseline)')
+            continue
+        problems = []
+        if (metrics['seconds'] > base['seconds'] * (1 + tolerance)
+                and metrics['seconds'] - base['seconds'] > MIN_TIME_DELTA):
+            problems.append(f"time {base['seconds']:.3f}s -> {metrics['seconds']:.3f}s")
+        if (metrics['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance)
+                and metrics['peak_rss_mb'] - base['peak_rss_mb'] > MIN_RSS_DELTA_MB):
+            problems.append(f"RSS {base['peak_rss_mb']:.0f} -> {metrics['peak_rss_mb']:.0f} MB")
+        if metrics['queries'] > base['queries']:
+            problems.append(f"queries {base['queries']} -> {metrics['queries']}")
+        change = metrics['seconds'] / base['seconds'] - 1 if base['seconds'] else 0.0
+        print(f'{key:<28} {change:+7.1%}  {"REGRESSION: " + ", ".join(problems) if problems else "ok"}')
+        if problems:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1k,10k,100k',
+                        help='comma-separated row counts, e.g. 1k,100k,1M,10M')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown / RSS growth (default 0.2)')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='history requests per size (the median is recorded)')
+    parser.add_argument('--full-report-max-rows', type=int, default=100_000)
+    args = parser.parse_args()
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from benchmarks.datagen import write_equipment_csv
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATASET_STORAGE_DIR = os.path.join(tmp, 'datasets')
+        settings.REPORT_CACHE_DIR = os.path.join(tmp, 'reports')
+        settings.UPLOAD_TMP_DIR = os.path.join(tmp, 'uploads')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0)
+        client = Client()
+
+        for rows in sizes:
+            path = os.path.join(tmp, f'equipment_{rows}.csv')
+            write_equipment_csv(path, rows)
+            for operation, metrics in run_size(client, path, rows, args).items():
+                key = f'{operation}/{rows}'
+                results[key] = metrics
+                print(f"{key:<28} {metrics['seconds']:9.3f}s  "
+                      f"{metrics['peak_rss_mb']:7.0f} MB  {metrics['queries']:3d} queries")
+            os.remove(path)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) against {args.baseline}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: history latency with and without the materialized summary JSON.
+
+Uploads --datasets synthetic CSVs with --types equipment types each (more
+types make larger per-Type column statistics), then times GET
+/api/history/ two ways, calling the views directly:
+- serializer:   the summaries are loaded and rendered with
+                DatasetSummarySerializer on every request (the old path)
+- materialized: the JSON stored with each dataset at upload is joined
+                (the current view, see api/materialized.py)
+
+The in-process response cache is cleared before every request, so each
+one does the full work of a cache miss. Prints p50 / p99 latency.
+
+    python -m benchmarks.history_latency --types 50 --requests 2000
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import django
+import numpy as np
+import pandas as pd
+
+
+def write_csv(path, rows, types, seed):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'Equipment Name': [f'EQ-{i:06d}' for i in range(rows)],
+        'Type': rng.choice([f'Type {i:03d}' for i in range(types)], size=rows),
+        'Flowrate': rng.uniform(0, 300, rows).round(1),
+        'Pressure': rng.uniform(1, 50, rows).round(1),
+        'Temperature': rng.uniform(20, 200, rows).round(1),
+    }).to_csv(path, index=False)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--datasets', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--types', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client, RequestFactory
+    from django.test.utils import setup_test_environment
+    from rest_framework.decorators import api_view, permission_classes
+    from rest_framework.permissions import AllowAny
+
+    from api import httpcache, views
+    from api.models import DatasetSummary
+    from api.retention import history_limit
+    from api.serializers import DatasetSummarySerializer
+
+    @api_view(['GET'])
+    @permission_classes([AllowAny])
+    def serializer_history(request):
+        def load():
+            summaries = list(DatasetSummary.objects.summaries()[:history_limit()])
+            return summaries, DatasetSummarySerializer(summaries, many=True).data
+        return httpcache.cached_json_response(request, 'history', load)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATASET_STORAGE_DIR = os.path.join(tmp, 'datasets')
+        settings.REPORT_CACHE_DIR = os.path.join(tmp, 'reports')
+        settings.UPLOAD_TMP_DIR = os.path.join(tmp, 'uploads')
+        settings.RETENTION = {**settings.RETENTION, 'PRUNE_AFTER_UPLOAD': False}
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0)
+        client = Client()
+        for i in range(args.datasets):
+            path = os.path.join(tmp, f'equipment_{i}.csv')
+            write_csv(path, args.rows, args.types, seed=i)
+            with open(path, 'rb') as f:
+                response = client.post('/api/upload/', {'file': f})
+            if response.status_code != 201:
+                raise RuntimeError(f'upload failed: {response.content[:200]!r}')
+
+        factory = RequestFactory()
+        print(f'{args.datasets} datasets, {args.types} types, {args.requests} requests each')
+        bodies = {}
+        for name, view in [('serializer', serializer_history), ('materialized', views.get_history)]:
+            latencies = []
+            for _ in range(args.requests):
+                httpcache._cache.clear()
+                request = factory.get('/api/history/')
+                start = time.perf_counter()
+                response = view(request)
+                latencies.append((time.perf_counter() - start) * 1000)
+            bodies[name] = response.content
+            print(f'{name:<13} p50 {percentile(latencies, 50):7.3f} ms  '
+                  f'p99 {percentile(latencies, 99):7.3f} ms  '
+                  f'mean {statistics.mean(latencies):7.3f} ms  {len(response.content)} bytes')
+        print('responses identical:', bodies['serializer'] == bodies['materialized'])
+
+
+if __name__ == '__main__':
+    main()
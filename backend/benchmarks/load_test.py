@@ -0,0 +1,129 @@
+"""
+Load test: upload and history throughput under parallel clients.
+
+Runs N client threads against a running server for a fixed time. Each
+client loops, uploading a small unique CSV (--upload-ratio of the
+requests) or fetching the history. Prints requests per second, latency
+percentiles and errors per request type, for every client count.
+
+Start the server the way it runs in production first, e.g.:
+    gunicorn backend.wsgi -w 4 -b 127.0.0.1:8000
+    python -m benchmarks.load_test --clients 1,4,16 --duration 20
+
+No Django setup is needed; requests are sent with urllib.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from benchmarks.datagen import write_equipment_csv
+
+
+def multipart_body(file_name, content):
+    """Encode a single 'file' field as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+        'Content-Type: text/csv\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Client(threading.Thread):
+    """One client: sends requests until the deadline and records latencies."""
+
+    def __init__(self, base_url, csv_body, upload_ratio, deadline, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.header, self.rows = csv_body.split(b'\n', 1)
+        self.upload_ratio = upload_ratio
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def request(self, kind):
+        if kind == 'upload':
+            # A unique first row, so uploads are never deduplicated
+            content = self.header + f'\nLOAD-{uuid.uuid4().hex},Pump,1,1,1\n'.encode() + self.rows
+            body, content_type = multipart_body('load.csv', content)
+            return urllib.request.Request(f'{self.base_url}/upload/', data=body,
+                                          headers={'Content-Type': content_type})
+        return urllib.request.Request(f'{self.base_url}/history/')
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            kind = 'upload' if self.random.random() < self.upload_ratio else 'history'
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(self.request(kind), timeout=120) as response:
+                    response.read()
+                self.latencies[kind].append(time.perf_counter() - start)
+            except urllib.error.HTTPError as e:
+                body = e.read().decode(errors='replace')
+                reason = 'database is locked' if 'database is locked' in body else f'HTTP {e.code}'
+                self.errors[kind][reason] += 1
+            except OSError as e:
+                self.errors[kind][type(e).__name__] += 1
+
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100)[p - 1] if len(values) > 1 else values[0]
+
+
+def run(base_url, clients, duration, csv_body, upload_ratio):
+    deadline = time.monotonic() + duration
+    threads = [Client(base_url, csv_body, upload_ratio, deadline, seed=i)
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for kind in ['upload', 'history']:
+        latencies = [x for t in threads for x in t.latencies[kind]]
+        errors = defaultdict(int)
+        for t in threads:
+            for reason, n in t.errors[kind].items():
+                errors[reason] += n
+        error_text = ', '.join(f'{n} {reason}' for reason, n in errors.items()) or 'no errors'
+        if latencies:
+            print(f'clients={clients:<3} {kind:<8} {len(latencies) / duration:8.1f} req/s  '
+                  f'p50 {percentile(latencies, 50) * 1000:7.1f} ms  '
+                  f'p95 {percentile(latencies, 95) * 1000:7.1f} ms  {error_text}')
+        else:
+            print(f'clients={clients:<3} {kind:<8} no successful requests  {error_text}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api')
+    parser.add_argument('--clients', default='1,4,16', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per client count')
+    parser.add_argument('--rows', type=int, default=1000, help='rows per uploaded CSV')
+    parser.add_argument('--upload-ratio', type=float, default=0.2,
+                        help='fraction of requests that are uploads')
+    args = parser.parse_args()
+
+    # The CSV is generated once; every upload changes its first row
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_equipment_csv(os.path.join(tmp, 'load.csv'), args.rows)
+        with open(path, 'rb') as f:
+            csv_body = f.read()
+
+    for clients in [int(n) for n in args.clients.split(',')]:
+        run(args.url, clients, args.duration, csv_body, args.upload_ratio)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: parallel CSV ingestion scaling.
+
+Parses the same synthetic CSV with 1, 2, 4, ... worker processes (up to
+the core count) and prints wall time and speedup over a serial parse.
+
+    python -m benchmarks.parallel_ingest --rows 5000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.conf import settings
+    from api import ingest
+    from api.storage import delete_dataset
+    from benchmarks.datagen import write_equipment_csv
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATASET_STORAGE_DIR = os.path.join(tmp, 'datasets')
+        path = write_equipment_csv(os.path.join(tmp, 'equipment.csv'), args.rows)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f'{args.rows} rows, {size_mb:.0f} MB')
+
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= args.max_workers:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != args.max_workers:
+            worker_counts.append(args.max_workers)
+
+        serial_time = None
+        for workers in worker_counts:
+            settings.INGEST_WORKERS = workers
+            ingest._process_pool = None
+            if workers > 1:
+                # Start the pool up front so process spawn time is not measured
+                list(ingest.get_process_pool().map(abs, range(workers)))
+
+            start = time.perf_counter()
+            if workers == 1:
+                with open(path, 'rb') as f:
+                    fields = ingest.summarize_csv(f)
+            else:
+                fields = ingest.summarize_csv_parallel(path, workers)
+            elapsed = time.perf_counter() - start
+            delete_dataset(fields['data_key'])
+
+            serial_time = serial_time or elapsed
+            print(f'workers={workers:<3} {elapsed:7.2f}s  {size_mb / elapsed:7.1f} MB/s  '
+                  f'speedup {serial_time / elapsed:.2f}x')
+            if ingest._process_pool is not None:
+                ingest._process_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,80 @@
 """
 Chemical Equipment Parameter Visualizer - Desktop Application
 Simple, clean PyQt5 interface
+
+All requests run in the background (see network.py), so the window
+stays responsive during large uploads and downloads.
 """
 
+import gzip
+import os
 import sys
-import requests
+import tempfile
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QFileDialog, QListWidget, QMessageBox, QGridLayout
+    QPushButton, QLabel, QFileDialog, QListWidget, QMessageBox, QGridLayout,
+    QProgressBar, QCheckBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+import network
+import preaggregate
+
 
 API_BASE = 'http://127.0.0.1:8000/api'
+JOB_POLL_INTERVAL_MS = 1000
+SERIES_POINTS = 1500  # points per column requested for the series plot
+SERIES_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+PROGRESS_STEPS = 1000  # resolution of the transfer progress bar
+COMPRESS_LEVEL = 6     # gzip level for "Compress before sending"
+CSV_FILTER = 'CSV Files (*.csv *.csv.gz *.csv.bz2 *.csv.zst)'
+COMPRESSED_SUFFIXES = ('.csv.gz', '.csv.bz2', '.csv.zst')
+ASYNC_MIN_BYTES = 8 * 1024 * 1024       # larger files are processed as async jobs
+RESUMABLE_MIN_BYTES = 64 * 1024 * 1024  # larger files are sent in resumable chunks
+
+
+def fetch_series(task, dataset_id):
+    """Runs in the background: the downsampled series of a dataset."""
+    response = network.get(task, f'{API_BASE}/datasets/{dataset_id}/series/',
+                           params={'points': SERIES_POINTS})
+    return dataset_id, response
+
+
+def upload_preaggregated(task, file_path, with_rows):
+    """Runs in the background: summarize a CSV locally, then upload the summary."""
+    with tempfile.TemporaryDirectory() as tmp:
+        payload_path = os.path.join(tmp, 'payload.npz') if with_rows else None
+        summary = preaggregate.run_in_process(file_path, payload_path, progress=task.report)
+        return network.upload_summary(task, f'{API_BASE}/upload/summary/', summary, payload_path)
+
+
+def upload_csv(task, file_path):
+    """
+    Runs in the background: upload a CSV. Small files are summarized in
+    the request, larger ones become an async job (the largest are sent
+    in resumable chunks).
+    """
+    size = os.path.getsize(file_path)
+    if size >= RESUMABLE_MIN_BYTES:
+        return network.upload_resumable(task, f'{API_BASE}/uploads/', file_path)
+    fields = {'async': 'true'} if size >= ASYNC_MIN_BYTES else {}
+    return network.upload_file(task, f'{API_BASE}/upload/', file_path, fields)
+
+
+def upload_compressed(task, file_path):
+    """Runs in the background: gzip a CSV to a temporary file, then upload it."""
+    size = os.path.getsize(file_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        gz_path = os.path.join(tmp, os.path.basename(file_path) + '.gz')
+        with open(file_path, 'rb') as src, gzip.open(gz_path, 'wb', compresslevel=COMPRESS_LEVEL) as dst:
+            while chunk := src.read(network.CHUNK_SIZE):
+                dst.write(chunk)
+                task.report(src.tell(), size)
+        return upload_csv(task, gz_path)
 
 
 class ChartCanvas(FigureCanvas):
@@ -53,12 +111,47 @@ class ChartCanvas(FigureCanvas):
         self.draw()
 
 
+class SeriesCanvas(FigureCanvas):
+    """Numeric columns across rows, downsampled by the server."""
+    
+    def __init__(self, parent=None):
+        self.figure = Figure(figsize=(8, 4), facecolor='white')
+        self.axes = self.figure.subplots(len(SERIES_COLUMNS), 1, sharex=True)
+        super().__init__(self.figure)
+        self.setParent(parent)
+        self.axes[0].set_title('Upload CSV to see values by row')
+    
+    def update_series(self, series):
+        colors = ['#667eea', '#764ba2', '#28a745']
+        for ax, col, color in zip(self.axes, SERIES_COLUMNS, colors):
+            ax.clear()
+            points = series.get(col)
+            if points:
+                ax.plot(points['x'], points['y'], color=color, linewidth=0.8)
+            ax.set_ylabel(col, fontsize=9)
+        self.axes[0].set_title('Values by Row', fontsize=12, fontweight='bold')
+        self.axes[-1].set_xlabel('Row', fontsize=10)
+        self.figure.tight_layout()
+        self.draw()
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Equipment Data Analyzer')
         self.setMinimumSize(1400, 800)
         self.current_summary = None
+        self.current_job_id = None
+        self.transfer = None    # running upload or download (a network.Task)
+        self.polling = False    # a job status request is in flight
+        # ETag of the shown history; the server answers 304 while unchanged
+        self.history_etag = None
+        
+        # Polls the status of an async upload job
+        self.job_timer = QTimer(self)
+        self.job_timer.setInterval(JOB_POLL_INTERVAL_MS)
+        self.job_timer.timeout.connect(self.poll_job)
+        
         self.setup_ui()
         self.load_history()
     
@@ -106,12 +199,38 @@ class MainWindow(QMainWindow):
         self.upload_btn.clicked.connect(self.upload_file)
         left_layout.addWidget(self.upload_btn)
         
+        # Local mode: parse the CSV here and upload only its summary
+        self.local_check = QCheckBox('Summarize on this computer')
+        self.local_check.setToolTip('Parse large files locally and upload only the summary')
+        self.rows_check = QCheckBox('Also upload rows (compressed)')
+        self.rows_check.setToolTip('Needed for reports with rows, charts by row and row queries')
+        self.rows_check.setChecked(True)
+        self.rows_check.setEnabled(False)
+        self.local_check.toggled.connect(self.rows_check.setEnabled)
+        self.compress_check = QCheckBox('Compress before sending')
+        self.compress_check.setToolTip('Gzip the file first; faster on slow connections')
+        self.local_check.toggled.connect(self.compress_check.setDisabled)
+        left_layout.addWidget(self.local_check)
+        left_layout.addWidget(self.rows_check)
+        left_layout.addWidget(self.compress_check)
+        
         # Status
         self.status = QLabel('Ready to upload')
         self.status.setAlignment(Qt.AlignCenter)
         self.status.setStyleSheet('color: #666; font-size: 11px; padding: 5px;')
         left_layout.addWidget(self.status)
         
+        # Transfer progress and cancel (shown during uploads and downloads)
+        self.progress = QProgressBar()
+        self.progress.setRange(0, PROGRESS_STEPS)
+        self.progress.setVisible(False)
+        left_layout.addWidget(self.progress)
+        
+        self.cancel_btn = QPushButton('Cancel')
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.clicked.connect(self.cancel_transfer)
+        left_layout.addWidget(self.cancel_btn)
+        
         # History
         history_label = QLabel('Recent Uploads')
         history_label.setStyleSheet('color: #2c2c2c; font-size: 13px; font-weight: bold; padding: 10px 0;')
@@ -204,43 +323,163 @@ class MainWindow(QMainWindow):
         # Chart (takes exactly half the height)
         chart_container = QWidget()
         chart_container.setStyleSheet('background: white; border-radius: 8px; padding: 15px;')
-        chart_layout = QVBoxLayout(chart_container)
+        chart_layout = QHBoxLayout(chart_container)
         chart_layout.setContentsMargins(0, 0, 0, 0)
         
         self.chart = ChartCanvas()
         chart_layout.addWidget(self.chart)
+        
+        self.series_chart = SeriesCanvas()
+        chart_layout.addWidget(self.series_chart)
         right_layout.addWidget(chart_container, stretch=1)
         
         content_layout.addWidget(right, stretch=1)
         main_layout.addWidget(content)
     
     def upload_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, 'Select CSV', '', 'CSV Files (*.csv)')
+        file_path, _ = QFileDialog.getOpenFileName(self, 'Select CSV', '', CSV_FILTER)
         if not file_path:
             return
+        compressed = file_path.lower().endswith(COMPRESSED_SUFFIXES)
         
-        self.status.setText('Uploading...')
-        self.upload_btn.setEnabled(False)
+        if self.local_check.isChecked():
+            if compressed:
+                self.status.setText('❌ Local summaries need an uncompressed CSV file')
+                return
+            self.start_transfer('Summarizing locally...', upload_preaggregated, file_path,
+                                self.rows_check.isChecked(), on_done=self.on_summary_uploaded)
+            return
         
+        # Large files: the server returns a job that we poll for the result
+        if self.compress_check.isChecked() and not compressed:
+            self.start_transfer('Compressing and uploading...', upload_compressed, file_path,
+                                on_done=self.on_uploaded)
+            return
+        self.start_transfer('Uploading...', upload_csv, file_path, on_done=self.on_uploaded)
+    
+    def on_uploaded(self, response):
+        self.end_transfer()
         try:
-            with open(file_path, 'rb') as f:
-                response = requests.post(f'{API_BASE}/upload/', files={'file': f})
-            
             if response.status_code == 201:
-                data = response.json()
-                self.current_summary = data
-                self.update_display(data)
+                self.current_summary = response.json()
+                self.update_display(self.current_summary)
                 self.status.setText('✅ Upload successful!')
                 self.load_history()
-            else:
-                error = response.json().get('error', 'Upload failed')
-                self.status.setText(f'❌ {error}')
-                QMessageBox.warning(self, 'Error', error)
-        except Exception as e:
-            self.status.setText(f'❌ Error')
-            QMessageBox.critical(self, 'Error', str(e))
-        finally:
-            self.upload_btn.setEnabled(True)
+                return
+            if response.status_code == 202:
+                self.current_job_id = response.json()['id']
+                self.upload_btn.setEnabled(False)
+                self.status.setText('Processing...')
+                self.job_timer.start()
+                return
+            error = response.json().get('error', 'Upload failed')
+        except ValueError:
+            error = f'Upload failed (HTTP {response.status_code})'
+        self.status.setText(f'❌ {error}')
+        QMessageBox.warning(self, 'Error', error)
+    
+    def on_summary_uploaded(self, response):
+        self.end_transfer()
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'error': f'Upload failed (HTTP {response.status_code})'}
+        if response.status_code != 201:
+            error = data.get('error', 'Upload failed')
+            self.status.setText(f'❌ {error}')
+            QMessageBox.warning(self, 'Error', error)
+            return
+        self.current_summary = data
+        self.update_display(data)
+        self.status.setText('✅ Summary uploaded!')
+        self.load_history()
+    
+    def start_transfer(self, text, fn, *args, on_done):
+        """Run an upload or download in the background, with progress and cancel."""
+        self.status.setText(text)
+        self.upload_btn.setEnabled(False)
+        self.download_btn.setEnabled(False)
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.cancel_btn.setVisible(True)
+        self.transfer = network.start(
+            fn, *args, on_done=on_done, on_error=self.on_transfer_error,
+            on_progress=self.on_transfer_progress, on_cancel=self.on_transfer_cancelled)
+    
+    def end_transfer(self):
+        self.transfer = None
+        self.progress.setVisible(False)
+        self.cancel_btn.setVisible(False)
+        self.upload_btn.setEnabled(self.current_job_id is None)
+        self.download_btn.setEnabled(self.current_summary is not None)
+    
+    def cancel_transfer(self):
+        if self.transfer:
+            self.transfer.cancel()
+            self.status.setText('Cancelling...')
+    
+    def on_transfer_progress(self, done, total):
+        if total:
+            self.progress.setRange(0, PROGRESS_STEPS)
+            self.progress.setValue(int(done * PROGRESS_STEPS / total))
+        else:
+            self.progress.setRange(0, 0)  # size unknown: busy indicator
+    
+    def on_transfer_error(self, error):
+        self.end_transfer()
+        self.status.setText('❌ Error')
+        QMessageBox.critical(self, 'Error', error)
+    
+    def on_transfer_cancelled(self):
+        self.end_transfer()
+        self.status.setText('Cancelled')
+    
+    def poll_job(self):
+        # Skip a tick while the previous request is still running
+        if self.polling:
+            return
+        self.polling = True
+        network.start(network.get, f'{API_BASE}/jobs/{self.current_job_id}/',
+                      on_done=self.on_job_status, on_error=self.on_job_error)
+    
+    def on_job_error(self, error):
+        self.polling = False
+        if self.current_job_id is None:
+            return
+        self.finish_job()
+        self.status.setText('❌ Error')
+        QMessageBox.critical(self, 'Error', error)
+    
+    def on_job_status(self, response):
+        self.polling = False
+        if self.current_job_id is None:
+            return  # finished while the request was in flight
+        try:
+            job = response.json()
+            if response.status_code != 200:
+                raise ValueError(job.get('error', 'Upload failed'))
+        except ValueError as e:
+            self.on_job_error(str(e))
+            return
+        
+        if job['status'] == 'done':
+            self.finish_job()
+            self.current_summary = job['summary']
+            self.update_display(job['summary'])
+            self.status.setText('✅ Upload successful!')
+            self.load_history()
+        elif job['status'] == 'failed':
+            self.finish_job()
+            error = job.get('error') or 'Upload failed'
+            self.status.setText(f'❌ {error}')
+            QMessageBox.warning(self, 'Error', error)
+        else:
+            self.status.setText(f"Processing... {job.get('progress', 0) * 100:.0f}%")
+    
+    def finish_job(self):
+        self.job_timer.stop()
+        self.current_job_id = None
+        self.upload_btn.setEnabled(self.transfer is None)
     
     def update_display(self, data):
         self.stat_labels['total_count'].setText(str(data.get('total_count', '--')))
@@ -248,18 +487,38 @@ class MainWindow(QMainWindow):
         self.stat_labels['avg_pressure'].setText(f"{data.get('avg_pressure', 0):.2f}")
         self.stat_labels['avg_temperature'].setText(f"{data.get('avg_temperature', 0):.2f}")
         self.chart.update_chart(data.get('type_distribution', {}))
-        self.download_btn.setEnabled(True)
+        self.load_series(data.get('id'))
+        self.download_btn.setEnabled(self.transfer is None)
+    
+    def load_series(self, dataset_id):
+        # The server downsamples each column, so this stays small for any dataset size
+        network.start(fetch_series, dataset_id, on_done=self.on_series)
+    
+    def on_series(self, result):
+        dataset_id, response = result
+        # Ignore answers for a dataset that is no longer shown
+        if not self.current_summary or self.current_summary.get('id') != dataset_id:
+            return
+        # Summaries uploaded without rows have no series: clear the chart
+        series = response.json()['series'] if response.status_code == 200 else {}
+        self.series_chart.update_series(series)
     
     def load_history(self):
-        self.history_list.clear()
+        headers = {'If-None-Match': self.history_etag} if self.history_etag else {}
+        network.start(network.get, f'{API_BASE}/history/', None, headers,
+                      on_done=self.on_history)
+    
+    def on_history(self, response):
         try:
-            response = requests.get(f'{API_BASE}/history/')
-            if response.status_code == 200:
-                for item in response.json():
-                    timestamp = item.get('uploaded_at', '')[:19].replace('T', ' ')
-                    text = f"#{item['id']} - {timestamp}\n{item.get('total_count', 0)} records"
-                    list_item = self.history_list.addItem(text)
-                    self.history_list.item(self.history_list.count() - 1).setData(Qt.UserRole, item)
+            if response.status_code != 200:
+                return  # 304: the list already shows the latest history
+            self.history_etag = response.headers.get('ETag')
+            self.history_list.clear()
+            for item in response.json():
+                timestamp = item.get('uploaded_at', '')[:19].replace('T', ' ')
+                text = f"#{item['id']} - {timestamp}\n{item.get('total_count', 0)} records"
+                list_item = self.history_list.addItem(text)
+                self.history_list.item(self.history_list.count() - 1).setData(Qt.UserRole, item)
         except:
             pass
     
@@ -275,17 +534,25 @@ class MainWindow(QMainWindow):
             return
         
         dataset_id = self.current_summary.get('id')
-        try:
-            response = requests.get(f'{API_BASE}/report/{dataset_id}/', stream=True)
-            if response.status_code == 200:
-                file_path, _ = QFileDialog.getSaveFileName(
-                    self, 'Save PDF', f'report_{dataset_id}.pdf', 'PDF Files (*.pdf)')
-                if file_path:
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                    QMessageBox.information(self, 'Success', 'Report saved!')
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', str(e))
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, 'Save PDF', f'report_{dataset_id}.pdf', 'PDF Files (*.pdf)')
+        if not file_path:
+            return
+        # Streamed to disk in chunks, so large reports are never held in memory
+        self.start_transfer('Downloading report...', network.download_file,
+                            f'{API_BASE}/report/{dataset_id}/', file_path,
+                            on_done=self.on_report_saved)
+    
+    def on_report_saved(self, file_path):
+        self.end_transfer()
+        self.status.setText('✅ Report saved')
+        QMessageBox.information(self, 'Success', 'Report saved!')
+    
+    def closeEvent(self, event):
+        # Stop a running transfer instead of waiting for it
+        if self.transfer:
+            self.transfer.cancel()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':
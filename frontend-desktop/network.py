@@ -0,0 +1,267 @@
+"""
+Networking for the desktop app, off the GUI thread.
+
+- All requests share one requests.Session, so connections are kept
+  alive and pooled
+- Every request runs as a Task on Qt's global thread pool; its result,
+  error and progress are delivered to the GUI thread through signals
+- Uploads stream the file from disk and downloads stream to disk, so
+  memory use does not grow with the file size
+- Uploads and downloads can be cancelled while they run
+- Large files can be uploaded in resumable chunks (upload_resumable):
+  failed chunks are retried, and only missing chunks are sent again
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+POOL_SIZE = 8                 # pooled connections per host
+CONNECT_TIMEOUT = 10          # seconds to connect to the server
+READ_TIMEOUT = 60             # seconds to wait for a response (not for transfers)
+CHUNK_SIZE = 1024 * 1024      # bytes per chunk written when downloading
+PROGRESS_INTERVAL = 0.1       # seconds between progress signals
+CHUNK_RETRIES = 5             # attempts per resumable upload chunk
+RETRY_DELAY = 2               # seconds before the first retry, doubled after each
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+
+
+class Cancelled(Exception):
+    """Raised inside a task that has been cancelled."""
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)          # the task's return value
+    failed = pyqtSignal(str)               # error message
+    cancelled = pyqtSignal()
+    progress = pyqtSignal(object, object)  # bytes done, bytes total (None if unknown)
+
+
+class Task(QRunnable):
+    """Runs fn(task, *args) on a pool thread and reports back through signals."""
+
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = TaskSignals()
+        self.is_cancelled = False
+        self.last_progress = 0
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def report(self, done, total):
+        """Emit progress (at most every PROGRESS_INTERVAL); raises Cancelled if cancelled."""
+        if self.is_cancelled:
+            raise Cancelled()
+        now = time.monotonic()
+        if now - self.last_progress >= PROGRESS_INTERVAL or done == total:
+            self.last_progress = now
+            self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.fn(self, *self.args)
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e) or type(e).__name__)
+        else:
+            # Cancelled too late to stop the request: drop its result
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+
+
+def start(fn, *args, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+    """Run fn(task, *args) in the background; the callbacks run on the GUI thread."""
+    task = Task(fn, *args)
+    for signal, slot in [(task.signals.finished, on_done), (task.signals.failed, on_error),
+                         (task.signals.progress, on_progress), (task.signals.cancelled, on_cancel)]:
+        if slot is not None:
+            signal.connect(slot)
+    QThreadPool.globalInstance().start(task)
+    return task
+
+
+class MultipartFile:
+    """
+    multipart/form-data body with some form fields and one file, read
+    from disk while it is sent. Has a length, so it is not sent chunked.
+    """
+
+    def __init__(self, path, field, fields, on_progress):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        file_name = os.path.basename(path).replace('"', '%22')
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        )
+        self.head = head.encode()
+        self.tail = f'\r\n--{boundary}--\r\n'.encode()
+        self.file = open(path, 'rb')
+        self.file_size = os.fstat(self.file.fileno()).st_size
+        self.length = len(self.head) + self.file_size + len(self.tail)
+        self.position = 0
+        self.on_progress = on_progress
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        head_size = len(self.head)
+        file_end = head_size + self.file_size
+        if self.position < head_size:
+            chunk = self.head[self.position:self.position + size]
+        elif self.position < file_end:
+            chunk = self.file.read(min(size, file_end - self.position))
+        else:
+            offset = self.position - file_end
+            chunk = self.tail[offset:offset + size]
+        self.position += len(chunk)
+        self.on_progress(self.position, self.length)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+def get(task, url, params=None, headers=None):
+    """GET a (small) response; returns the requests.Response."""
+    return session.get(url, params=params, headers=headers,
+                       timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+
+
+def upload_file(task, url, path, fields, field='file'):
+    """POST a file as multipart/form-data, streamed from disk with progress."""
+    body = MultipartFile(path, field, fields, task.report)
+    try:
+        # No read timeout: the server answers only after the whole body is sent
+        return session.post(url, data=body, headers={'Content-Type': body.content_type},
+                            timeout=(CONNECT_TIMEOUT, None))
+    finally:
+        body.close()
+
+
+def upload_summary(task, url, summary, payload_path=None):
+    """POST a locally computed summary, with the rows' .npz payload if given."""
+    if payload_path is None:
+        return session.post(url, json={'summary': summary}, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    return upload_file(task, url, payload_path, {'summary': json.dumps(summary)}, field='payload')
+
+
+def error_message(response, default):
+    try:
+        return response.json().get('error') or default
+    except ValueError:
+        return default
+
+
+def send_chunk(task, url, data):
+    """PUT one chunk of a resumable upload, retrying on network and server errors."""
+    headers = {'Content-Type': 'application/octet-stream',
+               'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()}
+    for attempt in range(CHUNK_RETRIES):
+        try:
+            response = session.put(url, data=data, headers=headers,
+                                    timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except requests.RequestException:
+            if attempt == CHUNK_RETRIES - 1:
+                raise
+        else:
+            if response.status_code in (200, 201):
+                return
+            if response.status_code == 409:
+                # The server stopped processing this upload (e.g. bad columns)
+                job = response.json().get('job') or {}
+                raise Exception(job.get('error') or error_message(response, 'Upload failed'))
+            if response.status_code < 500 or attempt == CHUNK_RETRIES - 1:
+                raise Exception(error_message(response, f'Upload failed (HTTP {response.status_code})'))
+        # Wait before retrying, still reacting to cancel
+        deadline = time.monotonic() + RETRY_DELAY * 2 ** attempt
+        while time.monotonic() < deadline:
+            if task.is_cancelled:
+                raise Cancelled()
+            time.sleep(0.1)
+
+
+def upload_resumable(task, url, path):
+    """
+    Upload a file in chunks through the server's resumable upload API
+    (url is .../api/uploads/). Each chunk is retried on failure; then the
+    server is asked which chunks are missing and only those are sent
+    again. Returns the response of complete/ (202 with the job).
+    """
+    size = os.path.getsize(path)
+    response = session.post(url, json={'file_name': os.path.basename(path), 'file_size': size},
+                            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    if response.status_code != 201:
+        return response
+    upload = response.json()
+    upload_url = f"{url}{upload['id']}/"
+    chunk_size = upload['chunk_size']
+    missing = upload['missing']
+
+    with open(path, 'rb') as f:
+        for _ in range(CHUNK_RETRIES):
+            done = (upload['chunk_count'] - len(missing)) * chunk_size
+            for index in missing:
+                f.seek(index * chunk_size)
+                data = f.read(chunk_size)
+                send_chunk(task, f'{upload_url}chunks/{index}/', data)
+                done += len(data)
+                task.report(min(done, size), size)
+            response = session.get(upload_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code != 200:
+                return response
+            missing = response.json()['missing']
+            if not missing:
+                break
+    return session.post(f'{upload_url}complete/', timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+
+
+def download_file(task, url, path):
+    """
+    Stream a response to path, chunk by chunk, with progress. The data is
+    written to path + '.part' and renamed when complete.
+    """
+    with session.get(url, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+        if response.status_code != 200:
+            raise Exception(error_message(response, f'Download failed (HTTP {response.status_code})'))
+
+        total = int(response.headers.get('Content-Length', 0)) or None
+        part_path = path + '.part'
+        done = 0
+        try:
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    task.report(done, total)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    return path
@@ -0,0 +1,236 @@
+"""
+Local pre-aggregation for the desktop app.
+
+A large CSV can be summarized on this computer instead of uploaded: it
+is parsed in chunks with pandas (memory stays flat) and only the summary
+is sent to POST /api/upload/summary/. Optionally the rows are written
+to a compressed .npz payload in the server's columnar layout; the
+server then stores them and checks the summary against them.
+
+Parsing runs in a separate process (see run_in_process), so it does not
+compete with the GUI for the interpreter.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+CHUNK_SIZE = 100_000
+MAX_REPORTED_LINES = 20
+
+# Payload arrays and their dtypes (see the server's preaggregated.py)
+PAYLOAD_DTYPES = {
+    'Flowrate': '<f8',
+    'Pressure': '<f8',
+    'Temperature': '<f8',
+    'type_codes': '<i4',
+    'name_offsets': '<i8',
+    'name_data': 'u1',
+}
+
+
+class Moments:
+    """Count, mean, M2 (sum of squared deviations), min and max of a column."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        count = len(values)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        # Chan et al. parallel variance update
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+    def to_dict(self):
+        if not self.count:
+            return {'count': 0, 'mean': None, 'm2': None, 'min': None, 'max': None}
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.minimum, 'max': self.maximum}
+
+
+class PayloadWriter:
+    """Writes the rows to raw array files, then packs them into an .npz."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(path) or '.')
+        self.files = {name: open(os.path.join(self.tmp_dir, name), 'wb') for name in PAYLOAD_DTYPES}
+        self.counts = Counter()
+        self.name_offset = 0
+        self.write('name_offsets', np.zeros(1))
+
+    def write(self, name, values):
+        values = np.asarray(values).astype(PAYLOAD_DTYPES[name])
+        self.files[name].write(values.tobytes())
+        self.counts[name] += len(values)
+
+    def append(self, chunk, codes):
+        for col in NUMERIC_COLUMNS:
+            self.write(col, chunk[col].to_numpy())
+        self.write('type_codes', codes)
+        encoded = [name.encode('utf-8') for name in chunk['Equipment Name'].fillna('').astype(str)]
+        ends = self.name_offset + np.cumsum([len(name) for name in encoded], dtype=np.int64)
+        self.write('name_offsets', ends)
+        self.write('name_data', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        if len(ends):
+            self.name_offset = int(ends[-1])
+
+    def close(self, type_values):
+        for f in self.files.values():
+            f.close()
+        # Arrays are streamed into the archive; none is loaded whole
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            for name, dtype in PAYLOAD_DTYPES.items():
+                header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                          'fortran_order': False, 'shape': (self.counts[name],)}
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_2_0(member, header)
+                    with open(os.path.join(self.tmp_dir, name), 'rb') as f:
+                        shutil.copyfileobj(f, member)
+            with archive.open('type_values.npy', 'w') as member:
+                np.lib.format.write_array(member, np.array(type_values, dtype=str))
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def summarize_csv(path, payload_path=None, progress=None):
+    """
+    Summarize a CSV file like the server does; write the rows to
+    payload_path if given. progress(bytes read, file size) is called
+    after every chunk.
+
+    Returns the summary dict for /api/upload/summary/.
+    """
+    columns = pd.read_csv(path, nrows=0).columns
+    missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing:
+        raise ValueError(f'Missing columns: {missing}')
+
+    total_count = 0
+    type_counts = Counter()
+    type_index = {}
+    moments = {col: Moments() for col in NUMERIC_COLUMNS}
+    writer = PayloadWriter(payload_path) if payload_path else None
+    size = os.path.getsize(path)
+
+    try:
+        with open(path, 'rb') as f:
+            for chunk in pd.read_csv(f, usecols=REQUIRED_COLUMNS, chunksize=CHUNK_SIZE,
+                                     dtype={'Equipment Name': str, 'Type': str}):
+                # Values that are not numbers are rejected, like on the server
+                bad_lines = []
+                for col in NUMERIC_COLUMNS:
+                    values = pd.to_numeric(chunk[col], errors='coerce')
+                    bad = values.isna() & chunk[col].notna()
+                    bad_lines.extend(total_count + 2 + np.flatnonzero(bad.to_numpy()))
+                    chunk[col] = values.astype('float64')
+                if bad_lines:
+                    lines = sorted(set(int(line) for line in bad_lines))[:MAX_REPORTED_LINES]
+                    raise ValueError(f'Invalid numeric values on lines {lines}')
+
+                # Type codes in first-appearance order (-1 = missing)
+                types = chunk['Type']
+                for value in pd.unique(types.dropna()):
+                    type_index.setdefault(value, len(type_index))
+                codes = types.map(type_index).fillna(-1).to_numpy(dtype=np.int64)
+                counts = np.bincount(codes[codes >= 0], minlength=len(type_index))
+                for value, code in type_index.items():
+                    if counts[code]:
+                        type_counts[value] += int(counts[code])
+
+                for col in NUMERIC_COLUMNS:
+                    moments[col].update(chunk[col].to_numpy())
+                if writer is not None:
+                    writer.append(chunk, codes)
+                total_count += len(chunk)
+                if progress is not None:
+                    progress(f.tell(), size)
+        if writer is not None:
+            writer.close(list(type_index))
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    return {
+        'total_count': total_count,
+        'type_distribution': dict(type_counts.most_common()),
+        'columns': {col: m.to_dict() for col, m in moments.items()},
+    }
+
+
+def _summarize_worker(path, payload_path, messages):
+    try:
+        summary = summarize_csv(path, payload_path,
+                                progress=lambda done, total: messages.put(('progress', done, total)))
+        messages.put(('done', summary))
+    except Exception as e:
+        messages.put(('error', str(e) or type(e).__name__))
+
+
+def run_in_process(path, payload_path=None, progress=None):
+    """
+    Run summarize_csv in a child process and wait for it. Call from a
+    worker thread, not the GUI thread. If progress raises (e.g. to
+    cancel), the child process is stopped.
+    """
+    context = multiprocessing.get_context('spawn')
+    messages = context.Queue()
+    process = context.Process(target=_summarize_worker, args=(path, payload_path, messages),
+                              daemon=True)
+    process.start()
+    try:
+        while True:
+            try:
+                message = messages.get(timeout=0.5)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError('Local summary process stopped unexpectedly.')
+                continue
+            if message[0] == 'progress':
+                if progress is not None:
+                    progress(message[1], message[2])
+            elif message[0] == 'error':
+                raise ValueError(message[1])
+            else:
+                return message[1]
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+if __name__ == '__main__':
+    # Usage: python preaggregate.py data.csv [payload.npz]
+    import sys
+    print(json.dumps(summarize_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None), indent=2))
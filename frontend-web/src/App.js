@@ -4,19 +4,32 @@
  * This is the root component that brings together all features:
  * - File upload
  * - Summary display
- * - Chart visualization
+ * - Chart visualization (type distribution and values by row)
  * - History list
  */
 import React, { useState, useEffect } from "react";
 import FileUpload from "./components/FileUpload";
 import Summary from "./components/Summary";
 import TypeChart from "./components/TypeChart";
+import SeriesChart from "./components/SeriesChart";
 import History from "./components/History";
+import {
+  RESUMABLE_MIN_BYTES,
+  canUploadResumable,
+  uploadResumable,
+} from "./resumableUpload";
 
 // API base URL - Django backend
 // Uses environment variable on Vercel, localhost for local development
 const API_BASE = process.env.REACT_APP_API_URL || "http://127.0.0.1:8000/api";
 
+// How often to poll an async upload job (ms)
+const JOB_POLL_INTERVAL = 1000;
+
+// Files at least this large are processed as async upload jobs;
+// smaller ones are summarized in the upload request
+const ASYNC_MIN_BYTES = 8 * 1024 * 1024;
+
 function App() {
   // State for current summary (after upload)
   const [summary, setSummary] = useState(null);
@@ -28,6 +41,9 @@ function App() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
+  // Progress of the current upload job (0 to 1), null when idle
+  const [progress, setProgress] = useState(null);
+
   /**
    * Fetch history on component mount
    */
@@ -49,31 +65,73 @@ function App() {
   };
 
   /**
-   * Handle file upload
-   * Called by FileUpload component when user selects a file
+   * Poll an async upload job until it finishes
+   * Resolves with the dataset summary, rejects with the job error
    */
-  const handleUpload = async (file) => {
-    setLoading(true);
-    setError(null);
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`${API_BASE}/jobs/${jobId}/`);
+      const job = await response.json();
+
+      if (!response.ok) {
+        throw new Error(job.error || "Upload failed");
+      }
+      if (job.status === "done") {
+        return job.summary;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Upload failed");
+      }
 
+      setProgress(job.progress);
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+  };
+
+  /**
+   * Upload a file in one multipart request
+   * Resolves with its summary (polling the upload job of large files)
+   */
+  const uploadWhole = async (file) => {
     // Create form data for multipart upload
     const formData = new FormData();
     formData.append("file", file);
+    if (file.size >= ASYNC_MIN_BYTES) {
+      formData.append("async", "true");
+    }
 
-    try {
-      const response = await fetch(`${API_BASE}/upload/`, {
-        method: "POST",
-        body: formData,
-      });
+    const response = await fetch(`${API_BASE}/upload/`, {
+      method: "POST",
+      body: formData,
+    });
 
-      const data = await response.json();
+    const data = await response.json();
 
-      if (!response.ok) {
-        throw new Error(data.error || "Upload failed");
-      }
+    if (!response.ok) {
+      throw new Error(data.error || "Upload failed");
+    }
+    return response.status === 202 ? waitForJob(data.id) : data;
+  };
+
+  /**
+   * Handle file upload
+   * Called by FileUpload component when user selects a file
+   * Large files are sent in resumable chunks (see resumableUpload.js)
+   * and processed in the background; we poll their job for the result
+   */
+  const handleUpload = async (file) => {
+    setLoading(true);
+    setError(null);
+    setProgress(0);
+
+    try {
+      const uploadedSummary =
+        file.size >= RESUMABLE_MIN_BYTES && canUploadResumable()
+          ? await waitForJob(await uploadResumable(API_BASE, file, setProgress))
+          : await uploadWhole(file);
 
       // Update current summary
-      setSummary(data);
+      setSummary(uploadedSummary);
 
       // Refresh history
       fetchHistory();
@@ -81,6 +139,7 @@ function App() {
       setError(err.message);
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -108,7 +167,7 @@ function App() {
       <main className="app-main">
         {/* Left Panel: Upload and History */}
         <aside className="sidebar">
-          <FileUpload onUpload={handleUpload} loading={loading} />
+          <FileUpload onUpload={handleUpload} loading={loading} progress={progress} />
 
           {error && <div className="error-message">{error}</div>}
 
@@ -125,6 +184,7 @@ function App() {
             <>
               <Summary data={summary} />
               <TypeChart distribution={summary.type_distribution} />
+              <SeriesChart apiBase={API_BASE} datasetId={summary.id} />
             </>
           ) : (
             <div className="placeholder">
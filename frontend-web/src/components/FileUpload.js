@@ -4,10 +4,19 @@
  * Handles CSV file selection via:
  * - Click to browse
  * - Drag and drop
+ *
+ * Shows processing progress while an upload job is running.
+ * Compressed CSV files (.csv.gz, .csv.bz2, .csv.zst) are accepted too;
+ * the server decompresses them.
  */
 import React, { useState, useRef } from "react";
 
-function FileUpload({ onUpload, loading }) {
+const CSV_SUFFIXES = [".csv", ".csv.gz", ".csv.bz2", ".csv.zst"];
+
+const isCsvFile = (file) =>
+  CSV_SUFFIXES.some((suffix) => file.name.toLowerCase().endsWith(suffix));
+
+function FileUpload({ onUpload, loading, progress }) {
   const [dragging, setDragging] = useState(false);
   const fileInputRef = useRef(null);
 
@@ -39,7 +48,7 @@ function FileUpload({ onUpload, loading }) {
     setDragging(false);
 
     const file = e.dataTransfer.files[0];
-    if (file && file.name.endsWith(".csv")) {
+    if (file && isCsvFile(file)) {
       onUpload(file);
     }
   };
@@ -64,12 +73,16 @@ function FileUpload({ onUpload, loading }) {
       <input
         type="file"
         ref={fileInputRef}
-        accept=".csv"
+        accept={CSV_SUFFIXES.join(",")}
         onChange={handleFileSelect}
       />
       <p>Drop your CSV file here, or</p>
       <button className="browse-btn" disabled={loading}>
-        {loading ? "Uploading..." : "Choose File"}
+        {loading
+          ? progress
+            ? `Processing ${Math.round(progress * 100)}%`
+            : "Uploading..."
+          : "Choose File"}
       </button>
     </div>
   );
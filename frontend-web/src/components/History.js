@@ -1,7 +1,7 @@
 /**
  * History Component
  *
- * Displays list of last 5 uploaded datasets
+ * Displays the recent uploaded datasets returned by /api/history/
  * Each item shows timestamp, total count, and download button
  */
 import React from "react";
@@ -0,0 +1,117 @@
+/**
+ * SeriesChart Component
+ *
+ * Line chart of a numeric column (Flowrate, Pressure or Temperature)
+ * across the rows of a dataset. The backend downsamples the column to
+ * a fixed number of points, so million-row datasets stay fast to draw.
+ */
+import React, { useState, useEffect } from "react";
+import {
+  Chart as ChartJS,
+  LinearScale,
+  PointElement,
+  LineElement,
+  Tooltip,
+} from "chart.js";
+import { Line } from "react-chartjs-2";
+
+// Register Chart.js components
+ChartJS.register(LinearScale, PointElement, LineElement, Tooltip);
+
+const COLUMNS = ["Flowrate", "Pressure", "Temperature"];
+
+// Points requested from the backend (per column)
+const POINT_BUDGET = 1500;
+
+function SeriesChart({ apiBase, datasetId }) {
+  const [column, setColumn] = useState(COLUMNS[0]);
+  const [series, setSeries] = useState(null);
+  const [error, setError] = useState(null);
+
+  /**
+   * Fetch the downsampled column whenever the dataset or column changes
+   */
+  useEffect(() => {
+    if (!datasetId) {
+      return;
+    }
+    let cancelled = false;
+    setError(null);
+
+    const params = new URLSearchParams({ column, points: POINT_BUDGET });
+    fetch(`${apiBase}/datasets/${datasetId}/series/?${params}`)
+      .then(async (response) => {
+        const data = await response.json();
+        if (!response.ok) {
+          throw new Error(data.error || "Failed to load series");
+        }
+        if (!cancelled) {
+          setSeries(data.series[column]);
+        }
+      })
+      .catch((err) => {
+        if (!cancelled) {
+          setSeries(null);
+          setError(err.message);
+        }
+      });
+
+    return () => {
+      cancelled = true;
+    };
+  }, [apiBase, datasetId, column]);
+
+  const data = {
+    datasets: [
+      {
+        label: column,
+        data: series ? series.x.map((x, i) => ({ x, y: series.y[i] })) : [],
+        borderColor: "rgba(102, 126, 234, 1)",
+        borderWidth: 1,
+        pointRadius: 0,
+      },
+    ],
+  };
+
+  const options = {
+    responsive: true,
+    maintainAspectRatio: false,
+    animation: false,
+    parsing: false,
+    plugins: {
+      legend: {
+        display: false,
+      },
+    },
+    scales: {
+      x: {
+        type: "linear",
+        title: { display: true, text: "Row" },
+      },
+      y: {
+        title: { display: true, text: column },
+      },
+    },
+  };
+
+  return (
+    <div className="card">
+      <h2>
+        Values by Row{" "}
+        <select value={column} onChange={(e) => setColumn(e.target.value)}>
+          {COLUMNS.map((col) => (
+            <option key={col} value={col}>
+              {col}
+            </option>
+          ))}
+        </select>
+      </h2>
+      {error && <div className="error-message">{error}</div>}
+      <div className="chart-container">
+        <Line data={data} options={options} />
+      </div>
+    </div>
+  );
+}
+
+export default SeriesChart;
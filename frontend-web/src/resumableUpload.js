@@ -0,0 +1,120 @@
+/**
+ * Resumable uploads of large CSV files
+ *
+ * The file is sent in chunks through the backend's /api/uploads/ API:
+ * - Each chunk is sent with its SHA-256 and retried if it fails
+ * - Afterwards the backend is asked which chunks are missing, and only
+ *   those are sent again
+ * - The backend parses the chunks as they arrive
+ */
+
+// Files at least this large are uploaded in chunks
+export const RESUMABLE_MIN_BYTES = 64 * 1024 * 1024;
+
+// Attempts per chunk, and the delay before the first retry (doubled after each)
+const CHUNK_RETRIES = 5;
+const RETRY_DELAY = 2000;
+
+/**
+ * Chunk checksums need Web Crypto, which browsers only offer on HTTPS
+ * pages (and localhost)
+ */
+export const canUploadResumable = () =>
+  Boolean(window.crypto && window.crypto.subtle);
+
+const sha256 = async (buffer) => {
+  const digest = await window.crypto.subtle.digest("SHA-256", buffer);
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+};
+
+const errorOf = async (response, fallback) => {
+  try {
+    const data = await response.json();
+    return (data.job && data.job.error) || data.error || fallback;
+  } catch (err) {
+    return fallback;
+  }
+};
+
+/**
+ * PUT one chunk, retrying on network and server errors
+ */
+const sendChunk = async (url, buffer) => {
+  const checksum = await sha256(buffer);
+  for (let attempt = 0; attempt < CHUNK_RETRIES; attempt++) {
+    let response = null;
+    try {
+      response = await fetch(url, {
+        method: "PUT",
+        headers: {
+          "Content-Type": "application/octet-stream",
+          "X-Chunk-SHA256": checksum,
+        },
+        body: buffer,
+      });
+    } catch (err) {
+      if (attempt === CHUNK_RETRIES - 1) {
+        throw err;
+      }
+    }
+    if (response) {
+      if (response.ok) {
+        return;
+      }
+      // 4xx: the chunk or the upload was rejected, retrying will not help
+      if (response.status < 500 || attempt === CHUNK_RETRIES - 1) {
+        throw new Error(await errorOf(response, "Upload failed"));
+      }
+    }
+    await new Promise((resolve) =>
+      setTimeout(resolve, RETRY_DELAY * 2 ** attempt)
+    );
+  }
+};
+
+/**
+ * Upload a file in resumable chunks
+ * Calls onProgress with the fraction sent; resolves with the upload's
+ * job id, to poll at /api/jobs/<id>/
+ */
+export async function uploadResumable(apiBase, file, onProgress) {
+  let response = await fetch(`${apiBase}/uploads/`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ file_name: file.name, file_size: file.size }),
+  });
+  if (!response.ok) {
+    throw new Error(await errorOf(response, "Upload failed"));
+  }
+  const upload = await response.json();
+  const uploadUrl = `${apiBase}/uploads/${upload.id}/`;
+  let missing = upload.missing;
+
+  for (let pass = 0; pass < CHUNK_RETRIES && missing.length; pass++) {
+    let sent = upload.chunk_count - missing.length;
+    for (const index of missing) {
+      const start = index * upload.chunk_size;
+      const buffer = await file
+        .slice(start, start + upload.chunk_size)
+        .arrayBuffer();
+      await sendChunk(`${uploadUrl}chunks/${index}/`, buffer);
+      sent += 1;
+      onProgress(sent / upload.chunk_count);
+    }
+
+    response = await fetch(uploadUrl);
+    if (!response.ok) {
+      throw new Error(await errorOf(response, "Upload failed"));
+    }
+    missing = (await response.json()).missing;
+  }
+
+  response = await fetch(`${uploadUrl}complete/`, { method: "POST" });
+  const data = await response.json();
+  if (!response.ok) {
+    throw new Error(data.error || "Upload failed");
+  }
+  return data.id;
+}